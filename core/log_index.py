@@ -0,0 +1,126 @@
+# app/core/log_index.py
+"""
+日志文件的稀疏行偏移索引：每 STRIDE 行记一个字节偏移，文件增长时只扫描新增部分。
+分页读取时 seek 到最近的索引点，只读需要的行，不再整文件 readlines()。
+索引按路径缓存在进程内；文件被截断或轮转（inode 变化）时重建。
+"""
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+STRIDE = 1000
+_CHUNK = 1024 * 1024
+
+
+class LineIndex:
+    def __init__(self, path: str, stride: int = STRIDE):
+        self.path = path
+        self.stride = max(1, int(stride))
+        self._lock = threading.Lock()
+        self._reset(None)
+
+    def _reset(self, inode: Optional[int]):
+        self.inode = inode
+        self.offsets: List[int] = [0]  # offsets[k] = 第 k*stride 行的起始字节
+        self.lines = 0  # 已索引的完整行数
+        self.indexed_upto = 0  # 最后一个完整行之后的字节偏移
+        self.size = 0
+
+    def refresh(self) -> Tuple[int, int]:
+        """跟上文件当前内容，返回 (总行数, 文件大小)；末尾不完整的行也算一行（与 readlines 一致）。"""
+        with self._lock:
+            st = os.stat(self.path)
+            if st.st_ino != self.inode or st.st_size < self.indexed_upto:
+                self._reset(st.st_ino)
+            if st.st_size > self.indexed_upto:
+                self._scan(st.st_size)
+            self.size = st.st_size
+            partial = 1 if self.size > self.indexed_upto else 0
+            return self.lines + partial, self.size
+
+    def _scan(self, size: int):
+        pos = self.indexed_upto
+        with open(self.path, "rb") as f:
+            f.seek(pos)
+            while pos < size:
+                chunk = f.read(min(_CHUNK, size - pos))
+                if not chunk:
+                    break
+                n = chunk.count(b"\n")
+                next_mark = len(self.offsets) * self.stride
+                if self.lines + n < next_mark:
+                    # 本块内不跨索引点：只计数
+                    self.lines += n
+                else:
+                    i = 0
+                    while True:
+                        j = chunk.find(b"\n", i)
+                        if j < 0:
+                            break
+                        self.lines += 1
+                        if self.lines % self.stride == 0:
+                            self.offsets.append(pos + j + 1)
+                        i = j + 1
+                last_nl = chunk.rfind(b"\n")
+                if last_nl >= 0:
+                    self.indexed_upto = pos + last_nl + 1
+                pos += len(chunk)
+
+    def read_lines(self, start: int, count: int) -> List[str]:
+        """读取第 [start, start+count) 行（0 起），保留行尾换行符。"""
+        if count <= 0 or start < 0:
+            return []
+        with self._lock:
+            k = min(start // self.stride, len(self.offsets) - 1)
+            offset = self.offsets[k]
+            skip = start - k * self.stride
+        out: List[str] = []
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            for _ in range(skip):
+                if not f.readline():
+                    return out
+            for _ in range(count):
+                line = f.readline()
+                if not line:
+                    break
+                out.append(line.decode("utf-8", errors="replace"))
+        return out
+
+
+_indexes: Dict[str, LineIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_line_index(path: str) -> LineIndex:
+    key = os.path.abspath(path)
+    with _indexes_lock:
+        idx = _indexes.get(key)
+        if idx is None:
+            idx = LineIndex(key)
+            _indexes[key] = idx
+        return idx
+
+
+def read_page(path: str, page: int, page_size: int, reverse: bool = False) -> Dict:
+    """
+    分页读取日志。page 从 1 开始，-1 表示最后一页；reverse 时按从新到旧的顺序分页。
+    返回 {"lines", "total", "page", "page_size"}。
+    """
+    idx = get_line_index(path)
+    total, _ = idx.refresh()
+    page_size = max(1, int(page_size))
+    last_page = max(1, -(-total // page_size))
+    page = last_page if page == -1 else max(1, int(page))
+
+    start = (page - 1) * page_size
+    end = min(total, start + page_size)
+    if start >= total:
+        return {"lines": [], "total": total, "page": page, "page_size": page_size}
+
+    if reverse:
+        lines = idx.read_lines(total - end, end - start)
+        lines.reverse()
+    else:
+        lines = idx.read_lines(start, end - start)
+    return {"lines": lines, "total": total, "page": page, "page_size": page_size}
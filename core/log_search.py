@@ -0,0 +1,352 @@
+# app/core/log_search.py
+"""
+logs/ 目录的全局搜索：
+- 按文件并行扫描（进程池，forkserver），mmap + 字节级不区分大小写正则（非 ASCII 字母展开大小写分支），不逐行 decode/lower
+- 每个文件按 ~4MB 段（按换行对齐）维护增量 trigram bitset 索引 + 段内首尾时间戳、行数；
+  关键字的 trigram 不全在段里 / 时间不相交的段直接跳过
+- 时间范围过滤（since/until 为 "YYYY-MM-DD[ HH:MM:SS]" 前缀）
+- iter_search 按文件顺序逐个产出结果，供 NDJSON 流式返回
+
+索引只保存在当前进程内存里；文件被截断/轮转（inode 变化）时重建。
+Env：LOG_SEARCH_WORKERS（默认 min(4, CPU)），LOG_SEARCH_INLINE_BYTES（小于该扫描量不走进程池，默认 8MB）
+"""
+import mmap
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+SEGMENT_BYTES = 4 * 1024 * 1024
+_BITS = 1 << 16
+_LOWER = bytes.maketrans(bytes(range(65, 91)), bytes(range(97, 123)))
+_CONTENT_MAX = 300
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+# -------------------------
+# trigram bitsets
+# -------------------------
+def _trigram_hashes(data: bytes, ascii_only: bool = False) -> np.ndarray:
+    a = np.frombuffer(data.translate(_LOWER), dtype=np.uint8)
+    if a.size < 3:
+        return np.empty(0, dtype=np.uint64)
+    x = (a[:-2].astype(np.uint64) << 16) | (a[1:-1].astype(np.uint64) << 8) | a[2:].astype(np.uint64)
+    if ascii_only:
+        # 关键字含非 ASCII 的大小写字母：含非 ASCII 字节的 trigram 在其他大小写形式下不同，不能用于剪枝
+        x = x[(a[:-2] < 128) & (a[1:-1] < 128) & (a[2:] < 128)]
+    return ((x * np.uint64(2654435761)) >> np.uint64(16)) & np.uint64(_BITS - 1)
+
+
+def _has_non_ascii_case(keyword: str) -> bool:
+    return any(not c.isascii() and c.lower() != c.upper() for c in keyword)
+
+
+def _keyword_pattern(keyword: str):
+    """
+    不区分大小写的字节正则。re.IGNORECASE 对 bytes 只折叠 ASCII；非 ASCII 的大小写字母展开为
+    各大小写形式的 UTF-8 分支（Ä → (?:Ä|ä)），与按 str.lower() 比较的结果一致。
+    """
+    parts = []
+    for ch in keyword:
+        variants = {ch}
+        if not ch.isascii():
+            variants |= {v for v in (ch.lower(), ch.upper(), ch.title()) if len(v) == 1 and v.lower() == ch.lower()}
+        if len(variants) == 1:
+            parts.append(re.escape(ch.encode("utf-8")))
+        else:
+            parts.append(b"(?:" + b"|".join(re.escape(v.encode("utf-8")) for v in sorted(variants)) + b")")
+    return re.compile(b"".join(parts), re.IGNORECASE)
+
+
+def _bitset(data: bytes) -> bytes:
+    bits = np.zeros(_BITS, dtype=bool)
+    bits[_trigram_hashes(data)] = True
+    return np.packbits(bits).tobytes()
+
+
+def _may_contain(bitset: bytes, hashes: np.ndarray) -> bool:
+    if hashes.size == 0:
+        return True
+    packed = np.frombuffer(bitset, dtype=np.uint8)
+    h = hashes.astype(np.int64)
+    return bool(np.all((packed[h >> 3] >> (7 - (h & 7))) & 1))
+
+
+def _line_ts(line: bytes) -> Optional[bytes]:
+    # [2026-01-23 10:00:00] ...
+    if len(line) >= 21 and line[:1] == b"[" and line[20:21] == b"]":
+        return line[1:20]
+    return None
+
+
+def _in_range(ts: Optional[bytes], since: Optional[bytes], until: Optional[bytes]) -> bool:
+    if since is None and until is None:
+        return True
+    if ts is None:
+        return False
+    if since is not None and ts[: len(since)] < since:
+        return False
+    if until is not None and ts[: len(until)] > until:
+        return False
+    return True
+
+
+# -------------------------
+# worker (runs in pool processes)
+# -------------------------
+def _build_segments(mm, start: int, end: int) -> List[dict]:
+    """把 [start, end) 切成按换行对齐的段（end 必须在行尾），计算 bitset/行数/首尾时间戳。"""
+    segs = []
+    pos = start
+    while pos < end:
+        stop = min(end, pos + SEGMENT_BYTES)
+        if stop < end:
+            nl = mm.rfind(b"\n", pos, stop)
+            stop = nl + 1 if nl >= pos else end
+        data = mm[pos:stop]
+        first_end = data.find(b"\n")
+        last_start = data.rfind(b"\n", 0, len(data) - 1) + 1
+        segs.append(
+            {
+                "start": pos,
+                "end": stop,
+                "lines": data.count(b"\n"),
+                "bits": _bitset(data),
+                "ts_first": _line_ts(data[: first_end if first_end >= 0 else len(data)]),
+                "ts_last": _line_ts(data[last_start:]),
+            }
+        )
+        pos = stop
+    return segs
+
+
+def _scan_range(mm, pattern, start: int, end: int, line_no: int, limit: int, since, until, out: List[dict], fname: str):
+    """扫描 [start, end)，line_no 是 start 所在行的行号（1 起）。"""
+    prev = start
+    skip_until = -1
+    for m in pattern.finditer(mm, start, end):
+        if m.start() < skip_until:
+            continue
+        ls = mm.rfind(b"\n", start, m.start()) + 1
+        if ls < start:
+            ls = start
+        le = mm.find(b"\n", m.end(), end)
+        if le < 0:
+            le = end
+        line_no += mm[prev:ls].count(b"\n")
+        prev = ls
+        skip_until = le
+        line = mm[ls:le]
+        if not _in_range(_line_ts(line), since, until):
+            continue
+        out.append(
+            {
+                "file": fname,
+                "line": line_no,
+                "content": line.strip().decode("utf-8", errors="ignore")[:_CONTENT_MAX],
+            }
+        )
+        if len(out) >= limit:
+            return
+
+
+def _search_file(job: dict) -> dict:
+    """
+    job: path/fname/keyword/since/until/limit、candidates=[(start, end, line_no)]（已索引且可能命中的段）、
+         tail_start/tail_line（未索引部分的起点和起始行号）
+    返回 matches + 新建的段（只包含满 SEGMENT_BYTES 的完整段，文件末尾的零头下次再索引）。
+    """
+    out: List[dict] = []
+    new_segs: List[dict] = []
+    pattern = _keyword_pattern(job["keyword"].decode("utf-8"))
+    since, until, limit = job.get("since"), job.get("until"), job["limit"]
+    size = os.path.getsize(job["path"])
+    if size == 0:
+        return {"matches": out, "segments": new_segs, "size": size}
+    with open(job["path"], "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for start, end, line_no in job["candidates"]:
+                if len(out) >= limit:
+                    break
+                _scan_range(mm, pattern, start, min(end, size), line_no, limit, since, until, out, job["fname"])
+
+            tail_start = job["tail_start"]
+            if tail_start < size:
+                last_nl = mm.rfind(b"\n", tail_start, size)
+                complete_end = last_nl + 1 if last_nl >= tail_start else tail_start
+                if complete_end - tail_start >= SEGMENT_BYTES:
+                    new_segs = _build_segments(mm, tail_start, complete_end)
+                    # 末尾的零头段留到文件再长一些时重新切
+                    while new_segs and new_segs[-1]["end"] - new_segs[-1]["start"] < SEGMENT_BYTES // 2:
+                        new_segs.pop()
+                if len(out) < limit:
+                    _scan_range(mm, pattern, tail_start, size, job["tail_line"], limit, since, until, out, job["fname"])
+        finally:
+            mm.close()
+    return {"matches": out, "segments": new_segs, "size": size}
+
+
+# -------------------------
+# per-file index (main process)
+# -------------------------
+class _FileIndex:
+    def __init__(self, inode: int):
+        self.inode = inode
+        self.segments: List[dict] = []
+
+    @property
+    def indexed_upto(self) -> int:
+        return self.segments[-1]["end"] if self.segments else 0
+
+    @property
+    def indexed_lines(self) -> int:
+        return sum(s["lines"] for s in self.segments)
+
+
+class LogSearcher:
+    def __init__(self, log_dir: str = "logs"):
+        self.log_dir = log_dir
+        self._indexes: Dict[str, _FileIndex] = {}
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            workers = max(1, _env_int("LOG_SEARCH_WORKERS", min(4, os.cpu_count() or 1)))
+            self._pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("forkserver"))
+        return self._pool
+
+    def _files(self) -> List[Tuple[str, os.stat_result]]:
+        out = []
+        for name in os.listdir(self.log_dir):
+            if not name.endswith(".log"):
+                continue
+            p = os.path.join(self.log_dir, name)
+            try:
+                st = os.stat(p)
+            except OSError:
+                continue
+            out.append((name, st))
+        # 最近写入的文件优先
+        out.sort(key=lambda x: x[1].st_mtime, reverse=True)
+        return out
+
+    def _job(self, name: str, st: os.stat_result, keyword: bytes, hashes, since, until, limit) -> dict:
+        path = os.path.join(self.log_dir, name)
+        with self._lock:
+            idx = self._indexes.get(path)
+            if idx is None or idx.inode != st.st_ino or st.st_size < idx.indexed_upto:
+                idx = _FileIndex(st.st_ino)
+                self._indexes[path] = idx
+            candidates = []
+            line_no = 1
+            for seg in idx.segments:
+                ok = _may_contain(seg["bits"], hashes)
+                if ok and since is not None and seg["ts_last"] is not None and seg["ts_last"][: len(since)] < since:
+                    ok = False
+                if ok and until is not None and seg["ts_first"] is not None and seg["ts_first"][: len(until)] > until:
+                    ok = False
+                if ok:
+                    candidates.append((seg["start"], seg["end"], line_no))
+                line_no += seg["lines"]
+            return {
+                "path": path,
+                "fname": name,
+                "keyword": keyword,
+                "since": since,
+                "until": until,
+                "limit": limit,
+                "candidates": candidates,
+                "tail_start": idx.indexed_upto,
+                "tail_line": line_no,
+                "_scan_bytes": sum(e - s for s, e, _ in candidates) + max(0, st.st_size - idx.indexed_upto),
+            }
+
+    def _absorb(self, path: str, inode: int, segments: List[dict]):
+        if not segments:
+            return
+        with self._lock:
+            idx = self._indexes.get(path)
+            if idx is None or idx.inode != inode or segments[0]["start"] != idx.indexed_upto:
+                return
+            idx.segments.extend(segments)
+
+    def iter_search(
+        self,
+        keyword: str,
+        max_matches: int = 100,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+    ) -> Iterator[dict]:
+        kw = keyword.encode("utf-8")
+        if not kw or not os.path.isdir(self.log_dir):
+            return
+        since_b = since.encode("ascii") if since else None
+        until_b = until.encode("ascii") if until else None
+        hashes = _trigram_hashes(kw, ascii_only=_has_non_ascii_case(keyword))
+        if hashes.size:
+            hashes = np.unique(hashes)
+
+        jobs = []
+        for name, st in self._files():
+            # 文件最后修改早于 since：不可能有范围内的行
+            if since_b is not None:
+                mts = _mtime_ts(st.st_mtime)
+                if mts[: len(since_b)] < since_b:
+                    continue
+            jobs.append((self._job(name, st, kw, hashes, since_b, until_b, max_matches), st.st_ino))
+        if not jobs:
+            return
+
+        total_bytes = sum(j["_scan_bytes"] for j, _ in jobs)
+        inline = total_bytes < _env_int("LOG_SEARCH_INLINE_BYTES", 8 * 1024 * 1024) or len(jobs) == 1
+        if inline:
+            results = (_search_file(j) for j, _ in jobs)
+        else:
+            pool = self._executor()
+            futures = [pool.submit(_search_file, j) for j, _ in jobs]
+            results = (f.result() for f in futures)
+
+        emitted = 0
+        try:
+            for (job, inode), res in zip(jobs, results):
+                self._absorb(job["path"], inode, res["segments"])
+                for m in res["matches"]:
+                    yield m
+                    emitted += 1
+                    if emitted >= max_matches:
+                        return
+        finally:
+            if not inline:
+                for f in futures:
+                    f.cancel()
+
+    def search(self, keyword: str, max_matches: int = 100, since: Optional[str] = None, until: Optional[str] = None) -> List[dict]:
+        return list(self.iter_search(keyword, max_matches=max_matches, since=since, until=until))
+
+
+def _mtime_ts(mtime: float) -> bytes:
+    from datetime import datetime
+
+    return datetime.fromtimestamp(mtime).strftime("%Y-%m-%d %H:%M:%S").encode("ascii")
+
+
+_searchers: Dict[str, LogSearcher] = {}
+
+
+def get_log_searcher(log_dir: str = "logs") -> LogSearcher:
+    s = _searchers.get(log_dir)
+    if s is None:
+        s = _searchers.setdefault(log_dir, LogSearcher(log_dir))
+    return s
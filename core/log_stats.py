@@ -0,0 +1,162 @@
+# app/core/log_stats.py
+"""
+日志统计的增量引擎：每个 logs/*.log 记录 (inode, offset)，每次只处理新增的完整行，
+按小时累计 error/warning/info，结果持久化到 state/log_stats.json。
+文件被截断或轮转（inode 变化）时该文件从头重算；文件消失时移除其计数。
+分类口径与原日志统计页一致：ERROR/CRITICAL/Exception → error，WARNING → warning，其余 info。
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+_CHUNK = 4 * 1024 * 1024
+KEEP_DAYS = 14
+_KINDS = ("error", "warning", "info")
+
+
+def classify(line: bytes) -> int:
+    if b"ERROR" in line or b"CRITICAL" in line or b"Exception" in line:
+        return 0
+    if b"WARNING" in line:
+        return 1
+    return 2
+
+
+class LogStatsEngine:
+    def __init__(self, log_dir: str = "logs", store_path: str = os.path.join("state", "log_stats.json")):
+        self.log_dir = log_dir
+        self.store_path = store_path
+        self._lock = threading.Lock()
+        self._files: Optional[Dict[str, dict]] = None
+
+    # -------------------------
+    # persistence
+    # -------------------------
+    def _load(self):
+        if self._files is not None:
+            return
+        try:
+            with open(self.store_path, "r", encoding="utf-8") as f:
+                self._files = (json.load(f) or {}).get("files") or {}
+        except Exception:
+            self._files = {}
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.store_path) or ".", exist_ok=True)
+            tmp = f"{self.store_path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"files": self._files, "saved_at": time.time()}, f, separators=(",", ":"))
+            os.replace(tmp, self.store_path)
+        except Exception:
+            pass
+
+    # -------------------------
+    # incremental scan
+    # -------------------------
+    @staticmethod
+    def _new_entry(inode: int) -> dict:
+        return {"inode": inode, "offset": 0, "totals": [0, 0, 0], "hourly": {}}
+
+    def _consume(self, path: str, entry: dict, size: int):
+        totals = entry["totals"]
+        hourly = entry["hourly"]
+        with open(path, "rb") as f:
+            f.seek(entry["offset"])
+            pos = entry["offset"]
+            while pos < size:
+                chunk = f.read(min(_CHUNK, size - pos))
+                if not chunk:
+                    break
+                last_nl = chunk.rfind(b"\n")
+                if last_nl < 0:
+                    # 单行超过一个 chunk 或只有半行：等下次
+                    if len(chunk) < _CHUNK:
+                        break
+                    last_nl = len(chunk) - 1
+                for line in chunk[: last_nl + 1].splitlines():
+                    k = classify(line)
+                    totals[k] += 1
+                    # [2026-01-23 10:00:00] → "2026-01-23 10"
+                    if len(line) >= 21 and line[:1] == b"[" and line[20:21] == b"]":
+                        hk = line[1:14].decode("ascii", errors="ignore")
+                        bucket = hourly.get(hk)
+                        if bucket is None:
+                            bucket = hourly[hk] = [0, 0, 0]
+                        bucket[k] += 1
+                pos += last_nl + 1
+                f.seek(pos)
+            entry["offset"] = pos
+
+    def _prune(self, entry: dict):
+        cutoff = (datetime.now() - timedelta(days=KEEP_DAYS)).strftime("%Y-%m-%d %H")
+        for hk in [h for h in entry["hourly"] if h < cutoff]:
+            entry["hourly"].pop(hk, None)
+
+    def refresh(self):
+        with self._lock:
+            self._load()
+            changed = False
+            seen = set()
+            if os.path.isdir(self.log_dir):
+                for name in os.listdir(self.log_dir):
+                    if not name.endswith(".log"):
+                        continue
+                    p = os.path.join(self.log_dir, name)
+                    try:
+                        st = os.stat(p)
+                    except OSError:
+                        continue
+                    seen.add(name)
+                    entry = self._files.get(name)
+                    if entry is None or entry.get("inode") != st.st_ino or st.st_size < entry.get("offset", 0):
+                        entry = self._new_entry(st.st_ino)
+                        self._files[name] = entry
+                        changed = True
+                    if st.st_size > entry["offset"]:
+                        try:
+                            before = entry["offset"]
+                            self._consume(p, entry, st.st_size)
+                            if entry["offset"] != before:
+                                self._prune(entry)
+                                changed = True
+                        except Exception:
+                            pass
+            for name in [n for n in self._files if n not in seen]:
+                self._files.pop(name, None)
+                changed = True
+            if changed:
+                self._save()
+
+    def snapshot(self, day: Optional[str] = None) -> dict:
+        """全量计数 + 指定日期（默认今天）每小时 error 数，与 log_stats 接口返回结构一致。"""
+        self.refresh()
+        day = day or datetime.now().strftime("%Y-%m-%d")
+        totals = [0, 0, 0]
+        hourly_errors: Dict[str, int] = {}
+        with self._lock:
+            for entry in self._files.values():
+                for i in range(3):
+                    totals[i] += entry["totals"][i]
+                for hk, bucket in entry["hourly"].items():
+                    if hk.startswith(day) and bucket[0]:
+                        hour = hk[11:13] + ":00"
+                        hourly_errors[hour] = hourly_errors.get(hour, 0) + bucket[0]
+        hours: List[str] = sorted(hourly_errors.keys())
+        return {
+            "summary": dict(zip(_KINDS, totals)),
+            "trend": {"hours": hours, "errors": [hourly_errors[h] for h in hours]},
+        }
+
+
+_engine: Optional[LogStatsEngine] = None
+
+
+def get_log_stats_engine() -> LogStatsEngine:
+    global _engine
+    if _engine is None:
+        _engine = LogStatsEngine()
+    return _engine
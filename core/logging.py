@@ -1,21 +1,272 @@
 # app/core/logging.py
+"""
+任务日志：logs/{task_id}.log + stdout。
+
+log() 只做格式化和入队，由后台线程批量写文件（按任务缓存句柄、定时 flush、按大小轮转）。
+Env：
+  TASK_LOG_ASYNC — 0 关闭后台线程，回退为每条同步写（默认 1）
+  TASK_LOG_STDOUT — 0 不再回显到 stdout（默认 1）
+  TASK_LOG_LEVEL — debug/info/warning/error，低于该级别的日志丢弃（默认 debug，全部保留）
+  TASK_LOG_MAX_BYTES — 单文件轮转阈值（默认 100MB，0 不轮转）
+  TASK_LOG_BACKUPS — 保留的轮转文件数 {task_id}.log.1..N（默认 3）
+  TASK_LOG_FLUSH_SEC — 批量 flush 间隔（默认 0.5）
+"""
+import atexit
+import itertools
 import os
+import queue
+import sys
 import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+LOG_DIR = "logs"
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
 
 _lock = threading.Lock()
 
-def log(task_id: str, msg: str):
-    ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    line = f"[{ts}] [{task_id}] {msg}"
-    print(line, flush=True)
-    
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_flag(name: str, default: str = "1") -> bool:
+    return (os.environ.get(name, default) or "").strip().lower() not in ("0", "false", "no", "off")
+
+
+_ASYNC = _env_flag("TASK_LOG_ASYNC")
+_STDOUT = _env_flag("TASK_LOG_STDOUT")
+_MIN_LEVEL = LEVELS.get((os.environ.get("TASK_LOG_LEVEL") or "debug").strip().lower(), 10)
+_MAX_BYTES = max(0, _env_int("TASK_LOG_MAX_BYTES", 100 * 1024 * 1024))
+_BACKUPS = max(1, _env_int("TASK_LOG_BACKUPS", 3))
+_MAX_OPEN = max(8, _env_int("TASK_LOG_MAX_OPEN", 256))
+try:
+    _FLUSH_SEC = max(0.05, float(os.environ.get("TASK_LOG_FLUSH_SEC", "0.5")))
+except ValueError:
+    _FLUSH_SEC = 0.5
+
+_ts_cache: Tuple[int, str] = (0, "")
+
+
+def _timestamp() -> str:
+    global _ts_cache
+    now = int(time.time())
+    if _ts_cache[0] != now:
+        _ts_cache = (now, datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S"))
+    return _ts_cache[1]
+
+
+def infer_level(msg: str) -> str:
+    """
+    消息没带级别时按内容推断，只用于 TASK_LOG_LEVEL 过滤。口径比日志统计页（core/log_stats.py：
+    ERROR/CRITICAL/Exception → error，WARNING → warning）宽：CRASH 也算 error，WARN/Warning 也算 warning，
+    过滤时不丢掉这些行。
+    """
+    if "ERROR" in msg or "CRITICAL" in msg or "Exception" in msg or "CRASH" in msg:
+        return "error"
+    if "WARN" in msg or "Warning" in msg:
+        return "warning"
+    if msg.startswith("EV "):
+        return "debug"
+    return "info"
+
+
+def _log_path(task_id: str) -> str:
+    return os.path.join(LOG_DIR, f"{task_id}.log")
+
+
+def _rotate(path: str):
+    for i in range(_BACKUPS - 1, 0, -1):
+        src = f"{path}.{i}"
+        if os.path.exists(src):
+            os.replace(src, f"{path}.{i + 1}")
+    if os.path.exists(path):
+        os.replace(path, f"{path}.1")
+
+
+class _LogWriter:
+    """单个后台线程：从队列取日志，按任务分组批量写入。"""
+
+    def __init__(self):
+        self._q: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._handles: "OrderedDict[str, object]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._pid = 0
+        self._start_lock = threading.Lock()
+        self._flushed = threading.Condition()
+        self._counter = itertools.count(1)
+        self._seq_in = 0
+        self._seq_out = 0
+
+    def _ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                # fork 之后父进程的句柄和线程都不可用
+                self._q = queue.SimpleQueue()
+                self._handles = OrderedDict()
+                self._sizes = {}
+                self._counter = itertools.count(1)
+                self._seq_in = self._seq_out = 0
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="task-log-writer", daemon=True)
+            self._thread.start()
+
+    def put(self, task_id: str, line: str):
+        self._ensure_started()
+        self._seq_in = next(self._counter)
+        self._q.put((task_id, line))
+
+    # ---- writer thread ----
+    def _handle(self, task_id: str):
+        f = self._handles.get(task_id)
+        if f is not None:
+            self._handles.move_to_end(task_id)
+            return f
+        os.makedirs(LOG_DIR, exist_ok=True)
+        path = _log_path(task_id)
+        f = open(path, "ab")
+        self._sizes[task_id] = f.tell()
+        self._handles[task_id] = f
+        while len(self._handles) > _MAX_OPEN:
+            old_id, old = self._handles.popitem(last=False)
+            self._sizes.pop(old_id, None)
+            try:
+                old.close()
+            except Exception:
+                pass
+        return f
+
+    def _close(self, task_id: str):
+        f = self._handles.pop(task_id, None)
+        self._sizes.pop(task_id, None)
+        if f is not None:
+            try:
+                f.close()
+            except Exception:
+                pass
+
+    def _write_batch(self, batch: List[Tuple[str, Optional[str]]]):
+        grouped: Dict[str, List[str]] = {}
+        for task_id, line in batch:
+            if line is None:
+                # close 请求：先写完已排队的，再关句柄
+                self._flush_group(grouped)
+                grouped = {}
+                self._close(task_id)
+                continue
+            grouped.setdefault(task_id, []).append(line)
+        self._flush_group(grouped)
+
+    def _flush_group(self, grouped: Dict[str, List[str]]):
+        if not grouped:
+            return
+        if _STDOUT:
+            try:
+                sys.stdout.write("".join(l + "\n" for lines in grouped.values() for l in lines))
+                sys.stdout.flush()
+            except Exception:
+                pass
+        for task_id, lines in grouped.items():
+            data = "".join(l + "\n" for l in lines).encode("utf-8")
+            try:
+                f = self._handle(task_id)
+                # 文件被外部删除/轮转后重新打开
+                if not os.path.exists(_log_path(task_id)):
+                    self._close(task_id)
+                    f = self._handle(task_id)
+                if _MAX_BYTES and self._sizes.get(task_id, 0) + len(data) > _MAX_BYTES and self._sizes.get(task_id, 0) > 0:
+                    self._close(task_id)
+                    _rotate(_log_path(task_id))
+                    f = self._handle(task_id)
+                f.write(data)
+                f.flush()
+                self._sizes[task_id] = self._sizes.get(task_id, 0) + len(data)
+            except Exception:
+                self._close(task_id)
+
+    def _run(self):
+        while True:
+            try:
+                item = self._q.get(timeout=_FLUSH_SEC)
+            except queue.Empty:
+                continue
+            batch = [item]
+            deadline = time.time() + _FLUSH_SEC
+            while len(batch) < 5000:
+                try:
+                    batch.append(self._q.get(timeout=max(0.0, deadline - time.time())))
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch(batch)
+            except Exception:
+                pass
+            with self._flushed:
+                self._seq_out += len(batch)
+                self._flushed.notify_all()
+
+    def flush(self, timeout: float = 5.0):
+        if self._thread is None or self._pid != os.getpid():
+            return
+        target = self._seq_in
+        deadline = time.time() + timeout
+        with self._flushed:
+            while self._seq_out < target:
+                left = deadline - time.time()
+                if left <= 0:
+                    return
+                self._flushed.wait(left)
+
+    def close(self, task_id: str):
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self.put(task_id, None)
+        self.flush()
+
+
+_writer = _LogWriter()
+
+
+def log(task_id: str, msg: str, level: Optional[str] = None):
+    if LEVELS.get(level or infer_level(msg), 20) < _MIN_LEVEL:
+        return
+    line = f"[{_timestamp()}] [{task_id}] {msg}"
+    if _ASYNC:
+        _writer.put(task_id, line)
+        return
+
+    if _STDOUT:
+        print(line, flush=True)
     # Try to write to logs/{task_id}.log
     try:
         with _lock:
-            if not os.path.exists("logs"):
-                os.makedirs("logs", exist_ok=True)
-            with open(os.path.join("logs", f"{task_id}.log"), "a", encoding="utf-8") as f:
+            if not os.path.exists(LOG_DIR):
+                os.makedirs(LOG_DIR, exist_ok=True)
+            with open(_log_path(task_id), "a", encoding="utf-8") as f:
                 f.write(line + "\n")
     except Exception:
         pass
+
+
+def flush_logs(timeout: float = 5.0):
+    """等待已入队的日志落盘（测试、进程退出、读取前使用）。"""
+    _writer.flush(timeout)
+
+
+def close_task_log(task_id: str):
+    """写完并关闭该任务的文件句柄（删除/截断日志文件前调用）。"""
+    _writer.close(task_id)
+
+
+atexit.register(flush_logs)
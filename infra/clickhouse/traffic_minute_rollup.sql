@@ -16,7 +16,78 @@ CREATE TABLE IF NOT EXISTS traffic.traffic_minute_rollup
     p99_ms Nullable(Float64),
     geo_counts String,
     top_paths String,
+    -- 可合并的对数分桶耗时直方图 JSON {"z": 零桶, "b": {桶号: 计数}}，跨分钟/数据源合并后求分位数
+    latency_sketch String DEFAULT '{}',
+    -- Space-Saving top 列表 [{"ip","requests","error"}]；topk_floor = 未收录 path/IP 的计数上界
+    top_ips String DEFAULT '[]',
+    topk_floor String DEFAULT '{}',
     ver DateTime
 )
 ENGINE = ReplacingMergeTree(ver)
 ORDER BY (source_id, bucket_start);
+
+-- 已有表升级
+ALTER TABLE traffic.traffic_minute_rollup ADD COLUMN IF NOT EXISTS latency_sketch String DEFAULT '{}' AFTER top_paths;
+ALTER TABLE traffic.traffic_minute_rollup ADD COLUMN IF NOT EXISTS top_ips String DEFAULT '[]' AFTER latency_sketch;
+ALTER TABLE traffic.traffic_minute_rollup ADD COLUMN IF NOT EXISTS topk_floor String DEFAULT '{}' AFTER top_ips;
+
+-- 小时 / 天聚合（TRAFFIC_ROLLUP_DOWNSAMPLE_ENABLED=1）：flush 每次把同一份分钟增量合并进 Postgres 小时 / 天行后
+-- 写入整行新版本，ReplacingMergeTree 按 ver 保留最新；列与分钟表相同
+CREATE TABLE IF NOT EXISTS traffic.traffic_hour_rollup AS traffic.traffic_minute_rollup
+ENGINE = ReplacingMergeTree(ver)
+ORDER BY (source_id, bucket_start);
+
+CREATE TABLE IF NOT EXISTS traffic.traffic_day_rollup AS traffic.traffic_minute_rollup
+ENGINE = ReplacingMergeTree(ver)
+ORDER BY (source_id, bucket_start);
+
+-- 小时 / 天行的计数可能超过 UInt32（日请求数 > 2^32），已建的表执行：
+ALTER TABLE traffic.traffic_hour_rollup
+    MODIFY COLUMN count_latency UInt64, MODIFY COLUMN status_2xx UInt64,
+    MODIFY COLUMN status_4xx UInt64, MODIFY COLUMN status_5xx UInt64;
+ALTER TABLE traffic.traffic_day_rollup
+    MODIFY COLUMN count_latency UInt64, MODIFY COLUMN status_2xx UInt64,
+    MODIFY COLUMN status_4xx UInt64, MODIFY COLUMN status_5xx UInt64;
+
+-- 预聚合表（CLICKHOUSE_ROLLUP_AGG_ENABLED=1）：flush 每次写入一分钟/数据源的增量行，SummingMergeTree 合并时
+-- 按 (source_id, bucket_start) 求和，Map 列按 key 求和（需 ClickHouse 21.x+）。latency_bins 为对数分桶直方图
+-- （桶号 → 计数，见 traffic/services/sketches.py），查询用 sumMap 合并后在应用侧求分位数，跨分钟 / 数据源无损。
+-- 大盘按步长 GROUP BY，只返回序列、geo 与 top-N。
+CREATE TABLE IF NOT EXISTS traffic.traffic_rollup_agg
+(
+    bucket_start DateTime,
+    source_id LowCardinality(String),
+    requests UInt64,
+    sum_latency_ms UInt64,
+    count_latency UInt64,
+    status_2xx UInt64,
+    status_4xx UInt64,
+    status_5xx UInt64,
+    latency_zero UInt64,
+    latency_bins Map(Int32, UInt64),
+    geo Map(String, UInt64),
+    -- Space-Saving 计数 / 误差；*_floor = 未收录 key 的计数上界（求和后仍是上界）
+    paths Map(String, UInt64),
+    paths_err Map(String, UInt64),
+    paths_floor UInt64,
+    ips Map(String, UInt64),
+    ips_err Map(String, UInt64),
+    ips_floor UInt64
+)
+ENGINE = SummingMergeTree
+ORDER BY (source_id, bucket_start);
+
+-- 开启前的历史分钟数据一次性导入（只执行一次：增量表重复导入会重复计数）
+-- INSERT INTO traffic.traffic_rollup_agg
+-- SELECT
+--     bucket_start, source_id, requests, sum_latency_ms, count_latency, status_2xx, status_4xx, status_5xx,
+--     JSONExtractUInt(latency_sketch, 'z'),
+--     CAST(arrayMap(t -> (toInt32(t.1), t.2), JSONExtractKeysAndValues(latency_sketch, 'b', 'UInt64')), 'Map(Int32, UInt64)'),
+--     CAST(JSONExtractKeysAndValues(geo_counts, 'UInt64'), 'Map(String, UInt64)'),
+--     CAST(arrayMap(x -> (JSONExtractString(x, 'path'), JSONExtractUInt(x, 'requests')), JSONExtractArrayRaw(top_paths)), 'Map(String, UInt64)'),
+--     CAST(arrayMap(x -> (JSONExtractString(x, 'path'), JSONExtractUInt(x, 'error')), JSONExtractArrayRaw(top_paths)), 'Map(String, UInt64)'),
+--     JSONExtractUInt(topk_floor, 'paths'),
+--     CAST(arrayMap(x -> (JSONExtractString(x, 'ip'), JSONExtractUInt(x, 'requests')), JSONExtractArrayRaw(top_ips)), 'Map(String, UInt64)'),
+--     CAST(arrayMap(x -> (JSONExtractString(x, 'ip'), JSONExtractUInt(x, 'error')), JSONExtractArrayRaw(top_ips)), 'Map(String, UInt64)'),
+--     JSONExtractUInt(topk_floor, 'ips')
+-- FROM traffic.traffic_minute_rollup FINAL;
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Connection, SyncTask
+from .models import Connection, SyncTask, SyncCheckpoint
 
 @admin.register(Connection)
 class ConnectionAdmin(admin.ModelAdmin):
@@ -10,3 +10,8 @@ class ConnectionAdmin(admin.ModelAdmin):
 class SyncTaskAdmin(admin.ModelAdmin):
     list_display = ('task_id', 'status', 'created_at')
     list_filter = ('status',)
+
+@admin.register(SyncCheckpoint)
+class SyncCheckpointAdmin(admin.ModelAdmin):
+    list_display = ('task_id', 'shard', 'log_file', 'log_pos', 'ts')
+    search_fields = ('task_id',)
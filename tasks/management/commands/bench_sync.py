@@ -0,0 +1,38 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from tasks.sync.benchmark import COLUMN_TYPES, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = "Benchmark sync pipeline stages with synthetic rows and write results as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=20000, help="Synthetic row count")
+        parser.add_argument("--width", type=int, default=20, help="Columns per row (besides id)")
+        parser.add_argument("--types", default=",".join(COLUMN_TYPES), help="Column types, comma separated")
+        parser.add_argument("--producers", type=int, default=4, help="Concurrent FlushBuffer producers")
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per stage (fastest is kept)")
+        parser.add_argument("--stages", default="", help="Only run these stages, comma separated")
+        parser.add_argument("--mongo-uri", default="", help="Use a real mongod instead of the in-memory fake")
+        parser.add_argument("--out", default="", help="Write JSON results to this file")
+
+    def handle(self, *args, **options):
+        report = run_benchmarks(
+            rows=max(1, options["rows"]),
+            width=max(1, options["width"]),
+            types=[t.strip() for t in options["types"].split(",") if t.strip()],
+            producers=max(1, options["producers"]),
+            repeat=max(1, options["repeat"]),
+            mongo_uri=options["mongo_uri"] or None,
+            stages=[s.strip() for s in options["stages"].split(",") if s.strip()] or None,
+        )
+        text = json.dumps(report, indent=2)
+        if options["out"]:
+            with open(options["out"], "w", encoding="utf-8") as f:
+                f.write(text + "\n")
+            for name, res in report["results"].items():
+                self.stdout.write(f"{name}: {json.dumps(res)}")
+        else:
+            self.stdout.write(text)
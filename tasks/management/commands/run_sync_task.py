@@ -1,3 +1,5 @@
+import signal
+
 from django.core.management.base import BaseCommand, CommandError
 
 from tasks.models import SyncTask
@@ -27,12 +29,30 @@ class Command(BaseCommand):
             raise CommandError("Invalid shard index/total")
         cfg.shard_total = shard_total
         cfg.shard_index = shard_index
+        scaled_at = task.turbo_scaled_at
         task.status = "running"
         task.save(update_fields=["status", "updated_at"])
 
         worker = SyncWorker(cfg)
+
+        # Pod deletion sends SIGTERM: stop the stream so run() flushes and compacts its checkpoint
+        # (turbo autoscaler relies on this for shard handoff).
+        terminated = {"flag": False}
+
+        def _on_term(signum, frame):
+            terminated["flag"] = True
+            worker.stop()
+
+        signal.signal(signal.SIGTERM, _on_term)
         worker.run()
 
+        if terminated["flag"]:
+            task.refresh_from_db(fields=["turbo_shard_count", "turbo_scaled_at"])
+            if task.turbo_scaled_at != scaled_at or int(task.turbo_shard_count or 1) != shard_total:
+                # 扩缩容交接：新一代分片负责任务状态，旧 pod 不能把它改回 stopped
+                self.stdout.write(f"run_sync_task: shard {shard_index}/{shard_total} handed off, status left as is")
+                return
+
         # Keep DB status aligned with worker lifecycle.
         if getattr(worker, "_status", "") == "error":
             task.status = "error"
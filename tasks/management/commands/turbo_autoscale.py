@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tasks.sync.turbo_autoscaler import TurboAutoscaler
+
+
+class Command(BaseCommand):
+    help = "Scale turbo shard pods of autoscale-enabled tasks by replication backlog."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--task-id", default=None, help="Only evaluate this task")
+        parser.add_argument("--interval", type=int, default=60, help="Seconds between evaluations")
+        parser.add_argument("--once", action="store_true", help="Evaluate once and exit")
+
+    def handle(self, *args, **options):
+        scaler = TurboAutoscaler()
+        interval = max(5, int(options.get("interval") or 60))
+        while True:
+            result = scaler.run_once(options.get("task_id"))
+            for task_id, shards in result.items():
+                if shards:
+                    self.stdout.write(f"{task_id}: rescaled to {shards} shards")
+            if options.get("once"):
+                return
+            time.sleep(interval)
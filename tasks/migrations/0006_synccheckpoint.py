@@ -0,0 +1,27 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0005_connection_deployment_mode"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SyncCheckpoint",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("task_id", models.CharField(db_index=True, max_length=100)),
+                ("shard", models.IntegerField(default=0)),
+                ("log_file", models.CharField(blank=True, default="", max_length=255)),
+                ("log_pos", models.BigIntegerField(default=0)),
+                ("gtid", models.TextField(blank=True, default="")),
+                ("metrics", models.JSONField(blank=True, default=dict)),
+                ("ts", models.FloatField(default=0.0)),
+            ],
+            options={
+                "unique_together": {("task_id", "shard")},
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0006_synccheckpoint"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="synctask",
+            name="turbo_autoscale_enabled",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name="synctask",
+            name="turbo_min_shards",
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name="synctask",
+            name="turbo_max_shards",
+            field=models.IntegerField(default=8),
+        ),
+        migrations.AddField(
+            model_name="synctask",
+            name="turbo_scaled_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="synctask",
+            name="turbo_backlog",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -29,5 +29,45 @@ class SyncTask(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Turbo: run the task in dedicated pods (see tasks/sync/turbo_runner.py)
+    turbo_enabled = models.BooleanField(default=False)
+    turbo_no_limit = models.BooleanField(default=True)
+    turbo_cpu_request = models.CharField(max_length=32, blank=True, null=True)
+    turbo_cpu_limit = models.CharField(max_length=32, blank=True, null=True)
+    turbo_mem_request = models.CharField(max_length=32, blank=True, null=True)
+    turbo_mem_limit = models.CharField(max_length=32, blank=True, null=True)
+    turbo_phase = models.CharField(max_length=32, blank=True, null=True)
+    turbo_pod_name = models.CharField(max_length=200, blank=True, null=True)
+    turbo_pod_namespace = models.CharField(max_length=100, blank=True, null=True)
+    turbo_shard_count = models.IntegerField(default=1)
+
+    # Turbo autoscaling (see tasks/sync/turbo_autoscaler.py)
+    turbo_autoscale_enabled = models.BooleanField(default=False)
+    turbo_min_shards = models.IntegerField(default=1)
+    turbo_max_shards = models.IntegerField(default=8)
+    turbo_scaled_at = models.DateTimeField(blank=True, null=True)
+    turbo_backlog = models.JSONField(default=dict, blank=True)
+
     def __str__(self):
         return self.task_id
+
+
+class SyncCheckpoint(models.Model):
+    """
+    Binlog checkpoint per (task, shard). Kept out of SyncTask so the periodic
+    state save is a single narrow-row UPDATE instead of rewriting config/state JSON.
+    """
+
+    task_id = models.CharField(max_length=100, db_index=True)
+    shard = models.IntegerField(default=0)
+    log_file = models.CharField(max_length=255, blank=True, default="")
+    log_pos = models.BigIntegerField(default=0)
+    gtid = models.TextField(blank=True, default="")
+    metrics = models.JSONField(default=dict, blank=True)
+    ts = models.FloatField(default=0.0)
+
+    class Meta:
+        unique_together = [("task_id", "shard")]
+
+    def __str__(self):
+        return f"{self.task_id}#{self.shard} {self.log_file}:{self.log_pos}"
@@ -91,6 +91,8 @@ class SyncTaskRequest(BaseModel):
     auto_discover_new_tables: bool = True
     auto_discover_interval_sec: int = 10
     auto_discover_only_base_table: bool = True
+    # gh-ost / pt-osc 影子表（_t_gho/_t_ghc/_t_del/_t_new/_t_old）不参与自动发现和同步；置空关闭
+    shadow_table_pattern: str = r"^_.+_(gho|ghc|del|new|old)$"
 
     # 重连策略
     inc_reconnect_max_retry: int = 0
@@ -115,6 +117,13 @@ class SyncTaskRequest(BaseModel):
     binlog_filename: Optional[str] = None
     binlog_position: Optional[int] = None
 
+    # Change capture：同实例多任务共享一份 binlog 读取（需配置 SYNC_CDC_REDIS_URL / REDIS_URL）
+    change_capture_enabled: bool = False
+
+    # Turbo 分片（由 run_sync_task 注入：按表名 crc32 % shard_total 分配）
+    shard_total: int = 1
+    shard_index: int = 0
+
     # Debug
     debug_binlog_events: bool = False
     # 性能优化
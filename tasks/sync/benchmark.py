@@ -0,0 +1,329 @@
+# app/sync/benchmark.py
+"""
+同步链路吞吐基准（不依赖 MySQL；Mongo 可用本地 mongod 或内存 fake）：
+- synthetic_rows：可配置宽度/类型的合成行（int/str/Decimal/datetime/JSON/blob）
+- converter：Converter.row_to_base_doc / row_to_version_doc
+- flush_buffer：多生产者并发 add + 后台 flush
+- mongo_writer：MongoWriter.safe_bulk_write
+- inc_replay：合成 binlog 行事件走 SyncWorker._apply_row_event + 增量 FlushBuffer
+
+用法：python manage.py bench_sync --out bench.json，结果按 commit 对比。
+"""
+import json
+import os
+import platform
+import random
+import subprocess
+import threading
+import time
+from datetime import datetime as dt, timedelta
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional
+
+from pymongo.operations import InsertOne, ReplaceOne
+
+from tasks.schemas import SyncTaskRequest
+from .convert import Converter
+from .flush_buffer import FlushBuffer
+from .mongo_writer import MongoWriter
+from .worker import SyncWorker
+
+COLUMN_TYPES = ("int", "str", "decimal", "datetime", "json", "blob")
+
+
+# -------------------------
+# synthetic data
+# -------------------------
+def synthetic_rows(
+    n: int,
+    width: int = 20,
+    types: Optional[List[str]] = None,
+    blob_size: int = 256,
+    seed: int = 42,
+    start_id: int = 1,
+) -> List[Dict[str, Any]]:
+    """id + width 列，列类型按 types 轮转。固定 seed 保证各次运行数据一致。"""
+    rnd = random.Random(seed)
+    types = [t for t in (types or COLUMN_TYPES) if t in COLUMN_TYPES] or list(COLUMN_TYPES)
+    cols = [(f"c{i}_{types[i % len(types)]}", types[i % len(types)]) for i in range(max(1, width))]
+    base_ts = dt(2024, 1, 1)
+    blob = bytes(rnd.getrandbits(8) for _ in range(max(1, blob_size)))
+
+    rows = []
+    for i in range(n):
+        row: Dict[str, Any] = {"id": start_id + i}
+        for name, kind in cols:
+            if kind == "int":
+                row[name] = rnd.randint(-(2**31), 2**31)
+            elif kind == "str":
+                row[name] = "v%x" % rnd.getrandbits(64)
+            elif kind == "decimal":
+                row[name] = Decimal(rnd.randint(0, 10**12)).scaleb(-4)
+            elif kind == "datetime":
+                row[name] = base_ts + timedelta(seconds=rnd.randint(0, 10**8))
+            elif kind == "json":
+                row[name] = json.dumps({"k": rnd.randint(0, 1000), "tags": ["a", "b"], "ok": True})
+            else:
+                row[name] = blob
+        rows.append(row)
+    return rows
+
+
+def synthetic_events(rows: List[Dict[str, Any]], table: str, batch: int = 20, mix=(0.6, 0.3, 0.1), seed: int = 7):
+    """把行组装成 (op, table, rows) 的行事件序列，格式与 pymysqlreplication 的 ev.rows 一致。"""
+    rnd = random.Random(seed)
+    events = []
+    for i in range(0, len(rows), batch):
+        chunk = rows[i:i + batch]
+        x = rnd.random()
+        if x < mix[0]:
+            events.append(("insert", table, [{"values": r} for r in chunk]))
+        elif x < mix[0] + mix[1]:
+            events.append(("update", table, [{"before_values": r, "after_values": r} for r in chunk]))
+        else:
+            events.append(("delete", table, [{"values": r} for r in chunk]))
+    return events
+
+
+# -------------------------
+# in-memory Mongo stand-in
+# -------------------------
+class FakeCollection:
+    def __init__(self, name: str):
+        self.name = name
+        self.ops = 0
+        self.batches = 0
+
+    def create_indexes(self, indexes):
+        return []
+
+    def bulk_write(self, ops, ordered=True):
+        self.ops += len(ops)
+        self.batches += 1
+
+    def drop(self):
+        self.ops = 0
+
+
+class FakeDatabase:
+    def __init__(self):
+        self._colls: Dict[str, FakeCollection] = {}
+
+    def get_collection(self, name: str, **kwargs) -> FakeCollection:
+        return self._colls.setdefault(name, FakeCollection(name))
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        return self.get_collection(name)
+
+
+# -------------------------
+# measurements
+# -------------------------
+def _measure(fn: Callable[[], int], repeat: int) -> Dict[str, Any]:
+    """跑 repeat 次取最快一次；fn 返回处理的条数，或 (条数, 自行计时的秒数)。"""
+    best = None
+    count = 0
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        out = fn()
+        elapsed = time.perf_counter() - t0
+        if isinstance(out, tuple):
+            count, elapsed = out
+        else:
+            count = out
+        best = elapsed if best is None else min(best, elapsed)
+    best = max(best or 0.0, 1e-9)
+    return {"count": count, "seconds": round(best, 6), "per_sec": round(count / best, 1)}
+
+
+def bench_converter(rows: List[Dict[str, Any]], repeat: int = 3) -> Dict[str, Any]:
+    conv = Converter("id", True, dec_scale=18)
+
+    def base():
+        for r in rows:
+            conv.row_to_base_doc(r)
+        return len(rows)
+
+    def version():
+        for r in rows:
+            conv.row_to_version_doc(r, pk_val=r["id"], base_id=r["id"])
+        return len(rows)
+
+    return {"row_to_base_doc": _measure(base, repeat), "row_to_version_doc": _measure(version, repeat)}
+
+
+def bench_flush_buffer(rows: List[Dict[str, Any]], producers: int = 4, batch_size: int = 2000, repeat: int = 3):
+    op = InsertOne({"x": 1})
+    per = max(1, len(rows) // max(1, producers))
+
+    def run():
+        written = [0]
+
+        def writer(coll_name: str, ops: List):
+            written[0] += len(ops)
+
+        buf = FlushBuffer(batch_size=batch_size, flush_interval_sec=1, writer_func=writer)
+        buf.start()
+        t0 = time.perf_counter()
+
+        def produce(k: int):
+            coll = f"coll{k % 4}"
+            for _ in range(per):
+                buf.add(coll, op)
+                buf.flush_if_reach_batch()
+
+        threads = [threading.Thread(target=produce, args=(k,)) for k in range(producers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        buf.flush(force=True)
+        elapsed = time.perf_counter() - t0
+        # 后台线程 join 最多等一个 flush 间隔，不计入吞吐
+        buf.stop()
+        return written[0], elapsed
+
+    res = _measure(run, repeat)
+    res["producers"] = producers
+    return res
+
+
+def bench_mongo_writer(rows: List[Dict[str, Any]], db=None, batch: int = 2000, repeat: int = 3):
+    conv = Converter("id", True, dec_scale=18)
+    docs = [conv.row_to_base_doc(r) for r in rows]
+    ops = [ReplaceOne({"_id": d["id"]}, dict(d, _id=d["id"]), upsert=True) for d in docs]
+    db = db if db is not None else FakeDatabase()
+    coll = db.get_collection("bench_sync_writer")
+    writer = MongoWriter("bench", threading.Event())
+
+    def run():
+        for i in range(0, len(ops), batch):
+            writer.safe_bulk_write(coll, ops[i:i + batch], table="bench", coll_name="bench_sync_writer")
+        return len(ops)
+
+    try:
+        return _measure(run, repeat)
+    finally:
+        if not isinstance(db, FakeDatabase):
+            coll.drop()
+
+
+class _ReplayWorker(SyncWorker):
+    """走 SyncWorker 的构造函数，只把 MySQL TLS 探测与 Mongo 连接换成桩（给定的 db）。"""
+
+    def __init__(self, cfg: SyncTaskRequest, mongo_db):
+        self._bench_db = mongo_db
+        super().__init__(cfg)
+        # 表结构缓存预置主键，避免回查 MySQL
+        for t in cfg.table_map:
+            self.mysql_introspector._pk_by_table[t] = cfg.pk_field
+
+    def _probe_mysql_tls(self):
+        pass
+
+    def _connect_mongo(self):
+        self.mongo = None
+        return self._bench_db
+
+
+def bench_inc_replay(rows: List[Dict[str, Any]], db=None, repeat: int = 3) -> Dict[str, Any]:
+    table = "bench_table"
+    cfg = SyncTaskRequest(
+        task_id="bench",
+        mysql_conf={"user": "bench", "password": ""},
+        mongo_conf={"user": "bench", "password": ""},
+        table_map={table: "bench_sync_inc"},
+        rate_limit_enabled=False,
+        inc_flush_batch=2000,
+        unknown_col_fix_enabled=False,
+        auto_discover_new_tables=False,
+    )
+    events = synthetic_events(rows, table)
+    db = db if db is not None else FakeDatabase()
+
+    def run():
+        worker = _ReplayWorker(cfg, db)
+        buf = worker._make_inc_buffer(worker._inc_write_concern(), None)
+        n = 0
+        for op, tbl, ev_rows in events:
+            if not worker._owns_event(tbl, None, None):
+                continue
+            worker._apply_row_event(buf, op, tbl, ev_rows)
+            worker._update_processed_count()
+            buf.flush_if_reach_batch()
+            n += len(ev_rows)
+        buf.flush(force=True)
+        return n
+
+    try:
+        res = _measure(run, repeat)
+        res["events"] = len(events)
+        return res
+    finally:
+        if not isinstance(db, FakeDatabase):
+            db.get_collection("bench_sync_inc").drop()
+
+
+def _git_commit() -> str:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            timeout=5,
+        )
+        return out.stdout.strip()
+    except Exception:
+        return ""
+
+
+def run_benchmarks(
+    rows: int = 20000,
+    width: int = 20,
+    types: Optional[List[str]] = None,
+    producers: int = 4,
+    repeat: int = 3,
+    mongo_uri: Optional[str] = None,
+    stages: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    data = synthetic_rows(rows, width=width, types=types)
+    db = None
+    client = None
+    if mongo_uri:
+        from pymongo import MongoClient
+
+        client = MongoClient(mongo_uri)
+        db = client["bench_sync"]
+
+    all_stages = {
+        "converter": lambda: bench_converter(data, repeat),
+        "flush_buffer": lambda: bench_flush_buffer(data, producers=producers, repeat=repeat),
+        "mongo_writer": lambda: bench_mongo_writer(data, db=db, repeat=repeat),
+        "inc_replay": lambda: bench_inc_replay(data, db=db, repeat=repeat),
+    }
+    results: Dict[str, Any] = {}
+    try:
+        for name, fn in all_stages.items():
+            if stages and name not in stages:
+                continue
+            results[name] = fn()
+    finally:
+        if client is not None:
+            client.close()
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "ts": dt.utcnow().isoformat() + "Z",
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "rows": rows,
+            "width": width,
+            "types": types or list(COLUMN_TYPES),
+            "repeat": repeat,
+            "mongo": "mongod" if mongo_uri else "fake",
+        },
+        "results": results,
+    }
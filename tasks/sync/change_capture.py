@@ -0,0 +1,448 @@
+# app/sync/change_capture.py
+"""
+Change capture：每个 MySQL 实例只读一份 binlog，解码后的行变更写入 Redis Stream，
+多个同步任务以 consumer group 订阅，各自维护 offset。
+
+Env（未配置 Redis 时功能关闭，任务自动回退为直连 binlog）：
+  SYNC_CDC_REDIS_URL — change stream 使用的 Redis（未设置时回退 REDIS_URL）
+  SYNC_CDC_STREAM_MAXLEN — Stream 近似保留条数（默认 2000000）
+
+Stream 的持久性取决于 Redis 的 AOF/RDB 配置；条目被裁剪导致的断档会被消费端检测到并回退直连。
+"""
+import base64
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import date, datetime as dt, time as dtime, timedelta
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+import pymysql
+from pymysqlreplication import BinLogStreamReader
+from pymysqlreplication.event import QueryEvent
+from pymysqlreplication.row_event import WriteRowsEvent, UpdateRowsEvent, DeleteRowsEvent
+
+from core.logging import log
+from .schema_change import looks_like_rename
+
+STREAM_PREFIX = "sync:cdc:"
+LEASE_TTL_MS = 15_000
+POS_SAVE_INTERVAL_SEC = 1.0
+
+_EVENT_OPS = (
+    (WriteRowsEvent, "insert"),
+    (UpdateRowsEvent, "update"),
+    (DeleteRowsEvent, "delete"),
+)
+
+_TAG = "__cdc__"
+
+
+def row_event_op(ev) -> Optional[str]:
+    for cls, op in _EVENT_OPS:
+        if isinstance(ev, cls):
+            return op
+    return None
+
+
+def cdc_redis_url() -> str:
+    return (os.environ.get("SYNC_CDC_REDIS_URL") or os.environ.get("REDIS_URL") or "").strip()
+
+
+def cdc_configured() -> bool:
+    return bool(cdc_redis_url())
+
+
+def _stream_maxlen() -> int:
+    try:
+        return max(10_000, int(os.environ.get("SYNC_CDC_STREAM_MAXLEN", "2000000")))
+    except ValueError:
+        return 2_000_000
+
+
+def _client():
+    import redis
+
+    return redis.from_url(cdc_redis_url(), decode_responses=True, socket_connect_timeout=2)
+
+
+def instance_key(mysql_settings: dict) -> str:
+    return f"{mysql_settings.get('host')}:{int(mysql_settings.get('port') or 3306)}"
+
+
+def stream_key(key: str) -> str:
+    return f"{STREAM_PREFIX}{key}"
+
+
+def pos_tuple(log_file: Optional[str], log_pos: Optional[int]) -> Tuple[int, str, int]:
+    """binlog 位点可比较形式：按文件序号（mysql-bin.000123 → 123）再按 pos。"""
+    f = log_file or ""
+    seq = -1
+    suffix = f.rsplit(".", 1)[-1]
+    if suffix.isdigit():
+        seq = int(suffix)
+    return (seq, f if seq < 0 else "", int(log_pos or 0))
+
+
+# -------------------------
+# row value encoding
+# -------------------------
+def _enc(v: Any) -> Any:
+    if v is None or isinstance(v, (bool, int, float, str)):
+        return v
+    if isinstance(v, Decimal):
+        return {_TAG: "dec", "v": str(v)}
+    if isinstance(v, dt):
+        return {_TAG: "dt", "v": v.isoformat()}
+    if isinstance(v, date):
+        return {_TAG: "d", "v": v.isoformat()}
+    if isinstance(v, dtime):
+        return {_TAG: "t", "v": v.isoformat()}
+    if isinstance(v, timedelta):
+        return {_TAG: "td", "v": v.total_seconds()}
+    if isinstance(v, (bytes, bytearray)):
+        return {_TAG: "b", "v": base64.b64encode(bytes(v)).decode("ascii")}
+    if isinstance(v, dict):
+        return {(k.decode("utf-8", "replace") if isinstance(k, bytes) else str(k)): _enc(x) for k, x in v.items()}
+    if isinstance(v, (list, tuple)):
+        return [_enc(x) for x in v]
+    if isinstance(v, (set, frozenset)):
+        return {_TAG: "set", "v": [_enc(x) for x in sorted(v, key=str)]}
+    return str(v)
+
+
+def _dec_hook(obj: dict) -> Any:
+    tag = obj.get(_TAG)
+    if tag is None or len(obj) != 2:
+        return obj
+    v = obj.get("v")
+    if tag == "dec":
+        return Decimal(v)
+    if tag == "dt":
+        return dt.fromisoformat(v)
+    if tag == "d":
+        return date.fromisoformat(v)
+    if tag == "t":
+        return dtime.fromisoformat(v)
+    if tag == "td":
+        return timedelta(seconds=v)
+    if tag == "b":
+        return base64.b64decode(v)
+    if tag == "set":
+        return set(v)
+    return obj
+
+
+def encode_rows(rows: List[dict]) -> str:
+    return json.dumps(_enc(rows or []), ensure_ascii=False, separators=(",", ":"))
+
+
+def decode_rows(text: str) -> List[dict]:
+    return json.loads(text or "[]", object_hook=_dec_hook)
+
+
+class ChangeStreamGap(Exception):
+    """Stream 已被裁剪，无法从消费者的 checkpoint 连续续读。"""
+
+
+# -------------------------
+# producer: one binlog reader per instance
+# -------------------------
+class ChangeCaptureService:
+    """
+    读一个 MySQL 实例的 binlog，把行事件 XADD 到 sync:cdc:{host}:{port}。
+    多进程（如 turbo pod）同时 acquire 时通过 Redis lease 保证只有一个 reader。
+    """
+
+    def __init__(self, key: str, mysql_settings: dict, seed_file: Optional[str], seed_pos: Optional[int]):
+        self.key = key
+        self.stream = stream_key(key)
+        self.pos_key = f"{self.stream}:pos"
+        self.lease_key = f"{self.stream}:lease"
+        self.mysql_settings = {k: v for k, v in mysql_settings.items() if k not in ("cursorclass", "db")}
+        self.seed_file = seed_file
+        self.seed_pos = seed_pos
+        self.owner = uuid.uuid4().hex
+        self.stop_event = threading.Event()
+        self._reader: Optional[BinLogStreamReader] = None
+        self._thread: Optional[threading.Thread] = None
+        self._log_id = f"cdc-{key.replace(':', '-')}"
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        try:
+            if self._reader is not None:
+                self._reader.close()
+        except Exception:
+            pass
+        try:
+            r = _client()
+            if r.get(self.lease_key) == self.owner:
+                r.delete(self.lease_key)
+        except Exception:
+            pass
+
+    def _hold_lease(self, r) -> bool:
+        if r.set(self.lease_key, self.owner, nx=True, px=LEASE_TTL_MS):
+            return True
+        if r.get(self.lease_key) == self.owner:
+            r.pexpire(self.lease_key, LEASE_TTL_MS)
+            return True
+        return False
+
+    def _master_status(self) -> Tuple[Optional[str], Optional[int]]:
+        conn = pymysql.connect(**self.mysql_settings)
+        try:
+            with conn.cursor() as c:
+                c.execute("SHOW MASTER STATUS")
+                row = c.fetchone()
+                if row:
+                    return row[0], int(row[1])
+        finally:
+            conn.close()
+        return None, None
+
+    def _start_position(self, r) -> Tuple[Optional[str], Optional[int]]:
+        saved = r.hgetall(self.pos_key) or {}
+        if saved.get("file"):
+            return saved["file"], int(saved.get("pos") or 4)
+        if self.seed_file:
+            return self.seed_file, int(self.seed_pos or 4)
+        return self._master_status()
+
+    def _run(self):
+        backoff = 1.0
+        while not self.stop_event.is_set():
+            try:
+                r = _client()
+                if not self._hold_lease(r):
+                    self.stop_event.wait(LEASE_TTL_MS / 3000.0)
+                    continue
+                self._capture(r)
+                backoff = 1.0
+            except Exception as e:
+                if self.stop_event.is_set():
+                    break
+                log(self._log_id, f"Change capture error: {type(e).__name__}: {str(e)[:200]}")
+                self.stop_event.wait(min(30.0, backoff) + random.random() * 0.2)
+                backoff *= 2
+        log(self._log_id, "Change capture stopped")
+
+    def _capture(self, r):
+        log_file, log_pos = self._start_position(r)
+        self._reader = BinLogStreamReader(
+            connection_settings=self.mysql_settings,
+            server_id=2000 + random.randint(0, 10000),
+            log_file=log_file,
+            log_pos=log_pos,
+            blocking=True,
+            resume_stream=True,
+            only_events=[WriteRowsEvent, UpdateRowsEvent, DeleteRowsEvent, QueryEvent],
+        )
+        log(self._log_id, f"Change capture started from={log_file}:{log_pos} stream={self.stream}")
+        maxlen = _stream_maxlen()
+        # pf/pp：上一条已发布条目的位点（不是上一个事件的），消费端据此检测断档
+        prev_file, prev_pos = log_file or "", int(log_pos or 0)
+        last_save = last_lease = time.time()
+        try:
+            for ev in self._reader:
+                if self.stop_event.is_set():
+                    break
+                now = time.time()
+                if now - last_lease >= LEASE_TTL_MS / 3000.0:
+                    if not self._hold_lease(r):
+                        log(self._log_id, "Change capture lease lost; handing over")
+                        break
+                    last_lease = now
+                op = row_event_op(ev)
+                cur_file, cur_pos = self._reader.log_file, int(self._reader.log_pos or 0)
+                if isinstance(ev, QueryEvent):
+                    # 只转发表改名，消费端据此调整 table_map
+                    if looks_like_rename(ev.query):
+                        r.xadd(
+                            self.stream,
+                            {
+                                "file": cur_file,
+                                "pos": cur_pos,
+                                "pf": prev_file,
+                                "pp": prev_pos,
+                                "schema": (ev.schema or b"").decode("utf-8", "replace"),
+                                "table": "",
+                                "op": "rename",
+                                "query": ev.query,
+                            },
+                            maxlen=maxlen,
+                            approximate=True,
+                        )
+                        prev_file, prev_pos = cur_file, cur_pos
+                elif op is not None:
+                    r.xadd(
+                        self.stream,
+                        {
+                            "file": cur_file,
+                            "pos": cur_pos,
+                            "pf": prev_file,
+                            "pp": prev_pos,
+                            "schema": getattr(ev, "schema", "") or "",
+                            "table": ev.table or "",
+                            "op": op,
+                            "rows": encode_rows(ev.rows),
+                        },
+                        maxlen=maxlen,
+                        approximate=True,
+                    )
+                    prev_file, prev_pos = cur_file, cur_pos
+                if now - last_save >= POS_SAVE_INTERVAL_SEC:
+                    # 只保存最后一条已发布条目的位点：重启后第一条的 pf/pp 必须等于消费端已见过的 file/pos，
+                    # 未发布的事件（BEGIN 等）重读一遍无害
+                    r.hset(self.pos_key, mapping={"file": prev_file, "pos": prev_pos})
+                    last_save = now
+        finally:
+            try:
+                if prev_file:
+                    r.hset(self.pos_key, mapping={"file": prev_file, "pos": prev_pos})
+            except Exception:
+                pass
+            try:
+                self._reader.close()
+            except Exception:
+                pass
+            self._reader = None
+
+
+class ChangeCaptureHub:
+    """进程内按实例引用计数管理 ChangeCaptureService。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._services: Dict[str, ChangeCaptureService] = {}
+        self._refs: Dict[str, int] = {}
+
+    def acquire(self, mysql_settings: dict, log_file: Optional[str], log_pos: Optional[int]) -> str:
+        key = instance_key(mysql_settings)
+        with self._lock:
+            svc = self._services.get(key)
+            if svc is None:
+                svc = ChangeCaptureService(key, mysql_settings, log_file, log_pos)
+                self._services[key] = svc
+                svc.start()
+            self._refs[key] = self._refs.get(key, 0) + 1
+        return key
+
+    def release(self, key: str):
+        with self._lock:
+            n = self._refs.get(key, 0) - 1
+            if n > 0:
+                self._refs[key] = n
+                return
+            self._refs.pop(key, None)
+            svc = self._services.pop(key, None)
+        if svc is not None:
+            svc.stop()
+
+
+capture_hub = ChangeCaptureHub()
+
+
+# -------------------------
+# consumer
+# -------------------------
+class ChangeEntry:
+    __slots__ = ("id", "log_file", "log_pos", "schema", "table", "op", "rows", "query")
+
+    def __init__(self, entry_id: str, fields: Dict[str, str]):
+        self.id = entry_id
+        self.log_file = fields.get("file") or ""
+        self.log_pos = int(fields.get("pos") or 0)
+        self.schema = fields.get("schema") or ""
+        self.table = fields.get("table") or ""
+        self.op = fields.get("op") or ""
+        self.rows = decode_rows(fields.get("rows"))
+        self.query = fields.get("query") or ""
+
+
+class ChangeStreamConsumer:
+    """
+    以 consumer group（每个任务/分片一个 group）读取实例 Stream。
+    已处理位点之前的条目直接跳过；检测到断档时抛 ChangeStreamGap。
+    """
+
+    def __init__(self, key: str, group: str, consumer: str, log_file: Optional[str], log_pos: Optional[int]):
+        self.r = _client()
+        self.stream = stream_key(key)
+        self.group = group
+        self.consumer = consumer
+        self._last = pos_tuple(log_file, log_pos) if log_file else None
+        self._unacked: List[str] = []
+        self._pending_first = True
+        try:
+            self.r.xgroup_create(self.stream, group, id="0" if log_file else "$", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def read(self, count: int, block_ms: int) -> List[ChangeEntry]:
+        # 先取回本 consumer 上次未 ack 的条目，再读新条目
+        start_id = "0" if self._pending_first else ">"
+        resp = self.r.xreadgroup(
+            self.group, self.consumer, {self.stream: start_id}, count=count, block=None if self._pending_first else block_ms
+        )
+        batch = resp[0][1] if resp else []
+        if self._pending_first and not batch:
+            self._pending_first = False
+            return self.read(count, block_ms)
+
+        out: List[ChangeEntry] = []
+        for entry_id, fields in batch:
+            self._unacked.append(entry_id)
+            if not fields:
+                continue
+            cur = pos_tuple(fields.get("file"), fields.get("pos"))
+            if self._last is not None:
+                if cur <= self._last:
+                    continue
+                prev = pos_tuple(fields.get("pf"), fields.get("pp"))
+                if prev > self._last:
+                    raise ChangeStreamGap(
+                        f"stream gap: checkpoint={self._last} first_available_prev={fields.get('pf')}:{fields.get('pp')}"
+                    )
+            self._last = cur
+            out.append(ChangeEntry(entry_id, fields))
+        return out
+
+    def ack_all(self):
+        if not self._unacked:
+            return
+        ids, self._unacked = self._unacked, []
+        try:
+            self.r.xack(self.stream, self.group, *ids)
+        except Exception:
+            self._unacked = ids + self._unacked
+
+    def reset_group(self):
+        """断档后删除 group，下次订阅按 checkpoint 重新建组。"""
+        try:
+            self.r.xgroup_destroy(self.stream, self.group)
+        except Exception:
+            pass
+
+
+def group_lag(mysql_settings: dict, group: str) -> Optional[int]:
+    """Stream 中尚未投递给 group 的条目数（Redis 7+ 的 XINFO GROUPS lag；不可用时返回 None）。"""
+    try:
+        for g in _client().xinfo_groups(stream_key(instance_key(mysql_settings))):
+            if g.get("name") == group:
+                lag = g.get("lag")
+                return int(lag) if lag is not None else None
+    except Exception:
+        return None
+    return None
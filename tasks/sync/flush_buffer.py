@@ -57,6 +57,10 @@ class FlushBuffer:
         with self._lock:
             return len(self._pending.get(coll_name, []))
 
+    def total_size(self) -> int:
+        with self._lock:
+            return sum(len(ops) for ops in self._pending.values())
+
     def flush(self, force: bool = False):
         now = time.time()
         if (not force) and (now - self._last_flush_ts < self.flush_interval_sec):
@@ -5,6 +5,7 @@ from typing import Dict, List, Optional, Any
 import pymysql
 from core.logging import log
 from .convert import Converter
+from .schema_change import DEFAULT_SHADOW_TABLE_PATTERN, is_shadow_table
 
 
 class MySQLIntrospector:
@@ -17,6 +18,7 @@ class MySQLIntrospector:
         unknown_col_schema_cache_sec: int,
         auto_discover_only_base_table: bool,
         converter,  # Converter，用于 convert_value
+        shadow_table_pattern: Optional[str] = DEFAULT_SHADOW_TABLE_PATTERN,
     ):
         self.task_id = task_id
         self.mysql_settings = mysql_settings
@@ -26,6 +28,7 @@ class MySQLIntrospector:
         self.unknown_col_schema_cache_sec = unknown_col_schema_cache_sec
         self.auto_discover_only_base_table = auto_discover_only_base_table
         self.converter = converter
+        self.shadow_table_pattern = shadow_table_pattern
 
         self._table_columns_cache: Dict[str, List[str]] = {}
         self._table_columns_cache_ts: Dict[str, float] = {}
@@ -33,6 +36,19 @@ class MySQLIntrospector:
         self._pk_by_table: Dict[str, str] = {}
         self._pk_index_by_table: Dict[str, int] = {}
 
+    def is_shadow_table(self, table: str) -> bool:
+        return is_shadow_table(table, self.shadow_table_pattern)
+
+    def invalidate_table(self, table: str):
+        """表结构可能变化（新表 / rename cut-over）后丢弃该表的列和主键缓存"""
+        self._table_columns_cache.pop(table, None)
+        self._table_columns_cache_ts.pop(table, None)
+        self._pk_index_cache.pop(table, None)
+        self._pk_by_table.pop(table, None)
+        for k in list(self._pk_index_by_table.keys()):
+            if k.startswith(f"{table}:"):
+                self._pk_index_by_table.pop(k, None)
+
     def get_effective_pk(self, table: str) -> str:
         if table in self._pk_by_table:
             return self._pk_by_table[table]
@@ -70,13 +86,19 @@ class MySQLIntrospector:
             with conn.cursor() as c:
                 if self.auto_discover_only_base_table:
                     c.execute("SHOW FULL TABLES WHERE Table_type='BASE TABLE'")
-                    rows = c.fetchall()
-                    log(self.task_id, f"Introspector list_tables(BASE): found {len(rows)} tables")
-                    return [r[0] for r in rows]
-                c.execute("SHOW TABLES")
-                rows = c.fetchall()
-                log(self.task_id, f"Introspector list_tables(ALL): found {len(rows)} tables")
-                return [r[0] for r in rows]
+                    kind = "BASE"
+                else:
+                    c.execute("SHOW TABLES")
+                    kind = "ALL"
+                names = [r[0] for r in c.fetchall()]
+                tables = [t for t in names if not self.is_shadow_table(t)]
+                skipped = len(names) - len(tables)
+                log(
+                    self.task_id,
+                    f"Introspector list_tables({kind}): found {len(tables)} tables"
+                    + (f" (skipped {skipped} shadow tables)" if skipped else ""),
+                )
+                return tables
         except Exception as e:
             log(self.task_id, f"Introspector list_tables failed: {e}")
             raise
@@ -204,13 +226,7 @@ class MySQLIntrospector:
                 if t not in table_map:
                     table_map[t] = t + collection_suffix
                     added += 1
-                    self._table_columns_cache.pop(t, None)
-                    self._table_columns_cache_ts.pop(t, None)
-                    self._pk_index_cache.pop(t, None)
-                    self._pk_by_table.pop(t, None)
-                    for k in list(self._pk_index_by_table.keys()):
-                        if k.startswith(f"{t}:"):
-                            self._pk_index_by_table.pop(k, None)
+                    self.invalidate_table(t)
             last_refresh_ts_holder["ts"] = now
             if added > 0:
                 log(self.task_id, f"Discovered new tables={added} reason={reason}")
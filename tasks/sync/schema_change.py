@@ -0,0 +1,92 @@
+# app/sync/schema_change.py
+"""
+Online schema change（gh-ost / pt-online-schema-change）相关的识别：
+- 影子表：gh-ost 的 _t_gho/_t_ghc/_t_del，pt-osc 的 _t_new/_t_old，不应被自动发现和同步
+- cut-over 的 RENAME TABLE：从 binlog QueryEvent 解析出 (旧名, 新名) 序列
+"""
+import re
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+DEFAULT_SHADOW_TABLE_PATTERN = r"^_.+_(gho|ghc|del|new|old)$"
+
+_IDENT = r"(?:`(?:[^`]|``)+`|[A-Za-z0-9_$]+)"
+_QNAME = rf"({_IDENT}(?:\s*\.\s*{_IDENT})?)"
+_RENAME_TABLE_RE = re.compile(r"^\s*RENAME\s+TABLES?\s+(.+?)\s*;?\s*$", re.IGNORECASE | re.DOTALL)
+_RENAME_PAIR_RE = re.compile(rf"^\s*{_QNAME}\s+TO\s+{_QNAME}\s*$", re.IGNORECASE)
+_ALTER_RENAME_RE = re.compile(
+    rf"^\s*ALTER\s+(?:ONLINE\s+|IGNORE\s+)?TABLE\s+{_QNAME}\s+(?:.*,\s*)?RENAME\s+(?:TO\s+|AS\s+)?{_QNAME}\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+_COMMENT_RE = re.compile(r"/\*.*?\*/", re.DOTALL)
+
+
+@lru_cache(maxsize=16)
+def _compile(pattern: str):
+    return re.compile(pattern)
+
+
+def is_shadow_table(table: str, pattern: Optional[str] = DEFAULT_SHADOW_TABLE_PATTERN) -> bool:
+    if not pattern or not table:
+        return False
+    try:
+        return bool(_compile(pattern).match(table))
+    except re.error:
+        return False
+
+
+def _split_name(qname: str) -> Tuple[Optional[str], str]:
+    parts = [p.strip() for p in re.findall(_IDENT, qname)]
+    parts = [p[1:-1].replace("``", "`") if p.startswith("`") else p for p in parts]
+    if len(parts) >= 2:
+        return parts[0], parts[1]
+    return None, parts[0]
+
+
+def _split_pairs(body: str) -> List[str]:
+    out, cur, in_quote = [], [], False
+    for ch in body:
+        if ch == "`":
+            in_quote = not in_quote
+        if ch == "," and not in_quote:
+            out.append("".join(cur))
+            cur = []
+        else:
+            cur.append(ch)
+    out.append("".join(cur))
+    return out
+
+
+def looks_like_rename(query: str) -> bool:
+    """便宜的预筛：ROW 格式下每个事务都有一条 BEGIN QueryEvent。"""
+    return bool(query) and len(query) > 12 and "RENAME" in query.upper()
+
+
+def parse_renames(query: str, default_schema: Optional[str] = None) -> List[Tuple[Optional[str], str, Optional[str], str]]:
+    """
+    解析 RENAME TABLE a TO b[, c TO d] / ALTER TABLE a ... RENAME [TO|AS] b。
+    返回 [(src_schema, src_table, dst_schema, dst_table)]，未限定库名时用 default_schema。
+    非重命名语句返回 []。
+    """
+    if not looks_like_rename(query):
+        return []
+    q = _COMMENT_RE.sub(" ", query).strip()
+    pairs: List[Tuple[Optional[str], str, Optional[str], str]] = []
+
+    m = _RENAME_TABLE_RE.match(q)
+    if m:
+        for part in _split_pairs(m.group(1)):
+            pm = _RENAME_PAIR_RE.match(part)
+            if not pm:
+                return []
+            ss, st = _split_name(pm.group(1))
+            ds, dt = _split_name(pm.group(2))
+            pairs.append((ss or default_schema, st, ds or default_schema, dt))
+        return pairs
+
+    m = _ALTER_RENAME_RE.match(q)
+    if m:
+        ss, st = _split_name(m.group(1))
+        ds, dt = _split_name(m.group(2))
+        pairs.append((ss or default_schema, st, ds or default_schema, dt))
+    return pairs
@@ -1,11 +1,12 @@
+import glob
 import threading
 from typing import Dict, List, Any
 import os
 
 from tasks.schemas import SyncTaskRequest
 from tasks.models import SyncTask
-from tasks.utils import save_task_config, delete_task_config
-from core.logging import log
+from tasks.utils import save_task_config, delete_task_config, delete_checkpoints, checkpoint_metrics, load_state
+from core.logging import log, close_task_log
 from .worker import SyncWorker
 
 class TaskManager:
@@ -88,9 +89,12 @@ class TaskManager:
         self.stop(task_id)
         delete_task_config(task_id)
         # delete logs?
+        close_task_log(task_id)
         lp = os.path.join("logs", f"{task_id}.log")
-        if os.path.exists(lp):
-            os.remove(lp)
+        # 连同轮转出的 {task_id}.log.1..N
+        for p in [lp] + glob.glob(glob.escape(lp) + ".*"):
+            if os.path.exists(p):
+                os.remove(p)
         log(task_id, "Task deleted")
 
     def reset(self, task_id: str):
@@ -100,6 +104,7 @@ class TaskManager:
             t.save()
         except SyncTask.DoesNotExist:
             pass
+        delete_checkpoints(task_id)
         log(task_id, "Task reset (state cleared)")
 
     def list_tasks(self) -> List[str]:
@@ -115,13 +120,14 @@ class TaskManager:
         
         # Merge with DB tasks that are not running
         running_ids = set(t['task_id'] for t in res)
+        live_metrics = checkpoint_metrics()
         db_tasks = SyncTask.objects.all()
         for t in db_tasks:
             if t.task_id not in running_ids:
                 res.append({
                     "task_id": t.task_id,
                     "status": "stopped",
-                    "metrics": t.state.get("metrics", {}),
+                    "metrics": live_metrics.get(t.task_id) or t.state.get("metrics", {}),
                     "config": {} # Populate if needed
                 })
         return res
@@ -139,7 +145,7 @@ class TaskManager:
             return {
                 "task_id": t.task_id,
                 "status": "stopped",
-                "metrics": t.state.get("metrics", {}),
+                "metrics": load_state(task_id).get("metrics", {}),
                 "config": {} 
             }
         except SyncTask.DoesNotExist:
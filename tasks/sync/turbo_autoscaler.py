@@ -0,0 +1,284 @@
+# app/sync/turbo_autoscaler.py
+"""
+Turbo 分片数自动扩缩容：按积压（binlog 落后字节、change stream 未消费条数、全量 ETA）
+在 1/2/4/8 之间选择分片数，并通过 checkpoint 交接把表重新分配到新分片。
+
+Env：
+  SYNC_AUTOSCALE_BYTES_PER_SHARD — 每个分片可承担的 binlog 落后字节（默认 256MB）
+  SYNC_AUTOSCALE_STREAM_PER_SHARD — 每个分片可承担的 stream 未消费条数（默认 200000）
+  SYNC_AUTOSCALE_TARGET_ETA_SEC — 全量同步目标完成时间（默认 1800）
+  SYNC_AUTOSCALE_ROWS_PER_SEC — 单分片全量速度的初始估计（默认 20000 行/秒）
+  SYNC_AUTOSCALE_COOLDOWN_SEC — 两次扩缩容的最小间隔（默认 300）
+  SYNC_AUTOSCALE_STOP_TIMEOUT_SEC — 交接时等待旧 pod 优雅退出的时间（默认 120）
+
+交接流程：优雅停止旧 pod → 合并 checkpoint → 新分片都从旧位点最小值开始读，
+每张表跳过其旧 owner 已处理的事件（worker._owns_event）。全量阶段不做交接：所有分片都还在全量
+且按新宽度从头重跑更快时清空分片 checkpoint、以新宽度重启（全量本身是 upsert，可重跑）。
+"""
+import math
+import os
+import time
+from typing import Dict, List, Optional
+
+import pymysql
+from django.utils import timezone
+
+from core.logging import log
+from tasks.models import SyncTask
+from tasks.schemas import SyncTaskRequest
+from tasks.utils import compact_checkpoints, load_state, replace_shard_states
+from .change_capture import cdc_configured, group_lag, pos_tuple
+from .turbo_runner import TurboPodRunner
+
+SHARD_CHOICES = (1, 2, 4, 8)
+_COUNTER_KEYS = ("processed_count", "full_insert_count", "inc_insert_count", "update_count", "delete_count")
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _shards_for(load: float) -> int:
+    """load = 积压 / 单分片容量；取能覆盖的最小 2 的幂。"""
+    need = max(1, int(math.ceil(load)))
+    for n in SHARD_CHOICES:
+        if n >= need:
+            return n
+    return SHARD_CHOICES[-1]
+
+
+def _clamp(n: int, task: SyncTask) -> int:
+    lo = max(1, int(task.turbo_min_shards or 1))
+    hi = max(lo, int(task.turbo_max_shards or 8))
+    choices = [c for c in SHARD_CHOICES if lo <= c <= hi] or [1]
+    for c in choices:
+        if c >= n:
+            return c
+    return choices[-1]
+
+
+class TurboAutoscaler:
+    def __init__(self, runner: Optional[TurboPodRunner] = None):
+        self.runner = runner or TurboPodRunner()
+
+    # -------------------------
+    # backlog signals
+    # -------------------------
+    def _mysql_conn(self, cfg: SyncTaskRequest):
+        kw = {
+            "host": cfg.mysql_conf.host,
+            "port": int(cfg.mysql_conf.port or 3306),
+            "user": cfg.mysql_conf.user,
+            "passwd": cfg.mysql_conf.password,
+            "charset": cfg.mysql_conf.charset,
+            "connect_timeout": int(cfg.mysql_connect_timeout or 10),
+        }
+        if cfg.mysql_conf.use_ssl:
+            kw["ssl"] = {}
+        return pymysql.connect(**kw)
+
+    def _binlog_bytes_behind(self, conn, log_file: Optional[str], log_pos: Optional[int]) -> Optional[int]:
+        if not log_file:
+            return None
+        cur = pos_tuple(log_file, 0)
+        behind = 0
+        with conn.cursor() as c:
+            c.execute("SHOW BINARY LOGS")
+            for row in c.fetchall():
+                name, size = row[0], int(row[1] or 0)
+                p = pos_tuple(name, 0)
+                if p > cur:
+                    behind += size
+                elif p == cur:
+                    behind += max(0, size - int(log_pos or 0))
+        return behind
+
+    def _table_rows(self, conn, cfg: SyncTaskRequest) -> int:
+        tables = [t for t in (cfg.table_map or {}) if t != "*"]
+        sql = "SELECT COALESCE(SUM(TABLE_ROWS), 0) FROM information_schema.TABLES WHERE TABLE_SCHEMA=%s"
+        args: List = [cfg.mysql_conf.database]
+        if tables:
+            sql += " AND TABLE_NAME IN (" + ",".join(["%s"] * len(tables)) + ")"
+            args.extend(tables)
+        with conn.cursor() as c:
+            c.execute(sql, args)
+            row = c.fetchone()
+        return int(row[0] or 0) if row else 0
+
+    def measure(self, task: SyncTask) -> dict:
+        cfg = SyncTaskRequest(**(task.config or {}))
+        total = max(1, int(task.turbo_shard_count or 1))
+        states = [load_state(task.task_id, s) or {} for s in range(total)]
+        full_sync = any((not st.get("log_file")) or (st.get("metrics") or {}).get("phase") == "full_sync" for st in states)
+
+        backlog: Dict = {"ts": time.time(), "shard_total": total, "full_sync": full_sync}
+        positions = [pos_tuple(st.get("log_file"), st.get("log_pos")) for st in states if st.get("log_file")]
+        conn = self._mysql_conn(cfg)
+        try:
+            if positions and len(positions) == total:
+                oldest = min(range(len(states)), key=lambda i: pos_tuple(states[i].get("log_file"), states[i].get("log_pos")))
+                backlog["binlog_bytes_behind"] = self._binlog_bytes_behind(
+                    conn, states[oldest].get("log_file"), states[oldest].get("log_pos")
+                )
+            if full_sync:
+                done = sum(int((st.get("metrics") or {}).get("full_insert_count") or 0) for st in states)
+                rows = self._table_rows(conn, cfg)
+                backlog["full_rows_total"] = rows
+                backlog["full_rows_done"] = done
+                prev = task.turbo_backlog or {}
+                rate = 0.0
+                if prev.get("full_sync") and prev.get("ts") and done > int(prev.get("full_rows_done") or 0):
+                    rate = (done - int(prev["full_rows_done"])) / max(1.0, backlog["ts"] - float(prev["ts"]))
+                if rate <= 0:
+                    rate = float(_env_int("SYNC_AUTOSCALE_ROWS_PER_SEC", 20000)) * total
+                backlog["full_rows_per_sec"] = round(rate, 1)
+                backlog["full_eta_sec"] = int(max(0, rows - done) / rate)
+        finally:
+            conn.close()
+
+        if cfg.change_capture_enabled and cdc_configured():
+            settings = {"host": cfg.mysql_conf.host, "port": int(cfg.mysql_conf.port or 3306)}
+            lags = [group_lag(settings, f"{task.task_id}:{s}") for s in range(total)]
+            lags = [x for x in lags if x is not None]
+            if lags:
+                backlog["stream_lag"] = max(lags)
+        return backlog
+
+    def desired_shards(self, task: SyncTask, backlog: dict) -> int:
+        total = max(1, int(task.turbo_shard_count or 1))
+        if backlog.get("full_sync"):
+            eta = float(backlog.get("full_eta_sec") or 0)
+            target = max(60, _env_int("SYNC_AUTOSCALE_TARGET_ETA_SEC", 1800))
+            return _clamp(_shards_for(total * eta / target), task)
+
+        load = 0.0
+        if backlog.get("binlog_bytes_behind") is not None:
+            per = max(1, _env_int("SYNC_AUTOSCALE_BYTES_PER_SHARD", 256 * 1024 * 1024))
+            load = max(load, float(backlog["binlog_bytes_behind"]) / per)
+        if backlog.get("stream_lag") is not None:
+            per = max(1, _env_int("SYNC_AUTOSCALE_STREAM_PER_SHARD", 200000))
+            load = max(load, float(backlog["stream_lag"]) / per)
+        want = _clamp(_shards_for(load), task)
+        # 缩容留滞回：积压降到新宽度容量的一半以下才缩
+        if want < total and load > want * 0.5:
+            want = total
+        return want
+
+    # -------------------------
+    # scaling
+    # -------------------------
+    def _cooling_down(self, task: SyncTask) -> bool:
+        if not task.turbo_scaled_at:
+            return False
+        cooldown = _env_int("SYNC_AUTOSCALE_COOLDOWN_SEC", 300)
+        return (timezone.now() - task.turbo_scaled_at).total_seconds() < cooldown
+
+    def _full_sync_restartable(self, states: List[dict], backlog: dict, total: int, want: int) -> bool:
+        """
+        所有分片都还在全量（或尚未保存位点）、没有交接，且按新宽度从头重跑的预计耗时短于当前剩余耗时。
+        已进入增量的分片不会重跑全量，换宽度后它新分到的表会缺数据，因此不能重启。
+        """
+        for st in states:
+            if st.get("handoff"):
+                return False
+            if st.get("log_file") and (st.get("metrics") or {}).get("phase") != "full_sync":
+                return False
+        rows = int(backlog.get("full_rows_total") or 0)
+        done = int(backlog.get("full_rows_done") or 0)
+        if done <= 0:
+            return True
+        # 重跑耗时 ∝ rows * total / want，继续跑耗时 ∝ rows - done（同一速度估计）
+        return rows * total / want < rows - done
+
+    def _mark_rescale(self, task: SyncTask):
+        """停 pod 之前先更新 turbo_scaled_at：旧分片 pod 退出时据此识别为交接，不把任务写成 stopped。"""
+        task.turbo_scaled_at = timezone.now()
+        task.save(update_fields=["turbo_scaled_at", "updated_at"])
+
+    def handoff(self, task: SyncTask, new_total: int) -> bool:
+        old_total = max(1, int(task.turbo_shard_count or 1))
+        log(task.task_id, f"Turbo rescale {old_total} -> {new_total}: stopping shard pods")
+        self._mark_rescale(task)
+        graceful = self.runner.stop_task_pods_gracefully(task, _env_int("SYNC_AUTOSCALE_STOP_TIMEOUT_SEC", 120))
+        if not graceful:
+            log(task.task_id, "Turbo rescale: pods force-deleted, resuming from last saved checkpoints")
+        compact_checkpoints(task.task_id)
+
+        states = [load_state(task.task_id, s) or {} for s in range(old_total)]
+        if any(not st.get("log_file") for st in states):
+            log(task.task_id, "Turbo rescale aborted: a shard has no checkpoint yet; restarting old layout")
+            self.runner.start_task_pods(task)
+            return False
+
+        start = min(states, key=lambda st: pos_tuple(st.get("log_file"), st.get("log_pos")))
+        counters = {k: sum(int((st.get("metrics") or {}).get(k) or 0) for st in states) for k in _COUNTER_KEYS}
+        handoff = {
+            "from_total": old_total,
+            "positions": {str(i): [st["log_file"], int(st.get("log_pos") or 0)] for i, st in enumerate(states)},
+        }
+        shard_states = {}
+        for k in range(new_total):
+            metrics = {"phase": "inc_sync"}
+            if k == 0:
+                metrics.update(counters)
+            shard_states[k] = {
+                "log_file": start["log_file"],
+                "log_pos": int(start.get("log_pos") or 0),
+                "metrics": metrics,
+                "handoff": handoff,
+            }
+        replace_shard_states(task.task_id, shard_states)
+
+        task.turbo_shard_count = new_total
+        task.turbo_scaled_at = timezone.now()
+        task.save(update_fields=["turbo_shard_count", "turbo_scaled_at", "updated_at"])
+        self.runner.start_task_pods(task)
+        log(task.task_id, f"Turbo rescale done shards={new_total} from={start['log_file']}:{start.get('log_pos')}")
+        return True
+
+    def tick(self, task: SyncTask) -> Optional[int]:
+        """评估一个任务；发生扩缩容时返回新分片数。"""
+        total = max(1, int(task.turbo_shard_count or 1))
+        backlog = self.measure(task)
+        want = self.desired_shards(task, backlog)
+        backlog["desired_shards"] = want
+        task.turbo_backlog = backlog
+        task.save(update_fields=["turbo_backlog", "updated_at"])
+
+        if want == total or self._cooling_down(task):
+            return None
+
+        if backlog.get("full_sync"):
+            states = [load_state(task.task_id, s) or {} for s in range(total)]
+            if not self._full_sync_restartable(states, backlog, total, want):
+                # 已有分片进入增量、有交接进行中，或重跑不划算：只记录积压
+                return None
+            # 全量阶段定宽：pod 启动后第一个 chunk 就会保存位点，所以不能只在「从未启动」时定宽；
+            # 全量重启本来就从头重跑（upsert），所有分片都还在全量且更宽重跑更快时直接按新宽度重启
+            log(task.task_id, f"Turbo initial width {total} -> {want} (full sync eta={backlog.get('full_eta_sec')}s)")
+            self._mark_rescale(task)
+            self.runner.stop_task_pods_gracefully(task, 10)
+            replace_shard_states(task.task_id, {k: {"metrics": {"phase": "full_sync"}} for k in range(want)})
+            task.turbo_shard_count = want
+            task.turbo_scaled_at = timezone.now()
+            task.save(update_fields=["turbo_shard_count", "turbo_scaled_at", "updated_at"])
+            self.runner.start_task_pods(task)
+            return want
+
+        return want if self.handoff(task, want) else None
+
+    def run_once(self, task_id: Optional[str] = None) -> Dict[str, Optional[int]]:
+        qs = SyncTask.objects.filter(turbo_enabled=True, turbo_autoscale_enabled=True, status="running")
+        if task_id:
+            qs = qs.filter(task_id=task_id)
+        out: Dict[str, Optional[int]] = {}
+        for task in qs:
+            try:
+                out[task.task_id] = self.tick(task)
+            except Exception as e:
+                log(task.task_id, f"Turbo autoscale failed: {type(e).__name__}: {str(e)[:200]}")
+                out[task.task_id] = None
+        return out
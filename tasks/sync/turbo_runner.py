@@ -1,5 +1,6 @@
 import os
 import re
+import time
 from typing import Optional, Dict
 
 from tasks.models import SyncTask
@@ -118,21 +119,40 @@ class TurboPodRunner:
         # e.g. "Running(2),Pending(1)"
         return ",".join([f"{k}({v})" for k, v in sorted(phases.items())])
 
-    def stop_task_pod(self, task: SyncTask):
+    def _list_task_pods(self, v1, ns: str, task: SyncTask):
+        selector = f"component=sync-turbo,task_id={task.task_id}"
+        return v1.list_namespaced_pod(namespace=ns, label_selector=selector).items
+
+    def stop_task_pod(self, task: SyncTask, grace_period_seconds: int = 0):
         v1 = self._get_core_api()
         ns = self._namespace_for_task(task)
-        selector = f"component=sync-turbo,task_id={task.task_id}"
-        pods = v1.list_namespaced_pod(namespace=ns, label_selector=selector).items
+        pods = self._list_task_pods(v1, ns, task)
         for p in pods:
             name = getattr(getattr(p, "metadata", None), "name", "")
             if not name:
                 continue
             try:
-                v1.delete_namespaced_pod(name=name, namespace=ns, grace_period_seconds=0)
+                v1.delete_namespaced_pod(name=name, namespace=ns, grace_period_seconds=grace_period_seconds)
             except ApiException as e:
                 if getattr(e, "status", None) != 404:
                     raise
 
+    def stop_task_pods_gracefully(self, task: SyncTask, timeout_sec: int = 120) -> bool:
+        """
+        SIGTERM all shard pods (run_sync_task flushes and compacts its checkpoint on SIGTERM)
+        and wait until they are gone. Returns False if pods had to be force-deleted.
+        """
+        v1 = self._get_core_api()
+        ns = self._namespace_for_task(task)
+        self.stop_task_pod(task, grace_period_seconds=max(1, int(timeout_sec)))
+        deadline = time.time() + timeout_sec
+        while time.time() < deadline:
+            if not self._list_task_pods(v1, ns, task):
+                return True
+            time.sleep(2)
+        self.stop_task_pod(task)
+        return False
+
     def start_task_pod(self, task: SyncTask) -> str:
         names = self.start_task_pods(task)
         return names[0] if names else ""
@@ -2,6 +2,7 @@
 import time
 import random
 import threading
+import zlib
 from typing import Optional, Dict, List, Any
 import ssl as _ssl
 from datetime import datetime as dt
@@ -16,18 +17,28 @@ from pymongo.operations import InsertOne, ReplaceOne, UpdateOne, UpdateMany
 from bson import ObjectId
 
 from pymysqlreplication import BinLogStreamReader
+from pymysqlreplication.event import QueryEvent
 from pymysqlreplication.row_event import WriteRowsEvent, UpdateRowsEvent, DeleteRowsEvent
 
 from tasks.schemas import SyncTaskRequest
 from core.logging import log
 from core.uri import build_mongo_uri
-from tasks.utils import load_state, save_state
+from tasks.utils import clear_handoff, load_state, save_state, compact_checkpoints, rename_table_map_entry
 from .convert import Converter
 from .mongo_writer import MongoWriter
 from .mysql_introspector import MySQLIntrospector
 from .flush_buffer import FlushBuffer
+from .schema_change import parse_renames
 from queue import Queue
 from .rate_limiter import RateLimiter
+from .change_capture import (
+    ChangeStreamConsumer,
+    ChangeStreamGap,
+    capture_hub,
+    cdc_configured,
+    pos_tuple,
+    row_event_op,
+)
 
 
 class SyncWorker:
@@ -50,59 +61,10 @@ class SyncWorker:
             "write_timeout": int(cfg.mysql_write_timeout or 60),
         }
 
-        if cfg.mysql_conf.use_ssl:
-            ssl_args = {}
-            # If explicit certs provided, use them
-            if cfg.mysql_conf.ssl_ca:
-                ssl_args["ca"] = cfg.mysql_conf.ssl_ca
-            if cfg.mysql_conf.ssl_cert:
-                ssl_args["cert"] = cfg.mysql_conf.ssl_cert
-            if cfg.mysql_conf.ssl_key:
-                ssl_args["key"] = cfg.mysql_conf.ssl_key
-            # If no certs provided, enable TLS without verification (server enforces secure transport)
-            if not ssl_args:
-                ssl_args = {}
-            self.mysql_settings["ssl"] = ssl_args
-        else:
-            try:
-                _kw = {k: v for k, v in self.mysql_settings.items() if k != "cursorclass"}
-                c = pymysql.connect(**_kw)
-                c.close()
-            except Exception as e:
-                s = str(e)
-                if ("require_secure_transport" in s) or ("3159" in s) or ("Bad handshake" in s) or ("1043" in s):
-                    self.mysql_settings["ssl"] = {}
-        # Final fallback: ensure TLS handshake succeeds
-        try:
-            _kw = {k: v for k, v in self.mysql_settings.items() if k != "cursorclass"}
-            c = pymysql.connect(**_kw)
-            c.close()
-        except Exception as e1:
-            msg = str(e1)
-            if ("require_secure_transport" in msg) or ("3159" in msg) or ("Bad handshake" in msg) or ("1043" in msg):
-                for ssl_opt in ({}, {"fake_flag_to_enable_tls": True}, {"check_hostname": False, "verify_mode": _ssl.CERT_NONE}):
-                    try:
-                        self.mysql_settings["ssl"] = ssl_opt
-                        _kw = {k: v for k, v in self.mysql_settings.items() if k != "cursorclass"}
-                        c = pymysql.connect(**_kw)
-                        c.close()
-                        break
-                    except Exception:
-                        continue
+        self._probe_mysql_tls()
 
         # --- mongo ---
-        mongo_uri = build_mongo_uri(cfg.mongo_conf)
-        self.mongo = MongoClient(
-            mongo_uri,
-            maxPoolSize=int(cfg.mongo_max_pool_size or 50),
-            minPoolSize=0,
-            connect=False,
-            retryWrites=True,
-            socketTimeoutMS=int(cfg.mongo_socket_timeout_ms or 20000),
-            connectTimeoutMS=int(cfg.mongo_connect_timeout_ms or 10000),
-            compressors=cfg.mongo_compressors or None,
-        )
-        self.mongo_db = self.mongo[cfg.mongo_conf.database or "sync_db"]
+        self.mongo_db = self._connect_mongo()
 
         # --- helper objects ---
         self.converter = Converter(cfg.pk_field, cfg.use_pk_as_mongo_id, dec_scale=18)
@@ -114,9 +76,16 @@ class SyncWorker:
             unknown_col_schema_cache_sec=cfg.unknown_col_schema_cache_sec,
             auto_discover_only_base_table=cfg.auto_discover_only_base_table,
             converter=self.converter,
+            shadow_table_pattern=cfg.shadow_table_pattern,
         )
         self.mongo_writer = MongoWriter(cfg.task_id, self.stop_event)
         self.rate = RateLimiter(cfg)
+        self._shard_index = int(cfg.shard_index or 0)
+        self._shard_total = max(1, int(cfg.shard_total or 1))
+        # 扩缩容交接：{旧分片序号: 旧分片已处理位点}，见 _load_handoff
+        self._handoff_total = 0
+        self._handoff_pos: Dict[int, tuple] = {}
+        self._handoff_max: Optional[tuple] = None
 
         self._last_state_save_ts = 0.0
         self._last_progress_ts = 0.0
@@ -141,6 +110,63 @@ class SyncWorker:
             "delete_count": 0
         }
 
+    def _probe_mysql_tls(self):
+        """探测 MySQL 是否要求 TLS，并据此补上 mysql_settings["ssl"]。"""
+        if self.cfg.mysql_conf.use_ssl:
+            ssl_args = {}
+            # If explicit certs provided, use them
+            if self.cfg.mysql_conf.ssl_ca:
+                ssl_args["ca"] = self.cfg.mysql_conf.ssl_ca
+            if self.cfg.mysql_conf.ssl_cert:
+                ssl_args["cert"] = self.cfg.mysql_conf.ssl_cert
+            if self.cfg.mysql_conf.ssl_key:
+                ssl_args["key"] = self.cfg.mysql_conf.ssl_key
+            # If no certs provided, enable TLS without verification (server enforces secure transport)
+            if not ssl_args:
+                ssl_args = {}
+            self.mysql_settings["ssl"] = ssl_args
+        else:
+            try:
+                _kw = {k: v for k, v in self.mysql_settings.items() if k != "cursorclass"}
+                c = pymysql.connect(**_kw)
+                c.close()
+            except Exception as e:
+                s = str(e)
+                if ("require_secure_transport" in s) or ("3159" in s) or ("Bad handshake" in s) or ("1043" in s):
+                    self.mysql_settings["ssl"] = {}
+        # Final fallback: ensure TLS handshake succeeds
+        try:
+            _kw = {k: v for k, v in self.mysql_settings.items() if k != "cursorclass"}
+            c = pymysql.connect(**_kw)
+            c.close()
+        except Exception as e1:
+            msg = str(e1)
+            if ("require_secure_transport" in msg) or ("3159" in msg) or ("Bad handshake" in msg) or ("1043" in msg):
+                for ssl_opt in ({}, {"fake_flag_to_enable_tls": True}, {"check_hostname": False, "verify_mode": _ssl.CERT_NONE}):
+                    try:
+                        self.mysql_settings["ssl"] = ssl_opt
+                        _kw = {k: v for k, v in self.mysql_settings.items() if k != "cursorclass"}
+                        c = pymysql.connect(**_kw)
+                        c.close()
+                        break
+                    except Exception:
+                        continue
+
+    def _connect_mongo(self):
+        # connect=False：首次操作时才建连
+        mongo_uri = build_mongo_uri(self.cfg.mongo_conf)
+        self.mongo = MongoClient(
+            mongo_uri,
+            maxPoolSize=int(self.cfg.mongo_max_pool_size or 50),
+            minPoolSize=0,
+            connect=False,
+            retryWrites=True,
+            socketTimeoutMS=int(self.cfg.mongo_socket_timeout_ms or 20000),
+            connectTimeoutMS=int(self.cfg.mongo_connect_timeout_ms or 10000),
+            compressors=self.cfg.mongo_compressors or None,
+        )
+        return self.mongo[self.cfg.mongo_conf.database or "sync_db"]
+
     def get_status(self) -> Dict[str, Any]:
         return {
             "task_id": self.cfg.task_id,
@@ -169,9 +195,49 @@ class SyncWorker:
         interval = max(1, int(self.cfg.state_save_interval_sec or 2))
         if now - self._last_state_save_ts >= interval:
             if log_file and log_pos:
-                save_state(self.cfg.task_id, log_file, log_pos, self._metrics)
+                save_state(self.cfg.task_id, log_file, log_pos, self._metrics, shard=self._shard_index)
             self._last_state_save_ts = now
 
+    def _owns_table(self, table: str) -> bool:
+        if self._shard_total <= 1:
+            return True
+        return zlib.crc32((table or "").encode("utf-8")) % self._shard_total == self._shard_index
+
+    def _load_handoff(self, state: dict):
+        """
+        state["handoff"] = {"from_total": n, "positions": {"<old shard>": [log_file, log_pos]}}
+        新分片从所有旧位点的最小值开始读，每张表跳过其旧 owner 已处理过的事件。
+        """
+        ho = (state or {}).get("handoff") or {}
+        try:
+            total = int(ho.get("from_total") or 0)
+            positions = {int(k): pos_tuple(v[0], v[1]) for k, v in (ho.get("positions") or {}).items() if v and v[0]}
+        except Exception:
+            total, positions = 0, {}
+        if total <= 0 or not positions:
+            return
+        self._handoff_total = total
+        self._handoff_pos = positions
+        self._handoff_max = max(positions.values())
+        log(self.cfg.task_id, f"Shard handoff from_total={total} -> {self._shard_total} skip_until={self._handoff_max}")
+
+    def _owns_event(self, table: str, log_file: Optional[str], log_pos: Optional[int]) -> bool:
+        if not self._owns_table(table):
+            return False
+        if self._handoff_max is None:
+            return True
+        cur = pos_tuple(log_file, log_pos)
+        if cur > self._handoff_max:
+            self._handoff_max = None
+            self._handoff_pos = {}
+            # 已越过所有旧位点：重启后不再需要交接信息
+            clear_handoff(self.cfg.task_id, self._shard_index)
+            log(self.cfg.task_id, f"Shard handoff complete at {log_file}:{log_pos}")
+            return True
+        old_owner = zlib.crc32((table or "").encode("utf-8")) % self._handoff_total
+        done = self._handoff_pos.get(old_owner)
+        return done is None or cur > done
+
     def _maybe_progress_log(self, msg: str):
         now = time.time()
         interval = max(1, int(self.cfg.progress_interval or 10))
@@ -215,7 +281,8 @@ class SyncWorker:
         self._status = "running"
         try:
             self._auto_build_table_map_if_needed()
-            state = load_state(self.cfg.task_id)
+            state = load_state(self.cfg.task_id, self._shard_index)
+            self._load_handoff(state)
 
             if not state or state.get("metrics", {}).get("phase") == "full_sync":
                 # Check if specific binlog position provided in config
@@ -242,6 +309,8 @@ class SyncWorker:
             self._status = "error"
             self._metrics["error"] = str(e)
             log(self.cfg.task_id, f"CRASH {type(e).__name__}: {str(e)[:300]}")
+        finally:
+            compact_checkpoints(self.cfg.task_id, self._shard_index)
 
     def do_full_sync(self):
         """
@@ -278,6 +347,8 @@ class SyncWorker:
                 for table, coll_name in self.cfg.table_map.items():
                     if self.stop_event.is_set():
                         break
+                    if not self._owns_table(table):
+                        continue
 
                     coll = self.mongo_db.get_collection(coll_name, write_concern=write_concern)
                     
@@ -409,18 +480,31 @@ class SyncWorker:
         backoff = float(self.cfg.inc_reconnect_backoff_base_sec or 1.0)
         backoff_max = float(self.cfg.inc_reconnect_backoff_max_sec or 30.0)
 
-        state = load_state(self.cfg.task_id) or {}
+        state = load_state(self.cfg.task_id, self._shard_index) or {}
         cur_log_file = log_file or state.get("log_file")
         cur_log_pos = log_pos or state.get("log_pos")
 
+        use_stream = bool(self.cfg.change_capture_enabled) and cdc_configured()
+
         while not self.stop_event.is_set():
             try:
-                self.do_inc_sync_once(cur_log_file, cur_log_pos)
+                if use_stream:
+                    self.do_inc_sync_from_stream(cur_log_file, cur_log_pos)
+                else:
+                    self.do_inc_sync_once(cur_log_file, cur_log_pos)
                 break
+            except ChangeStreamGap as e:
+                # Stream 已裁剪到 checkpoint 之后：回退为直连 binlog，从自己的 checkpoint 续读
+                use_stream = False
+                state = load_state(self.cfg.task_id, self._shard_index) or {}
+                cur_log_file = state.get("log_file", cur_log_file)
+                cur_log_pos = state.get("log_pos", cur_log_pos)
+                log(self.cfg.task_id, f"Change stream gap, falling back to direct binlog: {str(e)[:200]}")
+                continue
             except MySQLOperationalError as e:
                 # Treat operational errors (connection lost) as retriable
                 retry += 1
-                state = load_state(self.cfg.task_id) or {}
+                state = load_state(self.cfg.task_id, self._shard_index) or {}
                 cur_log_file = state.get("log_file", cur_log_file)
                 cur_log_pos = state.get("log_pos", cur_log_pos)
                 log(self.cfg.task_id, f"MySQL OpErr. retry={retry} err={str(e)[:200]}")
@@ -439,7 +523,7 @@ class SyncWorker:
                     break
                 
                 retry += 1
-                state = load_state(self.cfg.task_id) or {}
+                state = load_state(self.cfg.task_id, self._shard_index) or {}
                 cur_log_file = state.get("log_file", cur_log_file)
                 cur_log_pos = state.get("log_pos", cur_log_pos)
                 log(self.cfg.task_id, f"IncSync crash. retry={retry} {type(e).__name__}: {str(e)[:200]}")
@@ -455,6 +539,192 @@ class SyncWorker:
             time.sleep(sleep_sec)
             backoff = min(backoff_max, backoff * 2)
 
+    def _inc_write_concern(self) -> WriteConcern:
+        return WriteConcern(w=int(self.cfg.mongo_write_w or 1), j=bool(self.cfg.mongo_write_j))
+
+    def _make_inc_buffer(self, write_concern: WriteConcern, on_flush_done) -> FlushBuffer:
+        inc_batch = int(self.cfg.inc_flush_batch or 2000)
+        flush_interval = max(1, int(self.cfg.inc_flush_interval_sec or 2))
+
+        def writer_func(coll_name: str, ops: List):
+            coll = self.mongo_db.get_collection(coll_name, write_concern=write_concern)
+            _s = time.time()
+            self.mongo_writer.safe_bulk_write(coll, ops, table="*", coll_name=coll_name)
+            self.rate.update_write_stats(time.time() - _s, len(ops))
+            self.rate.sleep_if_needed()
+
+        return FlushBuffer(
+            batch_size=inc_batch,
+            flush_interval_sec=flush_interval,
+            writer_func=writer_func,
+            on_flush_done=on_flush_done,
+            stop_event=self.stop_event,
+        )
+
+    def _update_processed_count(self):
+        try:
+            self._metrics["processed_count"] = (
+                int(self._metrics.get("full_insert_count") or 0)
+                + int(self._metrics.get("inc_insert_count") or 0)
+                + int(self._metrics.get("update_count") or 0)
+                + int(self._metrics.get("delete_count") or 0)
+            )
+        except Exception:
+            pass
+
+    def _apply_row_event(self, buf: FlushBuffer, op: str, table: str, rows: List[dict]):
+        """
+        把一个已解码的行事件（insert/update/delete）转换成 Mongo 操作放入 buf。
+        binlog 直连与 change capture 流两种来源共用。
+        """
+        if op == "update" and self.cfg.insert_only:
+            return
+        if op == "delete" and not self.cfg.handle_deletes:
+            return
+
+        if table not in self.cfg.table_map:
+            if self.mysql_introspector.is_shadow_table(table):
+                return
+            self._maybe_refresh_table_map(reason=f"unknown:{table}")
+            if table not in self.cfg.table_map:
+                return
+
+        coll_name = self.cfg.table_map[table]
+        rows = rows or []
+
+        # ---------------- Insert: base upsert ----------------
+        if op == "insert":
+            self._metrics["inc_insert_count"] += max(1, len(rows))
+            for row in rows:
+                data = row.get("values")
+                data = self.mysql_introspector.maybe_fix_row_unknown_cols(table, data)
+                if not data:
+                    continue
+
+                doc = self.converter.row_to_base_doc(data)
+                if self.cfg.use_pk_as_mongo_id:
+                    pk_val = self.mysql_introspector.extract_pk(table, data)
+                    if pk_val is not None:
+                        doc["_id"] = pk_val
+                        buf.add(coll_name, ReplaceOne({"_id": doc["_id"]}, doc, upsert=True))
+                    else:
+                        buf.add(coll_name, InsertOne(doc))
+                else:
+                    buf.add(coll_name, InsertOne(doc))
+
+        # ---------------- Update: new version doc ----------------
+        elif op == "update":
+            self._metrics["update_count"] += max(1, len(rows))
+            for row in rows:
+                data = row.get("after_values")
+                data = self.mysql_introspector.maybe_fix_row_unknown_cols(table, data)
+                if not data:
+                    continue
+
+                pk_val = self.mysql_introspector.extract_pk(table, data)
+                if pk_val is None:
+                    log(self.cfg.task_id, f"Update skipped (no pk) table={table} keys={list(data.keys())[:8]}")
+                    continue
+
+                base_id = pk_val  # use_pk_as_mongo_id 下 base _id=pk
+                if self.cfg.handle_updates_as_insert and not self.cfg.update_insert_new_doc:
+                    # 兼容旧配置：update 当 insert（不推荐）
+                    doc = self.converter.row_to_base_doc(data)
+                    buf.add(coll_name, InsertOne(doc))
+                else:
+                    if self.cfg.update_insert_new_doc:
+                        vdoc = self.converter.row_to_version_doc(data, pk_val=pk_val, base_id=base_id)
+                        buf.add(coll_name, InsertOne(vdoc))
+                    else:
+                        doc = self.converter.row_to_base_doc(data)
+                        if self.cfg.use_pk_as_mongo_id and "_id" in doc:
+                            buf.add(coll_name, ReplaceOne({"_id": doc["_id"]}, doc, upsert=True))
+                        else:
+                            # _id 保持 ObjectId，按 id 字段定位并原地更新（镜像模式）
+                            pk_field = self.cfg.pk_field
+                            buf.add(
+                                coll_name,
+                                UpdateOne(
+                                    {pk_field: pk_val},
+                                    {
+                                        "$set": doc,
+                                        "$setOnInsert": {"_id": ObjectId()},
+                                        "$unset": {"_is_version": "", "_op": "", "_base_id": "", "_ts": ""},
+                                    },
+                                    upsert=True,
+                                ),
+                            )
+
+        # ---------------- Delete: soft mark base doc only ----------------
+        elif op == "delete":
+            self._metrics["delete_count"] += max(1, len(rows))
+            for row in rows:
+                data = row.get("values")
+                data = self.mysql_introspector.maybe_fix_row_unknown_cols(table, data)
+                if not data:
+                    continue
+
+                pk_val = self.mysql_introspector.extract_pk(table, data)
+                if pk_val is None:
+                    log(self.cfg.task_id, f"Delete skipped (no pk) table={table} keys={list(data.keys())[:8]}")
+                    continue
+
+                if self.cfg.delete_append_new_doc:
+                    vdoc = self.converter.row_to_delete_doc(data, pk_val=pk_val, base_id=pk_val)
+                    buf.add(coll_name, InsertOne(vdoc))
+                else:
+                    set_doc = {
+                        self.cfg.delete_flag_field: True,
+                        self.cfg.delete_time_field: dt.utcnow(),
+                        "_op": "delete",
+                        "_ts": dt.utcnow(),
+                    }
+                    if self.cfg.delete_mark_only_base_doc:
+                        buf.add(
+                            coll_name,
+                            UpdateOne({"_id": pk_val}, {"$set": set_doc}, upsert=self.cfg.delete_upsert_tombstone),
+                        )
+                    else:
+                        buf.add(coll_name, UpdateMany({self.cfg.pk_field: pk_val}, {"$set": set_doc}, upsert=False))
+                        buf.add(
+                            coll_name,
+                            UpdateOne({"_id": pk_val}, {"$set": set_doc}, upsert=self.cfg.delete_upsert_tombstone),
+                        )
+
+    def _handle_schema_query(self, query: str, schema: Optional[str]):
+        """
+        识别 RENAME TABLE（含 gh-ost / pt-osc cut-over），就地调整 table_map，不触发重新全量：
+        - x -> 影子表：原表被挪开，映射不变
+        - 影子表 -> x：cut-over 完成，集合不变，只丢弃 x 的结构缓存
+        - 普通改名 a -> b：集合沿用 a 的映射
+        """
+        pairs = parse_renames(query, schema)
+        if not pairs:
+            return
+        database = self.cfg.mysql_conf.database
+        table_map = self.cfg.table_map
+        renamed = []
+        for src_db, src, dst_db, dst in pairs:
+            if database and ((src_db and src_db != database) or (dst_db and dst_db != database)):
+                continue
+            self.mysql_introspector.invalidate_table(src)
+            self.mysql_introspector.invalidate_table(dst)
+            if self.mysql_introspector.is_shadow_table(dst):
+                log(self.cfg.task_id, f"Schema change: {src} moved aside to {dst}, mapping kept")
+                continue
+            if self.mysql_introspector.is_shadow_table(src):
+                log(self.cfg.task_id, f"Schema change cut-over: {src} -> {dst}, collection={table_map.get(dst)}")
+                continue
+            if src in table_map:
+                coll = table_map.pop(src)
+                table_map.setdefault(dst, coll)
+                renamed.append((src, dst))
+                log(self.cfg.task_id, f"Table renamed {src} -> {dst}, collection={table_map[dst]}")
+        # 只有显式配置的 table_map 需要落库；自动发现模式下改名只保留在内存中
+        if renamed and self._shard_index == 0 and not self._auto_mode:
+            for src, dst in renamed:
+                rename_table_map_entry(self.cfg.task_id, src, dst)
+
     def do_inc_sync_once(self, log_file, log_pos):
         """
         增量语义（按你需求）：
@@ -463,9 +733,9 @@ class SyncWorker:
         - DELETE：只给 base 打删除标识（软删除）
         并且定时 flush：即使没有新事件，也会落库。
         """
-        write_concern = WriteConcern(w=int(self.cfg.mongo_write_w or 1), j=bool(self.cfg.mongo_write_j))
+        write_concern = self._inc_write_concern()
 
-        only_events = [WriteRowsEvent]
+        only_events = [WriteRowsEvent, QueryEvent]
         if not self.cfg.insert_only:
             only_events.append(UpdateRowsEvent)
         if self.cfg.handle_deletes:
@@ -481,9 +751,6 @@ class SyncWorker:
             only_events=only_events,
         )
 
-        inc_batch = int(self.cfg.inc_flush_batch or 2000)
-        flush_interval = max(1, int(self.cfg.inc_flush_interval_sec or 2))
-
         log(self.cfg.task_id, f"IncSync connecting to MySQL {self.mysql_settings.get('host')}:{self.mysql_settings.get('port')}...")
         log(self.cfg.task_id, f"IncSync started events={[e.__name__ for e in only_events]} from={log_file}:{log_pos}")
         log(
@@ -491,26 +758,13 @@ class SyncWorker:
             f"Mode: UPDATE->newDoc={self.cfg.update_insert_new_doc}, DELETE->softMarkBaseOnly={self.cfg.delete_mark_only_base_doc}, hard_delete={self.cfg.hard_delete}",
         )
 
-        def writer_func(coll_name: str, ops: List):
-            coll = self.mongo_db.get_collection(coll_name, write_concern=write_concern)
-            _s = time.time()
-            self.mongo_writer.safe_bulk_write(coll, ops, table="*", coll_name=coll_name)
-            self.rate.update_write_stats(time.time() - _s, len(ops))
-            self.rate.sleep_if_needed()
-
         def on_flush_done():
             try:
                 self._maybe_save_state(getattr(self.stream, "log_file", None), getattr(self.stream, "log_pos", None))
             except Exception:
                 pass
 
-        buf = FlushBuffer(
-            batch_size=inc_batch,
-            flush_interval_sec=flush_interval,
-            writer_func=writer_func,
-            on_flush_done=on_flush_done,
-            stop_event=self.stop_event,
-        )
+        buf = self._make_inc_buffer(write_concern, on_flush_done)
         buf.start()
 
         try:
@@ -523,135 +777,20 @@ class SyncWorker:
                 self._metrics["binlog_pos"] = self.stream.log_pos
                 self._metrics["last_update"] = time.time()
 
+                if isinstance(ev, QueryEvent):
+                    self._handle_schema_query(ev.query, (ev.schema or b"").decode("utf-8", "replace"))
+                    continue
+
                 table = ev.table
                 self._metrics["current_table"] = table or ""
                 if self.cfg.debug_binlog_events:
                     log(self.cfg.task_id, f"EV {type(ev).__name__} table={table}")
 
-                if table not in self.cfg.table_map:
-                    self._maybe_refresh_table_map(reason=f"unknown:{table}")
-                    if table not in self.cfg.table_map:
-                        continue
-
-                coll_name = self.cfg.table_map[table]
-
-                # ---------------- Insert: base upsert ----------------
-                if isinstance(ev, WriteRowsEvent):
-                    try:
-                        self._metrics["inc_insert_count"] += max(1, len(getattr(ev, "rows", []) or []))
-                    except Exception:
-                        self._metrics["inc_insert_count"] += 1
-                    for row in ev.rows:
-                        data = row.get("values")
-                        data = self.mysql_introspector.maybe_fix_row_unknown_cols(table, data)
-                        if not data:
-                            continue
-
-                        doc = self.converter.row_to_base_doc(data)
-                        if self.cfg.use_pk_as_mongo_id:
-                            pk_val = self.mysql_introspector.extract_pk(table, data)
-                            if pk_val is not None:
-                                doc["_id"] = pk_val
-                                buf.add(coll_name, ReplaceOne({"_id": doc["_id"]}, doc, upsert=True))
-                            else:
-                                buf.add(coll_name, InsertOne(doc))
-                        else:
-                            buf.add(coll_name, InsertOne(doc))
-
-                # ---------------- Update: new version doc ----------------
-                elif isinstance(ev, UpdateRowsEvent):
-                    try:
-                        self._metrics["update_count"] += max(1, len(getattr(ev, "rows", []) or []))
-                    except Exception:
-                        self._metrics["update_count"] += 1
-                    for row in ev.rows:
-                        data = row.get("after_values")
-                        data = self.mysql_introspector.maybe_fix_row_unknown_cols(table, data)
-                        if not data:
-                            continue
-
-                        pk_val = self.mysql_introspector.extract_pk(table, data)
-                        if pk_val is None:
-                            log(self.cfg.task_id, f"Update skipped (no pk) table={table} keys={list(data.keys())[:8]}")
-                            continue
-
-                        base_id = pk_val  # use_pk_as_mongo_id 下 base _id=pk
-                        if self.cfg.handle_updates_as_insert and not self.cfg.update_insert_new_doc:
-                            # 兼容旧配置：update 当 insert（不推荐）
-                            doc = self.converter.row_to_base_doc(data)
-                            buf.add(coll_name, InsertOne(doc))
-                        else:
-                            if self.cfg.update_insert_new_doc:
-                                vdoc = self.converter.row_to_version_doc(data, pk_val=pk_val, base_id=base_id)
-                                buf.add(coll_name, InsertOne(vdoc))
-                            else:
-                                doc = self.converter.row_to_base_doc(data)
-                                if self.cfg.use_pk_as_mongo_id and "_id" in doc:
-                                    buf.add(coll_name, ReplaceOne({"_id": doc["_id"]}, doc, upsert=True))
-                                else:
-                                    # _id 保持 ObjectId，按 id 字段定位并原地更新（镜像模式）
-                                    pk_field = self.cfg.pk_field
-                                    buf.add(
-                                        coll_name,
-                                        UpdateOne(
-                                            {pk_field: pk_val},
-                                            {
-                                                "$set": doc,
-                                                "$setOnInsert": {"_id": ObjectId()},
-                                                "$unset": {"_is_version": "", "_op": "", "_base_id": "", "_ts": ""},
-                                            },
-                                            upsert=True,
-                                        ),
-                                    )
-
-                # ---------------- Delete: soft mark base doc only ----------------
-                elif isinstance(ev, DeleteRowsEvent) and self.cfg.handle_deletes:
-                    try:
-                        self._metrics["delete_count"] += max(1, len(getattr(ev, "rows", []) or []))
-                    except Exception:
-                        self._metrics["delete_count"] += 1
-                    for row in ev.rows:
-                        data = row.get("values")
-                        data = self.mysql_introspector.maybe_fix_row_unknown_cols(table, data)
-                        if not data:
-                            continue
-
-                        pk_val = self.mysql_introspector.extract_pk(table, data)
-                        if pk_val is None:
-                            log(self.cfg.task_id, f"Delete skipped (no pk) table={table} keys={list(data.keys())[:8]}")
-                            continue
-
-                        if self.cfg.delete_append_new_doc:
-                            vdoc = self.converter.row_to_delete_doc(data, pk_val=pk_val, base_id=pk_val)
-                            buf.add(coll_name, InsertOne(vdoc))
-                        else:
-                            set_doc = {
-                                self.cfg.delete_flag_field: True,
-                                self.cfg.delete_time_field: dt.utcnow(),
-                                "_op": "delete",
-                                "_ts": dt.utcnow(),
-                            }
-                            if self.cfg.delete_mark_only_base_doc:
-                                buf.add(
-                                    coll_name,
-                                    UpdateOne({"_id": pk_val}, {"$set": set_doc}, upsert=self.cfg.delete_upsert_tombstone),
-                                )
-                            else:
-                                buf.add(coll_name, UpdateMany({self.cfg.pk_field: pk_val}, {"$set": set_doc}, upsert=False))
-                                buf.add(
-                                    coll_name,
-                                    UpdateOne({"_id": pk_val}, {"$set": set_doc}, upsert=self.cfg.delete_upsert_tombstone),
-                                )
-
-                try:
-                    self._metrics["processed_count"] = (
-                        int(self._metrics.get("full_insert_count") or 0)
-                        + int(self._metrics.get("inc_insert_count") or 0)
-                        + int(self._metrics.get("update_count") or 0)
-                        + int(self._metrics.get("delete_count") or 0)
-                    )
-                except Exception:
-                    pass
+                op = row_event_op(ev)
+                if op is None or not self._owns_event(table, self.stream.log_file, self.stream.log_pos):
+                    continue
+                self._apply_row_event(buf, op, table, ev.rows)
+                self._update_processed_count()
 
                 buf.flush_if_reach_batch()
                 buf.flush(force=False)
@@ -673,3 +812,71 @@ class SyncWorker:
                 pass
 
             log(self.cfg.task_id, "IncSync stopped (once)")
+
+    def do_inc_sync_from_stream(self, log_file, log_pos):
+        """
+        从 change capture 流消费增量（同实例只有一个 binlog reader）。
+        语义与 do_inc_sync_once 相同；条目在对应写入落库后才 ack。
+        """
+        write_concern = self._inc_write_concern()
+        key = capture_hub.acquire(self.mysql_settings, log_file, log_pos)
+        group = f"{self.cfg.task_id}:{self._shard_index}"
+        database = self.cfg.mysql_conf.database
+        cur = {"file": log_file, "pos": log_pos}
+
+        log(self.cfg.task_id, f"IncSync (change stream) instance={key} group={group} from={log_file}:{log_pos}")
+
+        def on_flush_done():
+            try:
+                self._maybe_save_state(cur["file"], cur["pos"])
+            except Exception:
+                pass
+
+        # 不启动后台 flush 线程：由本循环 flush，保证 ack 只发生在写入之后
+        buf = self._make_inc_buffer(write_concern, on_flush_done)
+        consumer = None
+        try:
+            consumer = ChangeStreamConsumer(key, group, group, log_file, log_pos)
+            while not self.stop_event.is_set():
+                entries = consumer.read(count=int(self.cfg.inc_flush_batch or 2000), block_ms=1000)
+                for e in entries:
+                    cur["file"], cur["pos"] = e.log_file, e.log_pos
+                    self._metrics["binlog_file"] = e.log_file
+                    self._metrics["binlog_pos"] = e.log_pos
+                    self._metrics["last_update"] = time.time()
+                    if e.op == "rename":
+                        self._handle_schema_query(e.query, e.schema)
+                        continue
+                    if database and e.schema and e.schema != database:
+                        continue
+                    if not self._owns_event(e.table, e.log_file, e.log_pos):
+                        continue
+                    self._metrics["current_table"] = e.table
+                    if self.cfg.debug_binlog_events:
+                        log(self.cfg.task_id, f"EV stream:{e.op} table={e.table}")
+
+                    self._apply_row_event(buf, e.op, e.table, e.rows)
+                    self._update_processed_count()
+                    buf.flush_if_reach_batch()
+
+                buf.flush(force=False)
+                if buf.total_size() == 0:
+                    consumer.ack_all()
+        except ChangeStreamGap:
+            # 回退直连 binlog：删除 group，下次订阅按当时的 checkpoint 重新建组，不会从断档处继续投递
+            if consumer is not None:
+                consumer.reset_group()
+            raise
+        finally:
+            try:
+                buf.flush(force=True)
+                if consumer is not None:
+                    consumer.ack_all()
+            except Exception as e:
+                log(self.cfg.task_id, f"Change stream final flush failed: {str(e)[:200]}")
+            try:
+                self._maybe_save_state(cur["file"], cur["pos"])
+            except Exception:
+                pass
+            capture_hub.release(key)
+            log(self.cfg.task_id, "IncSync stopped (change stream)")
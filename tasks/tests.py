@@ -1,3 +1,113 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase
+from pymysqlreplication.event import QueryEvent
+from pymysqlreplication.row_event import WriteRowsEvent
+
+from .sync import change_capture
+
+
+class _FakeStreamRedis:
+    """只实现 change capture 用到的 Redis 命令（单 consumer group）。"""
+
+    def __init__(self):
+        self.entries = []
+        self.hashes = {}
+        self.kv = {}
+        self.delivered = {}
+
+    def xadd(self, stream, fields, maxlen=None, approximate=True):
+        entry_id = f"{len(self.entries) + 1}-0"
+        self.entries.append((entry_id, {k: str(v) for k, v in fields.items()}))
+        return entry_id
+
+    def xgroup_create(self, stream, group, id="$", mkstream=False):
+        self.delivered.setdefault(group, 0 if id == "0" else len(self.entries))
+
+    def xreadgroup(self, group, consumer, streams, count=None, block=None):
+        (stream, start_id), = streams.items()
+        if start_id != ">":
+            return []
+        start = self.delivered[group]
+        batch = self.entries[start:start + (count or len(self.entries))]
+        self.delivered[group] = start + len(batch)
+        return [[stream, batch]] if batch else []
+
+    def xack(self, stream, group, *ids):
+        return len(ids)
+
+    def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update({k: str(v) for k, v in mapping.items()})
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def set(self, key, value, nx=False, px=None):
+        if nx and key in self.kv:
+            return None
+        self.kv[key] = value
+        return True
+
+    def get(self, key):
+        return self.kv.get(key)
+
+    def pexpire(self, key, ms):
+        return True
+
+
+class _Begin(QueryEvent):
+    def __init__(self):
+        self.query = "BEGIN"
+        self.schema = b"shop"
+
+
+class _Insert(WriteRowsEvent):
+    def __init__(self, table, row_id):
+        self.schema = "shop"
+        self.table = table
+        self._fake_rows = [{"values": {"id": row_id}}]
+
+    @property
+    def rows(self):
+        return self._fake_rows
+
+
+class _FakeReader:
+    """按 (event, end_pos) 依次产出事件，像 BinLogStreamReader 一样在产出时更新 log_file / log_pos。"""
+
+    def __init__(self, events, **kwargs):
+        self.events = events
+        self.log_file = kwargs.get("log_file")
+        self.log_pos = kwargs.get("log_pos")
+
+    def __iter__(self):
+        for ev, end_pos in self.events:
+            self.log_pos = end_pos
+            yield ev
+
+    def close(self):
+        pass
+
+
+class ChangeStreamTests(SimpleTestCase):
+    def test_two_transactions_through_one_consumer_have_no_gap(self):
+        r = _FakeStreamRedis()
+        events = [
+            (_Begin(), 200),
+            (_Insert("orders", 1), 300),
+            (_Begin(), 400),
+            (_Insert("orders", 2), 500),
+            (_Insert("items", 3), 600),
+        ]
+        svc = change_capture.ChangeCaptureService("db:3306", {"host": "db", "port": 3306}, "mysql-bin.000001", 100)
+        with mock.patch.object(change_capture, "_client", return_value=r), mock.patch.object(
+            change_capture, "BinLogStreamReader", side_effect=lambda **kw: _FakeReader(events, **kw)
+        ):
+            consumer = change_capture.ChangeStreamConsumer("db:3306", "task-1", "w0", "mysql-bin.000001", 100)
+            svc._capture(r)
+            got = consumer.read(count=100, block_ms=0)
+
+        self.assertEqual([e.log_pos for e in got], [300, 500, 600])
+        self.assertEqual([e.rows[0]["values"]["id"] for e in got], [1, 2, 3])
+        # 重启后从最后一条已发布条目继续
+        self.assertEqual(r.hgetall(svc.pos_key), {"file": "mysql-bin.000001", "pos": "600"})
@@ -1,27 +1,156 @@
-from .models import SyncTask
+import time
+from typing import Dict, Optional
+
+from django.db import IntegrityError, transaction
+
+from .models import SyncTask, SyncCheckpoint
 from .schemas import SyncTaskRequest
 from core.logging import log
 import json
 
-def load_state(task_id: str):
+
+def _checkpoint_state(cp: SyncCheckpoint) -> dict:
+    return {
+        "log_file": cp.log_file,
+        "log_pos": cp.log_pos,
+        "gtid": cp.gtid,
+        "metrics": cp.metrics or {},
+        "checkpoint_ts": cp.ts,
+    }
+
+
+def load_state(task_id: str, shard: int = 0):
+    """
+    SyncTask.state (compacted checkpoint) overlaid with the live SyncCheckpoint row.
+    Shard 0 lives at the top level of state for compatibility; other shards under state["shards"]
+    (falling back to the shared top-level position written before per-shard checkpoints existed).
+    """
     try:
-        task = SyncTask.objects.get(task_id=task_id)
-        return task.state
+        state = SyncTask.objects.values_list("state", flat=True).get(task_id=task_id) or {}
     except SyncTask.DoesNotExist:
         return {}
+    state = dict(state)
+    cp = SyncCheckpoint.objects.filter(task_id=task_id, shard=shard).first()
+    if shard:
+        entry = (state.get("shards") or {}).get(str(shard))
+        if entry is None and (cp is None or not cp.log_file) and state.get("log_file"):
+            # 升级前所有分片共用顶层位点：没有本分片记录时从顶层位点续传，而不是重新全量
+            entry = {
+                "log_file": state.get("log_file"),
+                "log_pos": state.get("log_pos"),
+                "gtid": state.get("gtid") or "",
+                "metrics": {"phase": (state.get("metrics") or {}).get("phase") or "inc_sync"},
+            }
+        state = dict(entry or {})
+    if cp is not None and cp.log_file:
+        state.update(_checkpoint_state(cp))
+    return state
 
-def save_state(task_id: str, log_file: str, log_pos: int, metrics: dict):
+
+def save_state(task_id: str, log_file: str, log_pos: int, metrics: dict, shard: int = 0, gtid: str = ""):
+    """Upsert the (task_id, shard) checkpoint row; cost does not depend on config/state size."""
+    fields = {
+        "log_file": log_file or "",
+        "log_pos": int(log_pos or 0),
+        "gtid": gtid or "",
+        "metrics": dict(metrics or {}),
+        "ts": time.time(),
+    }
     try:
-        task = SyncTask.objects.get(task_id=task_id)
-        state = task.state or {}
-        state["log_file"] = log_file
-        state["log_pos"] = log_pos
-        state["metrics"] = metrics
-        task.state = state
-        task.save()
+        updated = SyncCheckpoint.objects.filter(task_id=task_id, shard=shard).update(**fields)
+        if not updated:
+            try:
+                SyncCheckpoint.objects.create(task_id=task_id, shard=shard, **fields)
+            except IntegrityError:
+                SyncCheckpoint.objects.filter(task_id=task_id, shard=shard).update(**fields)
+    except Exception as e:
+        log(task_id, f"Failed to save checkpoint shard={shard}: {e}")
+
+
+def compact_checkpoints(task_id: str, shard: Optional[int] = None):
+    """
+    Fold checkpoint rows back into SyncTask.state and drop them (all shards when shard is None).
+    Called when a worker exits so state stays self-contained and the checkpoint table stays small.
+    """
+    try:
+        with transaction.atomic():
+            task = SyncTask.objects.select_for_update().only("task_id", "state").get(task_id=task_id)
+            qs = SyncCheckpoint.objects.filter(task_id=task_id)
+            if shard is not None:
+                qs = qs.filter(shard=shard)
+            rows = list(qs)
+            if not rows:
+                return
+            state = dict(task.state or {})
+            for cp in rows:
+                if cp.shard == 0:
+                    state.update(_checkpoint_state(cp))
+                else:
+                    shards = dict(state.get("shards") or {})
+                    shards[str(cp.shard)] = _checkpoint_state(cp)
+                    state["shards"] = shards
+            task.state = state
+            task.save(update_fields=["state", "updated_at"])
+            qs.filter(pk__in=[cp.pk for cp in rows]).delete()
     except SyncTask.DoesNotExist:
+        SyncCheckpoint.objects.filter(task_id=task_id).delete()
+    except Exception as e:
+        log(task_id, f"Failed to compact checkpoints: {e}")
+
+
+def replace_shard_states(task_id: str, shard_states: Dict[int, dict]):
+    """
+    Replace every shard's checkpoint with the given states (turbo rescale handoff).
+    Callers must make sure no worker of the task is running.
+    """
+    with transaction.atomic():
+        task = SyncTask.objects.select_for_update().only("task_id", "state").get(task_id=task_id)
+        SyncCheckpoint.objects.filter(task_id=task_id).delete()
+        state = dict(task.state or {})
+        state.update(shard_states.get(0) or {})
+        state["shards"] = {str(k): dict(v) for k, v in shard_states.items() if k}
+        task.state = state
+        task.save(update_fields=["state", "updated_at"])
+
+
+def clear_handoff(task_id: str, shard: int = 0):
+    """Drop a shard's rescale handoff marker once it has read past every old shard's position."""
+    try:
+        with transaction.atomic():
+            task = SyncTask.objects.select_for_update().only("task_id", "state").get(task_id=task_id)
+            state = dict(task.state or {})
+            if shard:
+                shards = dict(state.get("shards") or {})
+                entry = dict(shards.get(str(shard)) or {})
+                if entry.pop("handoff", None) is None:
+                    return
+                shards[str(shard)] = entry
+                state["shards"] = shards
+            elif state.pop("handoff", None) is None:
+                return
+            task.state = state
+            task.save(update_fields=["state", "updated_at"])
+    except Exception as e:
+        log(task_id, f"Failed to clear handoff shard={shard}: {e}")
+
+
+def delete_checkpoints(task_id: str, min_shard: int = 0):
+    try:
+        SyncCheckpoint.objects.filter(task_id=task_id, shard__gte=min_shard).delete()
+    except Exception:
         pass
 
+
+def checkpoint_metrics() -> Dict[str, dict]:
+    """task_id -> metrics of the live shard-0 checkpoint (one query for status listings)."""
+    try:
+        return {
+            tid: m or {}
+            for tid, m in SyncCheckpoint.objects.filter(shard=0).values_list("task_id", "metrics")
+        }
+    except Exception:
+        return {}
+
 def save_task_config(cfg: SyncTaskRequest):
     try:
         task, created = SyncTask.objects.get_or_create(task_id=cfg.task_id)
@@ -30,14 +159,37 @@ def save_task_config(cfg: SyncTaskRequest):
     except Exception as e:
         log("system", f"Failed to save task config: {e}")
 
+def rename_table_map_entry(task_id: str, src: str, dst: str) -> bool:
+    """
+    Persist a table rename into an explicit config["table_map"] only (runtime fields such as
+    shard_total/shard_index or an auto-built map are never written back). Returns True if saved.
+    """
+    try:
+        with transaction.atomic():
+            task = SyncTask.objects.select_for_update().only("task_id", "config").get(task_id=task_id)
+            config = dict(task.config or {})
+            table_map = dict(config.get("table_map") or {})
+            if not table_map or "*" in table_map or src not in table_map:
+                return False
+            table_map.setdefault(dst, table_map.pop(src))
+            config["table_map"] = table_map
+            task.config = config
+            task.save(update_fields=["config", "updated_at"])
+            return True
+    except Exception as e:
+        log(task_id, f"Failed to save table rename {src} -> {dst}: {e}")
+        return False
+
+
 def delete_task_config(task_id: str):
     try:
         SyncTask.objects.filter(task_id=task_id).delete()
     except Exception:
         pass
+    delete_checkpoints(task_id)
 
 def load_task_config_file(path_ignored: str) -> dict:
-    # We ignore path and just assume we load from DB in other places, 
+    # We ignore path and just assume we load from DB in other places,
     # but the legacy code passed a path.
     # We need to change the caller to pass task_id or handle it.
     # But for compatibility, if we change the caller, we don't need this.
@@ -6,6 +6,9 @@ from django.http import JsonResponse, StreamingHttpResponse
 from .models import Connection, SyncTask
 from .schemas import ConnectionConfig, SyncTaskRequest, DBConfig
 from .sync.task_manager import task_manager
+from core.log_index import read_page
+from core.log_search import get_log_searcher
+from core.log_stats import get_log_stats_engine
 import os
 import time
 import datetime
@@ -335,31 +338,9 @@ def task_logs(request, task_id):
         return Response({"lines": [], "total": 0, "page": 1, "page_size": page_size})
         
     try:
-        with open(p, "r", encoding="utf-8") as f:
-            all_lines = f.readlines()
-        
-        total = len(all_lines)
+        # 稀疏行偏移索引：只 seek + 读取当前页需要的行
         page_size = max(1, min(page_size, 2000))
-        
-        # Reverse if requested
-        if reverse:
-            all_lines.reverse()
-        
-        if page == -1:
-            import math
-            page = max(1, math.ceil(total / page_size))
-        else:
-            page = max(1, page)
-        
-        start = (page - 1) * page_size
-        end = start + page_size
-        
-        return Response({
-            "lines": all_lines[start:end],
-            "total": total,
-            "page": page,
-            "page_size": page_size
-        })
+        return Response(read_page(p, page, page_size, reverse=reverse))
     except Exception as e:
         return Response({"detail": str(e)}, status=500)
 
@@ -438,78 +419,12 @@ def log_stats(request):
     log_dir = "logs"
     if not os.path.exists(log_dir):
         return Response({"stats": {"error": 0, "warning": 0, "info": 0}, "series": []})
-        
-    # Aggregate stats from all log files (last 1000 lines each for performance)
-    total_error = 0
-    total_warn = 0
-    total_info = 0
-    
-    # Simple time-series distribution (mock or rough estimate based on timestamps)
-    # For real accurate time-series, we'd need to parse timestamps. 
-    # Let's do a simple parsing of the last few lines to generate a trend for "Today"
-    
-    now = datetime.datetime.now()
-    today_str = now.strftime("%Y-%m-%d")
-    
-    # Bucket by hour: {"10:00": 5, "11:00": 12}
-    hourly_errors = {}
-    
+
+    # 增量统计：只处理各文件自上次以来新增的行，计数覆盖整个文件
     try:
-        for f in os.listdir(log_dir):
-            if not f.endswith(".log"): 
-                continue
-                
-            p = os.path.join(log_dir, f)
-            try:
-                # Read last 2000 lines efficiently? For now just read lines
-                with open(p, "r", encoding="utf-8", errors='ignore') as fo:
-                    # Reading full file might be slow if huge. 
-                    # Let's assume files rotate or aren't massive for this demo.
-                    # Or use a seek to tail.
-                    fo.seek(0, 2)
-                    size = fo.tell()
-                    # Read last 1MB
-                    fo.seek(max(0, size - 1024*1024), 0)
-                    lines = fo.readlines()
-                    
-                    for line in lines:
-                        if "ERROR" in line or "CRITICAL" in line or "Exception" in line:
-                            total_error += 1
-                            # Extract time [2026-01-23 10:00:00]
-                            if line.startswith("["):
-                                try:
-                                    # [2026-01-23 10:00:00]
-                                    ts_str = line[1:20]
-                                    if ts_str.startswith(today_str):
-                                        hour = ts_str[11:13] + ":00"
-                                        hourly_errors[hour] = hourly_errors.get(hour, 0) + 1
-                                except:
-                                    pass
-                        elif "WARNING" in line:
-                            total_warn += 1
-                        else:
-                            total_info += 1
-            except Exception:
-                pass
-                
+        return Response(get_log_stats_engine().snapshot(request.GET.get('day') or None))
     except Exception as e:
-        pass
-        
-    # Fill missing hours for chart
-    hours = sorted(hourly_errors.keys())
-    series_data = [hourly_errors[h] for h in hours]
-    
-    return Response({
-        "summary": {
-            "error": total_error,
-            "warning": total_warn,
-            "info": total_info
-        },
-        "trend": {
-            "hours": hours,
-            "errors": series_data
-        }
-    })
+        return Response({"detail": str(e)}, status=500)
 
 @api_view(['GET'])
 @permission_classes([HasRolePermission])
@@ -517,34 +432,32 @@ def log_global_search(request):
     keyword = request.GET.get('q', '').strip()
     if not keyword:
         return Response({"matches": []})
-        
-    log_dir = "logs"
-    matches = []
-    MAX_MATCHES = 100
-    
+
+    since = request.GET.get('since', '').strip() or None
+    until = request.GET.get('until', '').strip() or None
+    stream = request.GET.get('stream', 'false').lower() == 'true'
     try:
-        for f in os.listdir(log_dir):
-            if not f.endswith(".log"): continue
-            p = os.path.join(log_dir, f)
-            
+        max_matches = max(1, min(int(request.GET.get('limit', 100)), 5000))
+    except ValueError:
+        max_matches = 100
+
+    searcher = get_log_searcher("logs")
+    if stream:
+        # NDJSON：每行一个匹配，按文件逐个返回
+        def _gen():
             try:
-                with open(p, "r", encoding="utf-8", errors='ignore') as fo:
-                    for i, line in enumerate(fo):
-                        if keyword.lower() in line.lower():
-                            matches.append({
-                                "file": f,
-                                "line": i + 1,
-                                "content": line.strip()[:300] # Truncate long lines
-                            })
-                            if len(matches) >= MAX_MATCHES:
-                                break
-            except:
-                pass
-            if len(matches) >= MAX_MATCHES:
-                break
+                for m in searcher.iter_search(keyword, max_matches=max_matches, since=since, until=until):
+                    yield json.dumps(m, ensure_ascii=False) + "\n"
+            except Exception as e:
+                yield json.dumps({"error": str(e)}, ensure_ascii=False) + "\n"
+
+        return StreamingHttpResponse(_gen(), content_type="application/x-ndjson")
+
+    try:
+        matches = searcher.search(keyword, max_matches=max_matches, since=since, until=until)
     except Exception as e:
         return Response({"detail": str(e)}, status=500)
-        
+
     return Response({"matches": matches})
 
 # --- K8s Logs ---
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import TrafficDashboardConfig, TrafficMinuteRollup
+from .models import TrafficDashboardConfig, TrafficDayRollup, TrafficHourRollup, TrafficMinuteRollup
 
 
 @admin.register(TrafficDashboardConfig)
@@ -20,6 +20,7 @@ class TrafficDashboardConfigAdmin(admin.ModelAdmin):
         "log_sources",
         "error_log_path",
         "log_format",
+        "nginx_log_format",
         "max_tail_bytes",
         "redis_log_key",
         "redis_max_lines",
@@ -57,3 +58,8 @@ class TrafficMinuteRollupAdmin(admin.ModelAdmin):
 
     def has_add_permission(self, request):
         return False
+
+
+@admin.register(TrafficHourRollup, TrafficDayRollup)
+class TrafficCoarseRollupAdmin(TrafficMinuteRollupAdmin):
+    pass
@@ -0,0 +1,34 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from traffic.services.benchmark import run_benchmarks
+
+
+class Command(BaseCommand):
+    help = "Benchmark traffic snapshot aggregation (list reference vs columnar) and write results as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--records", type=int, default=100000, help="Synthetic record count")
+        parser.add_argument("--ranges", default="1h,24h", help="Range keys, comma separated")
+        parser.add_argument("--paths", type=int, default=500, help="Distinct request paths")
+        parser.add_argument("--ips", type=int, default=5000, help="Distinct client IPs")
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per case (fastest is kept)")
+        parser.add_argument("--out", default="", help="Write JSON results to this file")
+
+    def handle(self, *args, **options):
+        report = run_benchmarks(
+            records=max(1, options["records"]),
+            ranges=[r.strip() for r in options["ranges"].split(",") if r.strip()] or None,
+            paths=max(1, options["paths"]),
+            ips=max(1, options["ips"]),
+            repeat=max(1, options["repeat"]),
+        )
+        text = json.dumps(report, indent=2)
+        if options["out"]:
+            with open(options["out"], "w", encoding="utf-8") as f:
+                f.write(text + "\n")
+            for name, res in report["results"].items():
+                self.stdout.write(f"{name}: {json.dumps(res)}")
+        else:
+            self.stdout.write(text)
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from traffic.services.geoip_lookup import _geoip_path
+from traffic.services.geoip_ranges import load_ranges
+
+
+class Command(BaseCommand):
+    help = (
+        "Build (or rebuild) the GeoIP range table cache used by TRAFFIC_GEOIP_MODE=range from the .mmdb "
+        "or TRAFFIC_GEOIP_RANGE_CSV. Run after updating the database so workers only load the .npz."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--db", default="", help="MaxMind .mmdb path (default TRAFFIC_GEOIP_DB)")
+        parser.add_argument("--rebuild", action="store_true", help="Ignore an existing .npz cache")
+
+    def handle(self, *args, **options):
+        table = load_ranges(_geoip_path(options["db"]), rebuild=options["rebuild"])
+        if table is None:
+            raise CommandError("GeoIP range table unavailable (check TRAFFIC_GEOIP_DB / TRAFFIC_GEOIP_RANGE_CSV, maxminddb)")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"traffic_geoip_build_ranges: {len(table.v4)} IPv4 / {len(table.v6)} IPv6 range(s), "
+                f"{len(table.labels)} label(s)"
+            )
+        )
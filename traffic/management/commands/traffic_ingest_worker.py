@@ -0,0 +1,57 @@
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from traffic.services.ingest_stream import IngestWorker, default_consumer_name, ensure_group
+from traffic.services.redis_log_buffer import traffic_redis_client
+
+
+class Command(BaseCommand):
+    help = (
+        "Consume async traffic ingest batches from the Redis Stream (TRAFFIC_INGEST_ASYNC=1): "
+        "buffer, parse, enrich, roll up and ack. Run several processes to scale out."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--consumer", default="", help="Consumer name (default: hostname-pid)")
+        parser.add_argument("--count", type=int, default=10, help="Batches per XREADGROUP")
+        parser.add_argument("--block-ms", type=int, default=5000, help="XREADGROUP block timeout")
+        parser.add_argument(
+            "--claim-idle-ms",
+            type=int,
+            default=60000,
+            help="Reclaim batches pending longer than this on other (dead) consumers",
+        )
+        parser.add_argument("--once", action="store_true", help="Process one read round and exit")
+
+    def handle(self, *args, **options):
+        r = traffic_redis_client()
+        if not r:
+            raise CommandError("TRAFFIC_REDIS_URL not configured")
+        worker = IngestWorker(
+            r,
+            options["consumer"] or default_consumer_name(),
+            count=options["count"],
+            block_ms=options["block_ms"],
+            claim_idle_ms=options["claim_idle_ms"],
+        )
+        if options["once"]:
+            ensure_group(r)
+            n = worker.run_once()
+            self.stdout.write(self.style.SUCCESS(f"traffic_ingest_worker: handled {n} batch(es)"))
+            return
+
+        stop = {"flag": False}
+
+        def _stop(*_):
+            stop["flag"] = True
+
+        signal.signal(signal.SIGTERM, _stop)
+        signal.signal(signal.SIGINT, _stop)
+        self.stdout.write(f"traffic_ingest_worker: consumer {worker.consumer} started")
+        worker.run(lambda: stop["flag"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"traffic_ingest_worker: stopped (processed={worker.processed}, failed={worker.failed})"
+            )
+        )
@@ -0,0 +1,49 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from traffic.models import TrafficDayRollup, TrafficHourRollup
+from traffic.services.rollup_buffer import RollupDelta, _mirror_to_clickhouse, bucket_floor
+from traffic.services.rollup_query import fetch_rollups_for_range
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild hourly / daily traffic rollups from minute rows (Postgres + ClickHouse) for the last N days. "
+        "Run once after enabling TRAFFIC_ROLLUP_DOWNSAMPLE_ENABLED; the flush job keeps them current afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=30, help="How many UTC days back to rebuild (default 30).")
+
+    def handle(self, *args, **options):
+        today = bucket_floor(timezone.now(), 86400)
+        days = max(1, options["days"])
+        n_rows = 0
+        for i in range(days, -1, -1):
+            day = today - timedelta(days=i)
+            minute_rows = fetch_rollups_for_range(day, day + timedelta(days=1), "all", 60)
+            if not minute_rows:
+                continue
+            # 一天一次：按 (桶, 数据源) 累加分钟行，整天的小时 / 天行整体替换
+            acc = {TrafficHourRollup: {}, TrafficDayRollup: {}}
+            for row in minute_rows:
+                delta = RollupDelta.from_row(row)
+                for model, by_key in acc.items():
+                    key = (bucket_floor(row.bucket_start, model.BUCKET_SEC), row.source_id or "")
+                    by_key.setdefault(key, RollupDelta()).add(delta)
+            saved = []
+            with transaction.atomic():
+                for model, by_key in acc.items():
+                    model.objects.filter(bucket_start__gte=day, bucket_start__lt=day + timedelta(days=1)).delete()
+                    for (bt, src), delta in by_key.items():
+                        obj = model(bucket_start=bt, source_id=src)
+                        delta.apply_to(obj)
+                        obj.save()
+                        saved.append(obj)
+            _mirror_to_clickhouse(saved)
+            n_rows += len(saved)
+            self.stdout.write(f"{day.date().isoformat()}: {len(minute_rows)} minute row(s) -> {len(saved)} row(s)")
+        self.stdout.write(self.style.SUCCESS(f"traffic_rollup_downsample: wrote {n_rows} hour/day row(s)"))
@@ -1,11 +1,52 @@
+import os
+import signal
+import socket
+import time
+
 from django.core.management.base import BaseCommand
+from django.db import close_old_connections
 
-from traffic.services.rollup_buffer import flush_closed_rollups
+from traffic.services.rollup_buffer import flush_batch_size, flush_closed_rollups
 
 
 class Command(BaseCommand):
-    help = "Flush closed per-minute traffic rollups from Redis into the database (cron every minute)."
+    help = (
+        "Flush closed per-minute traffic rollups from Redis into the database (cron every minute, or --daemon). "
+        "Several flushers can run at once; each minute/source is claimed with a Redis lease."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=0, help="Minutes/sources per batch (default TRAFFIC_ROLLUP_FLUSH_BATCH)")
+        parser.add_argument("--owner", default="", help="Lease owner name (default: hostname-pid)")
+        parser.add_argument("--daemon", action="store_true", help="Keep flushing until SIGTERM / SIGINT")
+        parser.add_argument("--interval", type=float, default=15.0, help="Daemon sleep between idle rounds (seconds)")
 
     def handle(self, *args, **options):
-        n = flush_closed_rollups()
-        self.stdout.write(self.style.SUCCESS(f"traffic_rollup_flush: flushed {n} bucket(s)"))
+        batch = options["batch"] or flush_batch_size()
+        owner = options["owner"] or f"{socket.gethostname()}-{os.getpid()}"
+        if not options["daemon"]:
+            n = flush_closed_rollups(batch, owner)
+            self.stdout.write(self.style.SUCCESS(f"traffic_rollup_flush: flushed {n} bucket(s)"))
+            return
+
+        stop = {"flag": False}
+
+        def _stop(*_):
+            stop["flag"] = True
+
+        signal.signal(signal.SIGTERM, _stop)
+        signal.signal(signal.SIGINT, _stop)
+        self.stdout.write(f"traffic_rollup_flush: daemon {owner} started (batch={batch})")
+        total = 0
+        interval = max(1.0, options["interval"])
+        while not stop["flag"]:
+            close_old_connections()
+            n = flush_closed_rollups(batch, owner)
+            total += n
+            if n:
+                continue
+            # 空闲：分段 sleep，尽快响应停止信号
+            deadline = time.monotonic() + interval
+            while not stop["flag"] and time.monotonic() < deadline:
+                time.sleep(min(1.0, interval))
+        self.stdout.write(self.style.SUCCESS(f"traffic_rollup_flush: stopped (flushed={total})"))
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from traffic.models import TrafficMinuteRollup
+from traffic.services.clickhouse_rollups import clickhouse_configured, insert_rollups_from_models
+from traffic.services.rollup_buffer import hot_boundary, hot_hours
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete Postgres minute rollups older than TRAFFIC_ROLLUP_HOT_HOURS that are already mirrored to "
+        "ClickHouse (re-mirrors unsynced cold rows first). Cron hourly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=5000, help="Rows per DELETE / re-mirror batch.")
+        parser.add_argument("--dry-run", action="store_true", help="Only report what would be deleted.")
+
+    def handle(self, *args, **options):
+        if not hot_hours() or not clickhouse_configured():
+            raise CommandError("TRAFFIC_ROLLUP_HOT_HOURS and CLICKHOUSE_HOST must both be set")
+        boundary = hot_boundary(60)
+        batch = max(100, options["batch"])
+        cold = TrafficMinuteRollup.objects.filter(bucket_start__lt=boundary)
+
+        # 镜像失败过的冷数据：查询已改读 ClickHouse，先补写，成功后才允许删除
+        resynced = failed = 0
+        unsynced = cold.filter(ch_synced=False).order_by("pk")
+        last_pk = 0
+        while True:
+            rows = list(unsynced.filter(pk__gt=last_pk)[:batch])
+            if not rows:
+                break
+            last_pk = rows[-1].pk
+            if options["dry_run"]:
+                failed += len(rows)
+                continue
+            ok = [r.pk for r in insert_rollups_from_models(rows)]
+            TrafficMinuteRollup.objects.filter(pk__in=ok).update(ch_synced=True)
+            resynced += len(ok)
+            failed += len(rows) - len(ok)
+
+        deleted = 0
+        synced = cold.filter(ch_synced=True)
+        if options["dry_run"]:
+            deleted = synced.count()
+        else:
+            while True:
+                pks = list(synced.values_list("pk", flat=True)[:batch])
+                if not pks:
+                    break
+                deleted += TrafficMinuteRollup.objects.filter(pk__in=pks).delete()[0]
+        verb = "would delete" if options["dry_run"] else "deleted"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"traffic_rollup_prune: before {boundary.isoformat()}: {verb} {deleted} row(s), "
+                f"re-mirrored {resynced}, still unsynced {failed}"
+            )
+        )
@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("traffic", "0006_trafficminuterollup"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="trafficminuterollup",
+            name="latency_sketch",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                help_text="Mergeable log-bucket latency histogram {z, b}; p50/p95/p99 are derived from it.",
+            ),
+        ),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("traffic", "0007_trafficminuterollup_latency_sketch"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="trafficminuterollup",
+            name="top_ips",
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name="trafficminuterollup",
+            name="topk_floor",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                help_text="Upper bound on the count of any path / IP not listed: {paths, ips}.",
+            ),
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("traffic", "0008_trafficminuterollup_top_ips"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="trafficdashboardconfig",
+            name="nginx_log_format",
+            field=models.TextField(
+                blank=True,
+                default="",
+                help_text="Text formats only: the Nginx log_format string, e.g. "
+                "'$remote_addr - $remote_user [$time_local] \"$request\" $status $body_bytes_sent \"$http_referer\" "
+                "\"$http_user_agent\" $request_time'. Lines are split on its literals. Empty = standard combined.",
+            ),
+        ),
+    ]
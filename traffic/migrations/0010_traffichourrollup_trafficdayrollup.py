@@ -0,0 +1,111 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("traffic", "0009_trafficdashboardconfig_nginx_log_format"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TrafficHourRollup",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "source_id",
+                    models.CharField(
+                        blank=True,
+                        db_index=True,
+                        default="",
+                        help_text="Matches ingest ?source= / X-Traffic-Source; empty = default.",
+                        max_length=64,
+                    ),
+                ),
+                ("requests", models.PositiveIntegerField(default=0)),
+                ("sum_latency_ms", models.PositiveBigIntegerField(default=0)),
+                ("count_latency", models.PositiveIntegerField(default=0)),
+                ("status_2xx", models.PositiveIntegerField(default=0)),
+                ("status_4xx", models.PositiveIntegerField(default=0)),
+                ("status_5xx", models.PositiveIntegerField(default=0)),
+                ("p50_ms", models.FloatField(blank=True, null=True)),
+                ("p95_ms", models.FloatField(blank=True, null=True)),
+                ("p99_ms", models.FloatField(blank=True, null=True)),
+                (
+                    "latency_sketch",
+                    models.JSONField(
+                        blank=True,
+                        default=dict,
+                        help_text="Mergeable log-bucket latency histogram {z, b}; p50/p95/p99 are derived from it.",
+                    ),
+                ),
+                ("geo_counts", models.JSONField(blank=True, default=dict)),
+                ("top_paths", models.JSONField(blank=True, default=list)),
+                ("top_ips", models.JSONField(blank=True, default=list)),
+                (
+                    "topk_floor",
+                    models.JSONField(
+                        blank=True,
+                        default=dict,
+                        help_text="Upper bound on the count of any path / IP not listed: {paths, ips}.",
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("bucket_start", models.DateTimeField(db_index=True, help_text="UTC hour start (inclusive).")),
+            ],
+            options={
+                "ordering": ["bucket_start", "source_id"],
+                "unique_together": {("bucket_start", "source_id")},
+            },
+        ),
+        migrations.CreateModel(
+            name="TrafficDayRollup",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "source_id",
+                    models.CharField(
+                        blank=True,
+                        db_index=True,
+                        default="",
+                        help_text="Matches ingest ?source= / X-Traffic-Source; empty = default.",
+                        max_length=64,
+                    ),
+                ),
+                ("requests", models.PositiveIntegerField(default=0)),
+                ("sum_latency_ms", models.PositiveBigIntegerField(default=0)),
+                ("count_latency", models.PositiveIntegerField(default=0)),
+                ("status_2xx", models.PositiveIntegerField(default=0)),
+                ("status_4xx", models.PositiveIntegerField(default=0)),
+                ("status_5xx", models.PositiveIntegerField(default=0)),
+                ("p50_ms", models.FloatField(blank=True, null=True)),
+                ("p95_ms", models.FloatField(blank=True, null=True)),
+                ("p99_ms", models.FloatField(blank=True, null=True)),
+                (
+                    "latency_sketch",
+                    models.JSONField(
+                        blank=True,
+                        default=dict,
+                        help_text="Mergeable log-bucket latency histogram {z, b}; p50/p95/p99 are derived from it.",
+                    ),
+                ),
+                ("geo_counts", models.JSONField(blank=True, default=dict)),
+                ("top_paths", models.JSONField(blank=True, default=list)),
+                ("top_ips", models.JSONField(blank=True, default=list)),
+                (
+                    "topk_floor",
+                    models.JSONField(
+                        blank=True,
+                        default=dict,
+                        help_text="Upper bound on the count of any path / IP not listed: {paths, ips}.",
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("bucket_start", models.DateTimeField(db_index=True, help_text="UTC day start (inclusive).")),
+            ],
+            options={
+                "ordering": ["bucket_start", "source_id"],
+                "unique_together": {("bucket_start", "source_id")},
+            },
+        ),
+    ]
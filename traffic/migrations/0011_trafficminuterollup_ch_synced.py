@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("traffic", "0010_traffichourrollup_trafficdayrollup"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="trafficminuterollup",
+            name="ch_synced",
+            field=models.BooleanField(
+                db_index=True,
+                default=False,
+                help_text="Current version mirrored to ClickHouse; traffic_rollup_prune may delete it once outside the hot window.",
+            ),
+        ),
+    ]
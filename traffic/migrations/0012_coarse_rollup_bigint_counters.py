@@ -0,0 +1,61 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("traffic", "0011_trafficminuterollup_ch_synced"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="traffichourrollup",
+            name="requests",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name="traffichourrollup",
+            name="count_latency",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name="traffichourrollup",
+            name="status_2xx",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name="traffichourrollup",
+            name="status_4xx",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name="traffichourrollup",
+            name="status_5xx",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name="trafficdayrollup",
+            name="requests",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name="trafficdayrollup",
+            name="count_latency",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name="trafficdayrollup",
+            name="status_2xx",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name="trafficdayrollup",
+            name="status_4xx",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name="trafficdayrollup",
+            name="status_5xx",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -33,6 +33,13 @@ class TrafficDashboardConfig(models.Model):
         default="json",
         choices=[("json", "JSON lines"), ("combined", "Nginx combined")],
     )
+    nginx_log_format = models.TextField(
+        blank=True,
+        default="",
+        help_text="Text formats only: the Nginx log_format string, e.g. "
+        "'$remote_addr - $remote_user [$time_local] \"$request\" $status $body_bytes_sent \"$http_referer\" "
+        "\"$http_user_agent\" $request_time'. Lines are split on its literals. Empty = standard combined.",
+    )
     max_tail_bytes = models.PositiveIntegerField(
         default=5_242_880,
         help_text="Max bytes read from end of access log per request (file mode only).",
@@ -93,16 +100,9 @@ class TrafficDashboardConfig(models.Model):
         return "Traffic Dashboard Config"
 
 
-class TrafficMinuteRollup(models.Model):
-    """
-    Per-minute aggregates persisted from ingest (Redis buffer → flush job).
-    Enables arbitrary time-range charts without re-scanning the full raw log tail.
-    """
+class TrafficRollupBase(models.Model):
+    """Aggregate columns shared by the minute / hour / day rollup tables (all mergeable across buckets)."""
 
-    bucket_start = models.DateTimeField(
-        db_index=True,
-        help_text="UTC minute start (inclusive).",
-    )
     source_id = models.CharField(
         max_length=64,
         db_index=True,
@@ -119,11 +119,48 @@ class TrafficMinuteRollup(models.Model):
     p50_ms = models.FloatField(null=True, blank=True)
     p95_ms = models.FloatField(null=True, blank=True)
     p99_ms = models.FloatField(null=True, blank=True)
+    latency_sketch = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Mergeable log-bucket latency histogram {z, b}; p50/p95/p99 are derived from it.",
+    )
     geo_counts = models.JSONField(default=dict, blank=True)
     top_paths = models.JSONField(default=list, blank=True)
+    top_ips = models.JSONField(default=list, blank=True)
+    topk_floor = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Upper bound on the count of any path / IP not listed: {paths, ips}.",
+    )
 
     updated_at = models.DateTimeField(auto_now=True)
 
+    # 桶宽（秒）
+    BUCKET_SEC = 60
+
+    class Meta:
+        abstract = True
+
+    def __str__(self):
+        return f"{self.bucket_start.isoformat()} {self.source_id!r} n={self.requests}"
+
+
+class TrafficMinuteRollup(TrafficRollupBase):
+    """
+    Per-minute aggregates persisted from ingest (Redis buffer → flush job).
+    Enables arbitrary time-range charts without re-scanning the full raw log tail.
+    """
+
+    bucket_start = models.DateTimeField(
+        db_index=True,
+        help_text="UTC minute start (inclusive).",
+    )
+    ch_synced = models.BooleanField(
+        default=False,
+        db_index=True,
+        help_text="Current version mirrored to ClickHouse; traffic_rollup_prune may delete it once outside the hot window.",
+    )
+
     class Meta:
         ordering = ["bucket_start", "source_id"]
         unique_together = [("bucket_start", "source_id")]
@@ -131,5 +168,39 @@ class TrafficMinuteRollup(models.Model):
             models.Index(fields=["bucket_start", "source_id"]),
         ]
 
-    def __str__(self):
-        return f"{self.bucket_start.isoformat()} {self.source_id!r} n={self.requests}"
+
+class TrafficCoarseRollupBase(TrafficRollupBase):
+    """Hour / day rows: a busy source exceeds 2^31 requests per day, so the counters are 64-bit."""
+
+    requests = models.PositiveBigIntegerField(default=0)
+    count_latency = models.PositiveBigIntegerField(default=0)
+    status_2xx = models.PositiveBigIntegerField(default=0)
+    status_4xx = models.PositiveBigIntegerField(default=0)
+    status_5xx = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+
+class TrafficHourRollup(TrafficCoarseRollupBase):
+    """Hourly rollup, maintained incrementally by the flush job from the same deltas as the minute rows."""
+
+    BUCKET_SEC = 3600
+
+    bucket_start = models.DateTimeField(db_index=True, help_text="UTC hour start (inclusive).")
+
+    class Meta:
+        ordering = ["bucket_start", "source_id"]
+        unique_together = [("bucket_start", "source_id")]
+
+
+class TrafficDayRollup(TrafficCoarseRollupBase):
+    """Daily rollup (UTC days), maintained like ``TrafficHourRollup``."""
+
+    BUCKET_SEC = 86400
+
+    bucket_start = models.DateTimeField(db_index=True, help_text="UTC day start (inclusive).")
+
+    class Meta:
+        ordering = ["bucket_start", "source_id"]
+        unique_together = [("bucket_start", "source_id")]
@@ -0,0 +1,135 @@
+"""
+Traffic aggregation benchmark: list-of-dicts reference (``aggregator``) vs columnar (``columnar``).
+
+Both sides compute the full ``traffic_snapshot`` panel set from the same synthetic enriched records;
+the columnar side includes ``RecordBatch.from_records``. A parity section compares totals and p95 so a
+speed-up never hides a behaviour change.
+
+用法：python manage.py bench_traffic --records 200000 --out traffic_bench.json
+"""
+from __future__ import annotations
+
+import os
+import platform
+import random
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from .aggregator import aggregate_timeseries, geo_aggregate, overview_kpis, top_lists
+from .columnar import RecordBatch, snapshot_panels
+
+_COUNTRIES = [
+    ("CN", "China", "Guangdong", 23.1, 113.3),
+    ("US", "United States", None, 37.8, -122.4),
+    ("DE", "Germany", None, 50.1, 8.7),
+    ("JP", "Japan", None, 35.7, 139.7),
+    ("LAN", "Private", None, None, None),
+]
+
+
+def synthetic_records(
+    n: int,
+    span_sec: int = 86400,
+    paths: int = 500,
+    ips: int = 5000,
+    seed: int = 42,
+) -> List[Dict[str, Any]]:
+    """已 enrich 的记录（字段与 geoip_lookup.enrich_records 之后一致），时间均匀落在最近 span_sec 内。"""
+    rnd = random.Random(seed)
+    now = datetime.now(timezone.utc).timestamp()
+    ip_geo = [rnd.choice(_COUNTRIES) for _ in range(ips)]
+    statuses = [200] * 80 + [301, 304] * 5 + [404] * 6 + [500, 502]
+    out = []
+    for _ in range(n):
+        ip_i = rnd.randrange(ips)
+        cc, name, sub, lat, lng = ip_geo[ip_i]
+        out.append(
+            {
+                "ts": now - rnd.random() * span_sec,
+                "status": rnd.choice(statuses),
+                "request_time_ms": rnd.lognormvariate(3.5, 1.0),
+                # 长尾路径分布
+                "request_uri": "/api/v1/r%d" % int(rnd.paretovariate(1.2) * 3 % paths),
+                "remote_addr": "203.0.%d.%d" % (ip_i // 256, ip_i % 256),
+                "country_code": cc,
+                "country_name": name,
+                "subdivision": sub,
+                "lat": lat if lat is not None else 0.0,
+                "lng": lng if lng is not None else 0.0,
+            }
+        )
+    return out
+
+
+def _list_snapshot(records: List[Dict[str, Any]], range_key: str) -> Dict[str, Any]:
+    return {
+        "overview": overview_kpis(records, range_key),
+        "timeseries": aggregate_timeseries(records, range_key),
+        "geo": geo_aggregate(records, range_key, "country", ""),
+        "top_paths": top_lists(records, range_key, "paths", 10),
+        "top_slow": top_lists(records, range_key, "slow", 10),
+        "top_status": top_lists(records, range_key, "status", 20),
+        "top_ip": top_lists(records, range_key, "ip", 10),
+    }
+
+
+def _best(fn, repeat: int):
+    best = None
+    out = None
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        out = fn()
+        el = time.perf_counter() - t0
+        best = el if best is None else min(best, el)
+    return max(best or 0.0, 1e-9), out
+
+
+def _parity(a: Dict[str, Any], b: Dict[str, Any]) -> Dict[str, Any]:
+    pa = [x["p95_ms"] for x in a["top_paths"]["items"]]
+    pb = [x["p95_ms"] for x in b["top_paths"]["items"]]
+    return {
+        "total_requests": [a["overview"]["total_requests"], b["overview"]["total_requests"]],
+        "buckets": [len(a["timeseries"]["qps"]), len(b["timeseries"]["qps"])],
+        "top_paths_same": [x["path"] for x in a["top_paths"]["items"]] == [x["path"] for x in b["top_paths"]["items"]],
+        "top_paths_p95_max_abs_diff": round(max((abs(x - y) for x, y in zip(pa, pb)), default=0.0), 4),
+        "top_ip_same": a["top_ip"]["items"] == b["top_ip"]["items"],
+    }
+
+
+def run_benchmarks(
+    records: int = 100_000,
+    ranges: Optional[List[str]] = None,
+    paths: int = 500,
+    ips: int = 5000,
+    repeat: int = 3,
+) -> Dict[str, Any]:
+    ranges = ranges or ["1h", "24h"]
+    data = synthetic_records(records, paths=paths, ips=ips)
+    results: Dict[str, Any] = {}
+    t_conv, batch = _best(lambda: RecordBatch.from_records(data), repeat)
+    results["from_records"] = {"seconds": round(t_conv, 6), "per_sec": round(records / t_conv, 1)}
+    for rk in ranges:
+        t_list, ref = _best(lambda: _list_snapshot(data, rk), repeat)
+        t_col, col = _best(lambda: snapshot_panels(batch, rk), repeat)
+        results[rk] = {
+            "list_seconds": round(t_list, 6),
+            "columnar_seconds": round(t_col, 6),
+            "columnar_with_convert_seconds": round(t_col + t_conv, 6),
+            "speedup": round(t_list / t_col, 2),
+            "speedup_with_convert": round(t_list / (t_col + t_conv), 2),
+            "parity": _parity(ref, col),
+        }
+    return {
+        "meta": {
+            "ts": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "records": records,
+            "paths": paths,
+            "ips": ips,
+            "repeat": repeat,
+        },
+        "results": results,
+    }
@@ -1,9 +1,11 @@
 """
-ClickHouse：分钟聚合长期存储（与 Postgres 双写：flush 后写入）。
+ClickHouse：分钟 / 小时 / 天聚合长期存储（与 Postgres 双写：flush 后写入）。
 
 Env（CLICKHOUSE_HOST 未设置则整模块不启用）：
   CLICKHOUSE_HOST, CLICKHOUSE_PORT (8123), CLICKHOUSE_USER, CLICKHOUSE_PASSWORD,
-  CLICKHOUSE_DATABASE (traffic), CLICKHOUSE_ROLLUP_TABLE (traffic_minute_rollup)
+  CLICKHOUSE_DATABASE (traffic), CLICKHOUSE_ROLLUP_TABLE (traffic_minute_rollup),
+  CLICKHOUSE_ROLLUP_HOUR_TABLE (traffic_hour_rollup), CLICKHOUSE_ROLLUP_DAY_TABLE (traffic_day_rollup),
+  CLICKHOUSE_ROLLUP_AGG_ENABLED / CLICKHOUSE_ROLLUP_AGG_TABLE (traffic_rollup_agg)
 
 DDL：infra/clickhouse/traffic_minute_rollup.sql
 K8s：infra/kubernetes/middleware-system/clickhouse-traffic.yaml
@@ -16,12 +18,21 @@ import os
 import re
 from datetime import datetime, timezone
 from types import SimpleNamespace
-from typing import Any, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
+
+from .sketches import HeavyHitters, LatencyHistogram
 
 logger = logging.getLogger(__name__)
 
 _TABLE_RE = re.compile(r"^[a-zA-Z_][a-zA-Z0-9_]*$")
 
+# 桶宽（秒）→ (表名环境变量, 默认表名)
+_ROLLUP_TABLES = {
+    60: ("CLICKHOUSE_ROLLUP_TABLE", "traffic_minute_rollup"),
+    3600: ("CLICKHOUSE_ROLLUP_HOUR_TABLE", "traffic_hour_rollup"),
+    86400: ("CLICKHOUSE_ROLLUP_DAY_TABLE", "traffic_day_rollup"),
+}
+
 
 def clickhouse_configured() -> bool:
     return bool((os.environ.get("CLICKHOUSE_HOST") or "").strip())
@@ -43,27 +54,49 @@ def _ch_client():
     return clickhouse_connect.get_client(host=host, port=port, username=user, password=password)
 
 
-def insert_traffic_minute_rollup_from_model(obj: Any) -> None:
-    """flush 落库 Postgres 后调用；失败只打日志，不影响主流程。"""
-    if not clickhouse_configured():
-        return
-    table = (os.environ.get("CLICKHOUSE_ROLLUP_TABLE") or "traffic_minute_rollup").strip()
+def _rollup_table(bucket_sec: int) -> Optional[Tuple[str, str]]:
+    """(database, table)；名字不合法返回 None。"""
+    env, default = _ROLLUP_TABLES.get(bucket_sec, _ROLLUP_TABLES[60])
+    table = (os.environ.get(env) or default).strip()
     database = (os.environ.get("CLICKHOUSE_DATABASE") or "traffic").strip()
     if not _TABLE_RE.match(table) or not _TABLE_RE.match(database):
-        return
-    try:
-        client = _ch_client()
-    except Exception as e:
-        logger.warning("ClickHouse client failed: %s", e)
-        return
+        return None
+    return database, table
 
-    bt = _utc_naive(obj.bucket_start)
-    ver = datetime.now(timezone.utc).replace(tzinfo=None)
-    geo_s = json.dumps(obj.geo_counts or {}, ensure_ascii=False)
-    paths_s = json.dumps(obj.top_paths or [], ensure_ascii=False)
 
-    row = [
-        bt,
+def _json_or(raw: Any, default: Any) -> Any:
+    if isinstance(raw, str) and raw.strip():
+        try:
+            return json.loads(raw)
+        except json.JSONDecodeError:
+            return default
+    return default
+
+
+_ROW_COLUMNS = [
+    "bucket_start",
+    "source_id",
+    "requests",
+    "sum_latency_ms",
+    "count_latency",
+    "status_2xx",
+    "status_4xx",
+    "status_5xx",
+    "p50_ms",
+    "p95_ms",
+    "p99_ms",
+    "geo_counts",
+    "top_paths",
+    "latency_sketch",
+    "top_ips",
+    "topk_floor",
+    "ver",
+]
+
+
+def _model_row(obj: Any, ver: datetime) -> List[Any]:
+    return [
+        _utc_naive(obj.bucket_start),
         str(obj.source_id or ""),
         int(obj.requests or 0),
         int(obj.sum_latency_ms or 0),
@@ -74,47 +107,66 @@ def insert_traffic_minute_rollup_from_model(obj: Any) -> None:
         obj.p50_ms,
         obj.p95_ms,
         obj.p99_ms,
-        geo_s,
-        paths_s,
+        json.dumps(obj.geo_counts or {}, ensure_ascii=False),
+        json.dumps(obj.top_paths or [], ensure_ascii=False),
+        json.dumps(getattr(obj, "latency_sketch", None) or {}, separators=(",", ":")),
+        json.dumps(getattr(obj, "top_ips", None) or [], ensure_ascii=False),
+        json.dumps(getattr(obj, "topk_floor", None) or {}),
         ver,
     ]
-    cols = [
-        "bucket_start",
-        "source_id",
-        "requests",
-        "sum_latency_ms",
-        "count_latency",
-        "status_2xx",
-        "status_4xx",
-        "status_5xx",
-        "p50_ms",
-        "p95_ms",
-        "p99_ms",
-        "geo_counts",
-        "top_paths",
-        "ver",
-    ]
+
+
+def insert_rollups_from_models(objs: List[Any]) -> List[Any]:
+    """
+    flush 落库 Postgres 后调用：按模型的 BUCKET_SEC 分表，每张表一次多行 insert。
+    返回写入成功的对象；失败只打日志，不影响主流程。
+    """
+    if not objs or not clickhouse_configured():
+        return []
+    by_bs: Dict[int, List[Any]] = {}
+    for obj in objs:
+        by_bs.setdefault(getattr(obj, "BUCKET_SEC", 60), []).append(obj)
     try:
-        client.insert(table, [row], database=database, column_names=cols)
+        client = _ch_client()
     except Exception as e:
-        logger.warning("ClickHouse insert traffic_minute_rollup failed: %s", e)
+        logger.warning("ClickHouse client failed: %s", e)
+        return []
+    ver = datetime.now(timezone.utc).replace(tzinfo=None)
+    done: List[Any] = []
+    for bs, group in by_bs.items():
+        names = _rollup_table(bs)
+        if names is None:
+            continue
+        database, table = names
+        try:
+            client.insert(table, [_model_row(o, ver) for o in group], database=database, column_names=_ROW_COLUMNS)
+        except Exception as e:
+            logger.warning("ClickHouse insert %s failed: %s", table, e)
+            continue
+        done.extend(group)
+    return done
+
+
+def insert_rollup_from_model(obj: Any) -> bool:
+    """单行版本；返回是否写入成功。"""
+    return bool(insert_rollups_from_models([obj]))
 
 
-def query_minute_rollups_clickhouse(
-    start: datetime, end: datetime, source_id: str
+def query_rollups_clickhouse(
+    start: datetime, end: datetime, source_id: str, bucket_sec: int = 60
 ) -> Optional[List[Any]]:
     """
-    None = 未配置或查询异常；[] = 已配置但无行。
+    None = 未配置或查询异常；[] = 已配置但无行。bucket_sec 选择分钟 / 小时 / 天表。
     使用 ReplacingMergeTree FINAL 折叠同键多版本。
     """
     if not clickhouse_configured():
         return None
 
-    table = (os.environ.get("CLICKHOUSE_ROLLUP_TABLE") or "traffic_minute_rollup").strip()
-    database = (os.environ.get("CLICKHOUSE_DATABASE") or "traffic").strip()
-    if not _TABLE_RE.match(table) or not _TABLE_RE.match(database):
+    names = _rollup_table(bucket_sec)
+    if names is None:
         logger.warning("Invalid CLICKHOUSE database/table")
         return None
+    database, table = names
 
     sid = (source_id or "").strip()
     start_n = _utc_naive(start)
@@ -125,7 +177,8 @@ def query_minute_rollups_clickhouse(
     sql = f"""
         SELECT bucket_start, source_id, requests, sum_latency_ms, count_latency,
                status_2xx, status_4xx, status_5xx,
-               p50_ms, p95_ms, p99_ms, geo_counts, top_paths
+               p50_ms, p95_ms, p99_ms, geo_counts, top_paths, latency_sketch,
+               top_ips, topk_floor
         FROM `{database}`.`{table}` FINAL
         WHERE bucket_start >= toDateTime('{start_s}')
           AND bucket_start < toDateTime('{end_s}')
@@ -165,6 +218,9 @@ def query_minute_rollups_clickhouse(
             p99,
             geo_raw,
             paths_raw,
+            sketch_raw,
+            ips_raw,
+            floor_raw,
         ) = tup
         geo_counts: dict = {}
         top_paths: List[dict] = []
@@ -182,6 +238,9 @@ def query_minute_rollups_clickhouse(
                 top_paths = paths_raw
         except json.JSONDecodeError:
             pass
+        latency_sketch = _json_or(sketch_raw, {})
+        top_ips = _json_or(ips_raw, [])
+        topk_floor = _json_or(floor_raw, {})
         bt = bucket_start
         if isinstance(bt, datetime) and bt.tzinfo is None:
             bt = bt.replace(tzinfo=timezone.utc)
@@ -200,6 +259,206 @@ def query_minute_rollups_clickhouse(
                 p99_ms=float(p99) if p99 is not None else None,
                 geo_counts=geo_counts,
                 top_paths=top_paths,
+                latency_sketch=latency_sketch,
+                top_ips=top_ips,
+                topk_floor=topk_floor,
             )
         )
     return rows
+
+
+# -------------------------
+# 预聚合表（SummingMergeTree，flush 写入每分钟增量，查询在服务端按步长 GROUP BY）
+# -------------------------
+def rollup_agg_enabled() -> bool:
+    """CLICKHOUSE_ROLLUP_AGG_ENABLED=1：flush 额外写 traffic_rollup_agg，长区间 snapshot 由 ClickHouse 聚合。"""
+    return clickhouse_configured() and os.environ.get("CLICKHOUSE_ROLLUP_AGG_ENABLED", "").strip().lower() in (
+        "1",
+        "true",
+        "yes",
+        "on",
+    )
+
+
+def _agg_table() -> Optional[Tuple[str, str]]:
+    table = (os.environ.get("CLICKHOUSE_ROLLUP_AGG_TABLE") or "traffic_rollup_agg").strip()
+    database = (os.environ.get("CLICKHOUSE_DATABASE") or "traffic").strip()
+    if not _TABLE_RE.match(table) or not _TABLE_RE.match(database):
+        return None
+    return database, table
+
+
+_AGG_COLUMNS = [
+    "bucket_start",
+    "source_id",
+    "requests",
+    "sum_latency_ms",
+    "count_latency",
+    "status_2xx",
+    "status_4xx",
+    "status_5xx",
+    "latency_zero",
+    "latency_bins",
+    "geo",
+    "paths",
+    "paths_err",
+    "paths_floor",
+    "ips",
+    "ips_err",
+    "ips_floor",
+]
+
+
+def insert_rollup_deltas(deltas: List[Tuple[datetime, str, Any]], top_n: int) -> None:
+    """
+    [(bucket_start, source_id, RollupDelta)] 一次多行写入；行是增量，SummingMergeTree 合并时按键求和
+    （Map 列按 key 求和），同一分钟再次 flush 只需再插一行。
+    """
+    if not deltas or not rollup_agg_enabled():
+        return
+    names = _agg_table()
+    if names is None:
+        return
+    database, table = names
+    rows = []
+    for bt, src, d in deltas:
+        paths = d.paths_hh.top(top_n)
+        ips = d.ips_hh.top(top_n)
+        rows.append(
+            [
+                _utc_naive(bt),
+                str(src or ""),
+                int(d.req),
+                max(0, int(d.sum_lat)),
+                max(0, int(d.n_lat)),
+                int(d.s2),
+                int(d.s4),
+                int(d.s5),
+                int(d.sketch.zero),
+                {int(k): int(n) for k, n in d.sketch.bins.items()},
+                {str(k): int(n) for k, n in d.geo_counts.items()},
+                {k: int(c) for k, c, _ in paths},
+                {k: int(e) for k, _, e in paths if e},
+                # 截断掉的 key 计数不超过截断处的值
+                int(max(d.paths_hh.floor, paths[-1][1] if len(paths) < len(d.paths_hh.items) else 0)),
+                {k: int(c) for k, c, _ in ips},
+                {k: int(e) for k, _, e in ips if e},
+                int(max(d.ips_hh.floor, ips[-1][1] if len(ips) < len(d.ips_hh.items) else 0)),
+            ]
+        )
+    try:
+        _ch_client().insert(table, rows, database=database, column_names=_AGG_COLUMNS)
+    except Exception as e:
+        logger.warning("ClickHouse insert %s failed: %s", table, e)
+
+
+def _agg_where(start: datetime, end: datetime, source_id: str) -> str:
+    start_s = _utc_naive(start).strftime("%Y-%m-%d %H:%M:%S")
+    end_s = _utc_naive(end).strftime("%Y-%m-%d %H:%M:%S")
+    where = f"bucket_start >= toDateTime('{start_s}') AND bucket_start < toDateTime('{end_s}')"
+    sid = (source_id or "").strip()
+    if sid and sid != "all":
+        sid_esc = sid.replace("\\", "\\\\").replace("'", "''")
+        where += f" AND source_id = '{sid_esc}'"
+    return where
+
+
+def _agg_topk(client, src_sql: str, where: str, col: str, total_floor: int, limit: int) -> HeavyHitters:
+    """服务端展开 Map 并按 key 求和，只返回前 limit 个；上界 = 计数 + 未收录该 key 的分钟的 floor 之和。"""
+    sql = f"""
+        SELECT k, sum(v) AS c, sum({col}_err[k]) AS e, sum({col}_floor) AS f
+        FROM {src_sql}
+        ARRAY JOIN mapKeys({col}) AS k, mapValues({col}) AS v
+        WHERE {where}
+        GROUP BY k
+        ORDER BY c DESC
+        LIMIT {int(limit)}
+    """
+    items: Dict[str, list] = {}
+    last = 0
+    for k, c, e, f in client.query(sql).result_rows:
+        missing = max(0, total_floor - int(f or 0))
+        items[str(k)] = [int(c) + missing, int(e or 0) + missing]
+        last = int(c)
+    # 被 LIMIT 截掉的 key：计数不超过最后一名 + 全部 floor
+    floor = total_floor + last if len(items) >= limit else total_floor
+    return HeavyHitters(items, floor)
+
+
+def query_rollup_agg(
+    start: datetime, end: datetime, source_id: str, step_sec: int, top_limit: int = 1000
+) -> Optional[Dict[str, Any]]:
+    """
+    服务端聚合：按 step_sec 分桶的计数与延迟直方图序列、整段 geo 计数、top path / IP。
+    None = 未启用或查询异常；rows = 0 表示区间内无数据（调用方回退到逐行读取）。
+    """
+    if not rollup_agg_enabled():
+        return None
+    names = _agg_table()
+    if names is None:
+        return None
+    database, table = names
+    src_sql = f"`{database}`.`{table}`"
+    where = _agg_where(start, end, source_id)
+    step = max(60, int(step_sec))
+    series_sql = f"""
+        SELECT toDateTime(intDiv(toUInt32(bucket_start), {step}) * {step}, 'UTC') AS t,
+               sum(requests), sum(sum_latency_ms), sum(count_latency),
+               sum(status_2xx), sum(status_4xx), sum(status_5xx),
+               sum(latency_zero), sumMap(latency_bins), count()
+        FROM {src_sql}
+        WHERE {where}
+        GROUP BY t
+        ORDER BY t
+    """
+    totals_sql = f"""
+        SELECT sumMap(geo), sum(paths_floor), sum(ips_floor)
+        FROM {src_sql}
+        WHERE {where}
+    """
+    try:
+        client = _ch_client()
+        series_rows = client.query(series_sql).result_rows
+        n_rows = sum(int(r[9] or 0) for r in series_rows)
+        if not n_rows:
+            return {"series": [], "geo": {}, "paths": HeavyHitters(), "ips": HeavyHitters(), "rows": 0}
+        geo, paths_floor, ips_floor = client.query(totals_sql).result_rows[0]
+        paths = _agg_topk(client, src_sql, where, "paths", int(paths_floor or 0), top_limit)
+        ips = _agg_topk(client, src_sql, where, "ips", int(ips_floor or 0), top_limit)
+    except ImportError:
+        logger.warning("clickhouse-connect not installed")
+        return None
+    except Exception as e:
+        logger.warning("ClickHouse rollup agg query failed: %s", e)
+        return None
+
+    series: List[Dict[str, Any]] = []
+    for t, req, sum_lat, n_lat, s2, s4, s5, zero, bins, _n in series_rows:
+        sk = LatencyHistogram()
+        sk.zero = int(zero or 0)
+        sk.bins = {int(k): int(n) for k, n in (bins or {}).items() if n}
+        sk.count = sk.zero + sum(sk.bins.values())
+        if isinstance(t, datetime) and t.tzinfo is None:
+            t = t.replace(tzinfo=timezone.utc)
+        series.append(
+            {
+                "bucket_start": t,
+                "requests": int(req or 0),
+                "sum_latency_ms": int(sum_lat or 0),
+                "count_latency": int(n_lat or 0),
+                "status_2xx": int(s2 or 0),
+                "status_4xx": int(s4 or 0),
+                "status_5xx": int(s5 or 0),
+                "p50_ms": sk.quantile(0.50),
+                "p95_ms": sk.quantile(0.95),
+                "p99_ms": sk.quantile(0.99),
+                "latency_sketch": sk,
+            }
+        )
+    return {
+        "series": series,
+        "geo": {(str(k) or "??"): int(v) for k, v in (geo or {}).items() if v},
+        "paths": paths,
+        "ips": ips,
+        "rows": n_rows,
+    }
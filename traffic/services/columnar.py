@@ -0,0 +1,466 @@
+"""
+Columnar record batches for traffic aggregation.
+
+``RecordBatch.from_records`` turns enriched record dicts into NumPy columns (ts float64, status int16,
+latency float32, interned uri / ip / country / subdivision ids) in one pass. Panels are then computed
+with vectorised grouping — ``np.bincount`` for counters and a single lexsort for grouped percentiles
+(linear interpolation, same as ``np.percentile``) — instead of per-bucket / per-URI dict lists.
+
+``snapshot_panels`` computes every ``traffic_snapshot`` panel from one window mask and one set of group
+ids. The list-based functions in ``aggregator`` stay as the reference implementation (see
+``traffic.services.benchmark``); output shapes are identical.
+"""
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .aggregator import _empty_ts, bucket_seconds, window_bounds
+
+
+class RecordBatch:
+    __slots__ = (
+        "ts", "status", "latency", "uri_id", "ip_id", "cc_id", "sub_id", "geo_lat", "geo_lng",
+        "uris", "ips", "ip_country", "countries", "country_names", "subdivisions",
+    )
+
+    def __init__(self):
+        self.ts = np.empty(0, dtype=np.float64)
+        self.status = np.empty(0, dtype=np.int16)
+        # NaN = 记录没有耗时字段
+        self.latency = np.empty(0, dtype=np.float32)
+        self.uri_id = np.empty(0, dtype=np.int32)
+        self.ip_id = np.empty(0, dtype=np.int32)
+        self.cc_id = np.empty(0, dtype=np.int32)
+        # -1 = 非 CN
+        self.sub_id = np.empty(0, dtype=np.int32)
+        self.geo_lat = np.empty(0, dtype=np.float64)
+        self.geo_lng = np.empty(0, dtype=np.float64)
+        self.uris: List[str] = []
+        self.ips: List[str] = []
+        self.ip_country: List[str] = []
+        self.countries: List[str] = []
+        self.country_names: List[str] = []
+        self.subdivisions: List[str] = []
+
+    def __len__(self) -> int:
+        return int(self.ts.shape[0])
+
+    @classmethod
+    def from_records(cls, records: Sequence[Dict[str, Any]]) -> "RecordBatch":
+        b = cls()
+        n = len(records)
+        ts = np.empty(n, dtype=np.float64)
+        status = np.empty(n, dtype=np.int16)
+        lat = np.empty(n, dtype=np.float32)
+        uri_id = np.empty(n, dtype=np.int32)
+        ip_id = np.empty(n, dtype=np.int32)
+        cc_id = np.empty(n, dtype=np.int32)
+        sub_id = np.full(n, -1, dtype=np.int32)
+        glat = np.empty(n, dtype=np.float64)
+        glng = np.empty(n, dtype=np.float64)
+        uri_ix: Dict[str, int] = {}
+        ip_ix: Dict[str, int] = {}
+        cc_ix: Dict[str, int] = {}
+        sub_ix: Dict[str, int] = {}
+        nan = float("nan")
+        for i, r in enumerate(records):
+            ts[i] = r["ts"]
+            st = r.get("status") or 0
+            status[i] = st if -32768 <= st <= 32767 else 0
+            v = r.get("request_time_ms")
+            lat[i] = nan if v is None else v
+            u = r.get("request_uri")
+            k = uri_ix.get(u)
+            if k is None:
+                k = uri_ix[u] = len(b.uris)
+                b.uris.append(u)
+            uri_id[i] = k
+            ip = r.get("remote_addr") or "-"
+            k = ip_ix.get(ip)
+            if k is None:
+                k = ip_ix[ip] = len(b.ips)
+                b.ips.append(ip)
+                b.ip_country.append(r.get("country_name") or "")
+            ip_id[i] = k
+            code = r.get("country_code") or "??"
+            k = cc_ix.get(code)
+            if k is None:
+                k = cc_ix[code] = len(b.countries)
+                b.countries.append(code)
+                b.country_names.append(r.get("country_name") or code)
+            cc_id[i] = k
+            if code.upper() == "CN":
+                sub = r.get("subdivision") or "Unknown"
+                k = sub_ix.get(sub)
+                if k is None:
+                    k = sub_ix[sub] = len(b.subdivisions)
+                    b.subdivisions.append(sub)
+                sub_id[i] = k
+            gl = r.get("lat")
+            glat[i] = nan if gl is None else gl
+            glng[i] = r.get("lng") or 0.0
+        b.ts, b.status, b.latency = ts, status, lat
+        b.uri_id, b.ip_id, b.cc_id, b.sub_id = uri_id, ip_id, cc_id, sub_id
+        b.geo_lat, b.geo_lng = glat, glng
+        return b
+
+    @classmethod
+    def concat(cls, batches: Sequence["RecordBatch"]) -> "RecordBatch":
+        """按顺序拼接多个批次，字符串表重新 intern（各批次的 id 映射到合并后的表）。"""
+        batches = [x for x in batches if len(x)]
+        if len(batches) == 1:
+            return batches[0]
+        b = cls()
+        if not batches:
+            return b
+        uri_ix: Dict[Any, int] = {}
+        ip_ix: Dict[str, int] = {}
+        cc_ix: Dict[str, int] = {}
+        sub_ix: Dict[str, int] = {}
+
+        def remap(values, ix, out, extra=None, extra_out=None):
+            m = np.empty(len(values), dtype=np.int32)
+            for j, v in enumerate(values):
+                k = ix.get(v)
+                if k is None:
+                    k = ix[v] = len(out)
+                    out.append(v)
+                    if extra is not None:
+                        extra_out.append(extra[j])
+                m[j] = k
+            return m
+
+        uri_id, ip_id, cc_id, sub_id = [], [], [], []
+        for x in batches:
+            uri_id.append(remap(x.uris, uri_ix, b.uris)[x.uri_id])
+            ip_id.append(remap(x.ips, ip_ix, b.ips, x.ip_country, b.ip_country)[x.ip_id])
+            cc_id.append(remap(x.countries, cc_ix, b.countries, x.country_names, b.country_names)[x.cc_id])
+            sm = np.append(remap(x.subdivisions, sub_ix, b.subdivisions), -1).astype(np.int32)
+            # sub_id = -1 取到末尾追加的 -1
+            sub_id.append(sm[x.sub_id])
+        b.ts = np.concatenate([x.ts for x in batches])
+        b.status = np.concatenate([x.status for x in batches])
+        b.latency = np.concatenate([x.latency for x in batches])
+        b.uri_id, b.ip_id = np.concatenate(uri_id), np.concatenate(ip_id)
+        b.cc_id, b.sub_id = np.concatenate(cc_id), np.concatenate(sub_id)
+        b.geo_lat = np.concatenate([x.geo_lat for x in batches])
+        b.geo_lng = np.concatenate([x.geo_lng for x in batches])
+        return b
+
+    def tail(self, n: int) -> "RecordBatch":
+        """最后 n 条（字符串表共用，未引用的项不影响聚合）。"""
+        if n >= len(self):
+            return self
+        b = RecordBatch()
+        sl = slice(len(self) - max(0, n), None)
+        for name in ("ts", "status", "latency", "uri_id", "ip_id", "cc_id", "sub_id", "geo_lat", "geo_lng"):
+            setattr(b, name, getattr(self, name)[sl])
+        for name in ("uris", "ips", "ip_country", "countries", "country_names", "subdivisions"):
+            setattr(b, name, getattr(self, name))
+        return b
+
+    def iter_records(self):
+        """还原为 enrich 之后的记录 dict（供按记录累加的增量聚合使用）。"""
+        nan_lat = np.isnan(self.latency)
+        lat = self.latency.astype(np.float64).tolist()
+        glat, glng = self.geo_lat.tolist(), self.geo_lng.tolist()
+        uris, ips, codes, names, subs = self.uris, self.ips, self.countries, self.country_names, self.subdivisions
+        for i, (ts, st, u, ip, cc, sub) in enumerate(
+            zip(
+                self.ts.tolist(),
+                self.status.tolist(),
+                self.uri_id.tolist(),
+                self.ip_id.tolist(),
+                self.cc_id.tolist(),
+                self.sub_id.tolist(),
+            )
+        ):
+            yield {
+                "ts": ts,
+                "status": st,
+                "request_time_ms": None if nan_lat[i] else lat[i],
+                "request_uri": uris[u],
+                "remote_addr": ips[ip],
+                "country_code": codes[cc],
+                "country_name": names[cc],
+                "subdivision": subs[sub] if sub >= 0 else None,
+                "lat": None if glat[i] != glat[i] else glat[i],
+                "lng": glng[i],
+            }
+
+
+# -------------------------
+# vectorised helpers
+# -------------------------
+def grouped_percentiles(groups: np.ndarray, values: np.ndarray, ngroups: int, qs: Sequence[float]) -> List[np.ndarray]:
+    """每组的分位数（linear 插值，与 np.percentile 一致）；空组为 0。groups 为 [0, ngroups) 的整数。"""
+    order = np.lexsort((values, groups))
+    v = values[order].astype(np.float64)
+    counts = np.bincount(groups, minlength=ngroups)
+    offsets = np.zeros(ngroups, dtype=np.int64)
+    if ngroups > 1:
+        np.cumsum(counts[:-1], out=offsets[1:])
+    nonempty = counts > 0
+    last = np.maximum(counts - 1, 0)
+    out = []
+    for q in qs:
+        rank = q * last
+        lo = np.floor(rank).astype(np.int64)
+        hi = np.minimum(lo + 1, last)
+        frac = rank - lo
+        res = np.zeros(ngroups, dtype=np.float64)
+        if v.size:
+            a = v[np.where(nonempty, offsets + lo, 0)]
+            c = v[np.where(nonempty, offsets + hi, 0)]
+            res = np.where(nonempty, a + (c - a) * frac, 0.0)
+        out.append(res)
+    return out
+
+
+def _grouped_max(groups: np.ndarray, values: np.ndarray, ngroups: int) -> np.ndarray:
+    out = np.full(ngroups, -np.inf)
+    np.maximum.at(out, groups, values.astype(np.float64))
+    return out
+
+
+def _rank(counts: np.ndarray, first_seen: np.ndarray) -> np.ndarray:
+    """按 count 降序，同数按窗口内首次出现顺序（与 dict + sorted 的稳定排序一致）。"""
+    return np.lexsort((first_seen, -counts))
+
+
+def _compact(ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """把窗口内出现的 id 压成 0..k-1：返回 (原 id, 组号, 每组首次出现位置)。"""
+    uniq, first, inv = np.unique(ids, return_index=True, return_inverse=True)
+    return uniq, inv.reshape(-1), first
+
+
+class _Window:
+    """一次过滤 + 一次分组，供各面板共用。"""
+
+    def __init__(self, batch: RecordBatch, range_key: str, bounds: Optional[Tuple[float, float]] = None):
+        self.batch = batch
+        self.range_key = range_key
+        self.start, self.end = bounds or window_bounds(range_key)
+        self.bs = bucket_seconds(range_key)
+        m = (batch.ts >= self.start) & (batch.ts <= self.end)
+        self.idx = np.nonzero(m)[0]
+        self.ts = batch.ts[self.idx]
+        self.status = batch.status[self.idx].astype(np.int32)
+        self.latency = batch.latency[self.idx]
+        self.n = int(self.idx.size)
+        self._uri = None
+
+    # ---- time buckets ----
+    def buckets(self):
+        if not hasattr(self, "_buckets"):
+            bt = (np.floor(self.ts / self.bs) * self.bs).astype(np.int64)
+            times, inv = np.unique(bt, return_inverse=True)
+            self._buckets = (times, inv.reshape(-1))
+        return self._buckets
+
+    def uri_groups(self):
+        if self._uri is None:
+            self._uri = _compact(self.batch.uri_id[self.idx])
+        return self._uri
+
+
+def _timeseries(w: _Window) -> Dict[str, Any]:
+    if not w.n:
+        return _empty_ts(w.start, w.end, w.bs)
+    times, inv = w.buckets()
+    k = times.size
+    dur = max(w.bs, 1)
+    n = np.bincount(inv, minlength=k)
+    st = w.status
+    c2 = np.bincount(inv, weights=(st >= 200) & (st < 400), minlength=k)
+    c4 = np.bincount(inv, weights=(st >= 400) & (st < 500), minlength=k)
+    c5 = np.bincount(inv, weights=st >= 500, minlength=k)
+    has = ~np.isnan(w.latency)
+    p50, p95, p99 = grouped_percentiles(inv[has], w.latency[has], k, (0.50, 0.95, 0.99))
+    ms = (times * 1000).tolist()
+    n_l = n.tolist()
+
+    def rate(c):
+        return [[t, round(x / dur, 4)] for t, x in zip(ms, c.tolist())]
+
+    def pts(a):
+        return [[t, float(x)] for t, x in zip(ms, a.tolist())]
+
+    return {
+        "bucket_sec": w.bs,
+        "range": w.range_key,
+        "qps": [[t, round(x / dur, 4)] for t, x in zip(ms, n_l)],
+        "requests": [[t, x] for t, x in zip(ms, n_l)],
+        "latency": {"p50": pts(p50), "p95": pts(p95), "p99": pts(p99)},
+        "status_stack": {"2xx": rate(c2), "4xx": rate(c4), "5xx": rate(c5)},
+    }
+
+
+def _overview(w: _Window, ts_data: Dict[str, Any]) -> Dict[str, Any]:
+    now = datetime.now(timezone.utc).timestamp()
+    qps = int(np.count_nonzero(w.ts >= now - 60)) / 60.0
+    total = w.n
+    err = int(np.count_nonzero(w.status >= 400))
+    err_rate = (err / total * 100) if total else 0.0
+    lat = w.latency[~np.isnan(w.latency)]
+    lat = lat[lat != 0]
+    avg_lat = float(lat.astype(np.float64).mean()) if lat.size else 0.0
+
+    spark_qps = ts_data["qps"][-40:]
+    err_spark = []
+    if total:
+        times, inv = w.buckets()
+        n = np.bincount(inv, minlength=times.size)
+        e = np.bincount(inv, weights=w.status >= 400, minlength=times.size)
+        for t, nn, ee in list(zip((times * 1000).tolist(), n.tolist(), e.tolist()))[-40:]:
+            err_spark.append([t, round(ee / nn * 100, 3) if nn else 0.0])
+    return {
+        "range": w.range_key,
+        "refreshed_at": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+        "total_requests": total,
+        "total_requests_delta_pct": 0.0,
+        "qps": round(qps, 4),
+        "latency_avg_ms": round(avg_lat, 2),
+        "error_rate_pct": round(err_rate, 3),
+        "availability_pct": round(100.0 - min(err_rate, 100.0), 3),
+        "series": {"qps": spark_qps, "error_rate": err_spark[-len(spark_qps):]},
+    }
+
+
+def _geo(w: _Window, granularity: str, country_filter: str) -> Dict[str, Any]:
+    from .geo_centroids import centroid_for_country
+
+    b = w.batch
+    if granularity == "province" and (country_filter or "").upper() == "CN":
+        sub = b.sub_id[w.idx]
+        sub = sub[sub >= 0]
+        items = []
+        if sub.size:
+            uniq, inv, first = _compact(sub)
+            counts = np.bincount(inv, minlength=uniq.size)
+            for j in _rank(counts, first)[:80]:
+                name = b.subdivisions[int(uniq[j])]
+                items.append({"code": name, "name": name, "lat": 35.0, "lng": 105.0, "requests": int(counts[j])})
+        return {"range": w.range_key, "granularity": "province", "items": items}
+
+    items = []
+    if w.n:
+        uniq, inv, first = _compact(b.cc_id[w.idx])
+        counts = np.bincount(inv, minlength=uniq.size)
+        for j in _rank(counts, first)[:200]:
+            cid = int(uniq[j])
+            code = b.countries[cid]
+            rec = int(w.idx[first[j]])
+            if not np.isnan(b.geo_lat[rec]):
+                lat, lng = float(b.geo_lat[rec]), float(b.geo_lng[rec])
+            else:
+                c = centroid_for_country(code) if code not in ("LAN", "??") else None
+                lat, lng = (c[0], c[1]) if c else (0.0, 0.0)
+            items.append({"code": code, "name": b.country_names[cid], "lat": lat, "lng": lng, "requests": int(counts[j])})
+    return {"range": w.range_key, "granularity": "country", "items": items}
+
+
+def _top(w: _Window, top_type: str, limit: int) -> Dict[str, Any]:
+    b = w.batch
+    limit = max(1, min(limit, 100))
+
+    if top_type in ("paths", "slow"):
+        if not w.n:
+            return {"type": top_type, "range": w.range_key, "items": []}
+        uniq, inv, first = w.uri_groups()
+        k = uniq.size
+        counts = np.bincount(inv, minlength=k)
+        # 与 list 版一致：缺耗时的记录按 0 参与分位数
+        lat = np.nan_to_num(w.latency, nan=0.0)
+        if top_type == "paths":
+            e5 = np.bincount(inv, weights=w.status >= 500, minlength=k)
+            (p95,) = grouped_percentiles(inv, lat, k, (0.95,))
+            total = w.n or 1
+            rows = []
+            for j in _rank(counts, first)[:limit]:
+                n = int(counts[j])
+                rows.append(
+                    {
+                        "path": b.uris[int(uniq[j])],
+                        "requests": n,
+                        "p95_ms": round(float(p95[j]), 2),
+                        "errors_5xx": int(e5[j]),
+                        "share_pct": round(n / total * 100, 2),
+                    }
+                )
+            return {"type": "paths", "range": w.range_key, "items": rows}
+        p95, p99 = grouped_percentiles(inv, lat, k, (0.95, 0.99))
+        mx = _grouped_max(inv, lat, k)
+        p95r = np.round(p95, 2)
+        order = np.lexsort((first, -p95r))[:limit]
+        rows = [
+            {
+                "path": b.uris[int(uniq[j])],
+                "requests": int(counts[j]),
+                "p95_ms": float(p95r[j]),
+                "p99_ms": round(float(p99[j]), 2),
+                "max_ms": round(float(mx[j]), 2),
+            }
+            for j in order
+        ]
+        return {"type": "slow", "range": w.range_key, "items": rows}
+
+    if top_type == "status":
+        items = []
+        if w.n:
+            fam = np.where(w.status != 0, w.status // 100, 0)
+            fam = fam[fam >= 0]
+            counts = np.bincount(fam)
+            names = {f"{f}xx": int(c) for f, c in enumerate(counts.tolist()) if c}
+            items = [{"name": k, "value": v} for k, v in sorted(names.items())]
+        return {"type": "status", "range": w.range_key, "items": items}
+
+    if top_type == "ip":
+        rows = []
+        if w.n:
+            uniq, inv, first = _compact(b.ip_id[w.idx])
+            counts = np.bincount(inv, minlength=uniq.size)
+            for j in _rank(counts, first)[:limit]:
+                iid = int(uniq[j])
+                rows.append({"ip": b.ips[iid], "requests": int(counts[j]), "country": b.ip_country[iid]})
+        return {"type": "ip", "range": w.range_key, "items": rows}
+
+    return {"type": top_type, "range": w.range_key, "items": []}
+
+
+# -------------------------
+# public panels
+# -------------------------
+def batch_timeseries(batch: RecordBatch, range_key: str) -> Dict[str, Any]:
+    return _timeseries(_Window(batch, range_key))
+
+
+def batch_overview(batch: RecordBatch, range_key: str) -> Dict[str, Any]:
+    w = _Window(batch, range_key)
+    return _overview(w, _timeseries(w))
+
+
+def batch_geo(batch: RecordBatch, range_key: str, granularity: str, country_filter: str) -> Dict[str, Any]:
+    return _geo(_Window(batch, range_key), granularity, country_filter)
+
+
+def batch_top(batch: RecordBatch, range_key: str, top_type: str, limit: int) -> Dict[str, Any]:
+    return _top(_Window(batch, range_key), top_type, limit)
+
+
+def snapshot_panels(batch: RecordBatch, range_key: str) -> Dict[str, Any]:
+    """traffic_snapshot 的全部面板：一次窗口过滤、一次时间分桶、一次 URI 分组。"""
+    w = _Window(batch, range_key)
+    ts_data = _timeseries(w)
+    return {
+        "overview": _overview(w, ts_data),
+        "timeseries": ts_data,
+        "geo": _geo(w, "country", ""),
+        "top_paths": _top(w, "paths", 10),
+        "top_slow": _top(w, "slow", 10),
+        "top_status": _top(w, "status", 20),
+        "top_ip": _top(w, "ip", 10),
+    }
@@ -0,0 +1,107 @@
+"""
+Compact binary encoding of parsed + enriched traffic records (one blob per ingest batch).
+
+Layout: ``TRB1`` | uint32 header length | JSON header (interned uri / ip / country / subdivision tables)
+| fixed 26-byte records (ts f8, status i2, latency f4 NaN = none, uri i4, ip i4, country i2,
+subdivision i2 -1 = none) | per-IP lat / lng (f8). Blobs decode straight into a ``RecordBatch`` —
+no JSON / regex parsing and no GeoIP on dashboard reads — at roughly a tenth of the raw line size.
+"""
+from __future__ import annotations
+
+import json
+import struct
+from typing import Iterable, List
+
+import numpy as np
+
+from .columnar import RecordBatch
+
+MAGIC = b"TRB1"
+
+RECORD_DTYPE = np.dtype(
+    [
+        ("ts", "<f8"),
+        ("status", "<i2"),
+        ("latency", "<f4"),
+        ("uri", "<i4"),
+        ("ip", "<i4"),
+        ("cc", "<i2"),
+        ("sub", "<i2"),
+    ]
+)
+
+
+def encode_batch(batch: RecordBatch) -> bytes:
+    n = len(batch)
+    recs = np.empty(n, dtype=RECORD_DTYPE)
+    recs["ts"] = batch.ts
+    recs["status"] = batch.status
+    recs["latency"] = batch.latency
+    recs["uri"] = batch.uri_id
+    recs["ip"] = batch.ip_id
+    recs["cc"] = batch.cc_id
+    recs["sub"] = batch.sub_id
+    # 经纬度只由 IP 决定：按 IP 存一份
+    nip = len(batch.ips)
+    ip_lat = np.full(nip, np.nan)
+    ip_lng = np.zeros(nip)
+    ip_lat[batch.ip_id] = batch.geo_lat
+    ip_lng[batch.ip_id] = batch.geo_lng
+    header = json.dumps(
+        {
+            "n": n,
+            "u": batch.uris,
+            "i": batch.ips,
+            "ic": batch.ip_country,
+            "c": batch.countries,
+            "cn": batch.country_names,
+            "s": batch.subdivisions,
+        },
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+    return b"".join(
+        (MAGIC, struct.pack("<I", len(header)), header, recs.tobytes(), ip_lat.tobytes(), ip_lng.tobytes())
+    )
+
+
+def decode_batch(blob: bytes) -> RecordBatch:
+    if not blob or blob[:4] != MAGIC:
+        raise ValueError("not a compact traffic record blob")
+    (hlen,) = struct.unpack_from("<I", blob, 4)
+    off = 8 + hlen
+    header = json.loads(blob[8:off].decode("utf-8"))
+    n = int(header["n"])
+    recs = np.frombuffer(blob, dtype=RECORD_DTYPE, count=n, offset=off)
+    off += n * RECORD_DTYPE.itemsize
+    nip = len(header["i"])
+    ip_lat = np.frombuffer(blob, dtype="<f8", count=nip, offset=off)
+    ip_lng = np.frombuffer(blob, dtype="<f8", count=nip, offset=off + nip * 8)
+    b = RecordBatch()
+    b.ts = recs["ts"].astype(np.float64)
+    b.status = recs["status"].astype(np.int16)
+    b.latency = recs["latency"].astype(np.float32)
+    b.uri_id = recs["uri"].astype(np.int32)
+    b.ip_id = recs["ip"].astype(np.int32)
+    b.cc_id = recs["cc"].astype(np.int32)
+    b.sub_id = recs["sub"].astype(np.int32)
+    b.geo_lat = ip_lat[b.ip_id]
+    b.geo_lng = ip_lng[b.ip_id]
+    b.uris = header["u"]
+    b.ips = header["i"]
+    b.ip_country = header["ic"]
+    b.countries = header["c"]
+    b.country_names = header["cn"]
+    b.subdivisions = header["s"]
+    return b
+
+
+def decode_blobs(blobs: Iterable[bytes]) -> RecordBatch:
+    """按顺序解码并拼接；损坏的 blob 跳过。"""
+    parts: List[RecordBatch] = []
+    for blob in blobs:
+        try:
+            parts.append(decode_batch(blob))
+        except (ValueError, KeyError, TypeError, struct.error):
+            continue
+    return RecordBatch.concat(parts)
@@ -0,0 +1,284 @@
+"""
+Follow file-mode access logs instead of re-reading the tail on every request.
+
+``FileTail`` keeps an open fd plus (inode, offset) and returns only complete lines appended since the last
+read. Rename rotation (logrotate ``create``): the old fd is drained to EOF, then the new file is opened from
+offset 0. copytruncate: size < offset → restart at 0. The trailing partial line stays buffered.
+
+``FollowedFile`` parses + enriches new lines once and keeps them as ``RecordBatch`` chunks, trimmed to the
+largest ``max_tail_bytes`` asked for (capped by TRAFFIC_FILE_FOLLOW_MAX_BYTES). Dashboard reads then cost
+one stat + a read of the appended bytes. Enable with TRAFFIC_FILE_FOLLOW_ENABLED=1.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from .columnar import RecordBatch
+from .geoip_lookup import enrich_records
+from .nginx_log import records_from_lines
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def file_follow_enabled() -> bool:
+    return os.environ.get("TRAFFIC_FILE_FOLLOW_ENABLED", "").strip().lower() in ("1", "true", "yes", "on")
+
+
+_HEAD_BYTES = 64
+
+
+def _max_window_bytes() -> int:
+    return max(1 << 20, _env_int("TRAFFIC_FILE_FOLLOW_MAX_BYTES", 64 * 1024 * 1024))
+
+
+class FileTail:
+    def __init__(self, path: str):
+        self.path = path
+        self.f = None
+        self.inode: Optional[int] = None
+        self.offset = 0
+        self.partial = b""
+        # 从文件中间开始读时丢弃第一段半行
+        self._skip_partial = False
+        # 文件开头若干字节：copytruncate 后新内容超过旧 offset 时，仅比较大小发现不了截断
+        self.head = b""
+        self.rotations = 0
+        self.truncations = 0
+
+    def close(self) -> None:
+        if self.f is not None:
+            try:
+                self.f.close()
+            except OSError:
+                pass
+        self.f = None
+        self.partial = b""
+
+    def start(self, bootstrap_bytes: int) -> bool:
+        """打开文件并定位到末尾前 bootstrap_bytes（丢弃第一段半行）。文件不存在返回 False。"""
+        self.close()
+        try:
+            self.f = open(self.path, "rb")
+        except OSError:
+            return False
+        st = os.fstat(self.f.fileno())
+        self.inode = st.st_ino
+        self.head = os.pread(self.f.fileno(), _HEAD_BYTES, 0)
+        self.offset = max(0, st.st_size - max(0, bootstrap_bytes))
+        # 起点恰好在行首时不丢
+        self._skip_partial = self.offset > 0 and os.pread(self.f.fileno(), 1, self.offset - 1) != b"\n"
+        return True
+
+    @property
+    def started(self) -> bool:
+        return self.f is not None
+
+    def _read(self, limit: int) -> bytes:
+        self.f.seek(self.offset)
+        data = self.f.read(limit)
+        self.offset += len(data)
+        return data
+
+    def read_new(self, max_bytes: int, skip_backlog: bool = True) -> Tuple[List[str], int]:
+        """
+        返回 (新的完整行, 消耗字节数)。单次最多读 max_bytes；积压超过时 skip_backlog=True 跳到末尾前
+        max_bytes，否则分多次读完。
+        """
+        if self.f is None:
+            return [], 0
+        chunks: List[bytes] = []
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            st = None
+        if st is not None and st.st_ino != self.inode:
+            # rename 轮转：旧 fd 读完，再换到新文件开头
+            chunks.append(self._read(max_bytes))
+            self.rotations += 1
+            try:
+                self.f.close()
+                self.f = open(self.path, "rb")
+            except OSError:
+                self.f = None
+                return self._lines(chunks)
+            chunks = [self._finish(chunks)]
+            self.inode = os.fstat(self.f.fileno()).st_ino
+            self.offset = 0
+            self.partial = b""
+            self.head = b""
+        fd = self.f.fileno()
+        size = os.fstat(fd).st_size
+        head = os.pread(fd, _HEAD_BYTES, 0)
+        n = min(len(head), len(self.head))
+        if size < self.offset or head[:n] != self.head[:n]:
+            # copytruncate
+            self.truncations += 1
+            self.offset = 0
+            self.partial = b""
+        self.head = head
+        pending = size - self.offset
+        if pending > max_bytes and skip_backlog:
+            # 积压超过窗口：旧数据反正会被裁掉，直接跳到末尾前 max_bytes
+            chunks = []
+            self.offset = size - max_bytes
+            self.partial = b""
+            self._skip_partial = True
+        if pending > 0:
+            chunks.append(self._read(max_bytes))
+        return self._lines(chunks)
+
+    def _finish(self, chunks: List[bytes]) -> bytes:
+        # 旧文件最后一段（即使没有换行）也算完整一行
+        data = self.partial + b"".join(chunks)
+        return data if not data or data.endswith(b"\n") else data + b"\n"
+
+    def _lines(self, chunks: List[bytes]) -> Tuple[List[str], int]:
+        data = self.partial + b"".join(chunks)
+        consumed = len(data)
+        if self._skip_partial:
+            nl = data.find(b"\n")
+            if nl < 0:
+                self.partial = data
+                return [], 0
+            data = data[nl + 1:]
+            self._skip_partial = False
+        last_nl = data.rfind(b"\n")
+        if last_nl < 0:
+            self.partial = data
+            return [], 0
+        self.partial = data[last_nl + 1:]
+        text = data[:last_nl + 1].decode("utf-8", errors="replace")
+        return [ln for ln in text.splitlines() if ln.strip()], consumed - len(self.partial)
+
+
+class FollowedFile:
+    def __init__(self, key: tuple, path: str, log_format: str, nginx_format: str, geoip_db_path: str):
+        self.key = key
+        self.path = path
+        self.log_format = log_format
+        self.nginx_format = nginx_format
+        self.geoip_db_path = geoip_db_path
+        self.tail = FileTail(path)
+        self.chunks: Deque[Tuple[RecordBatch, int]] = deque()
+        self.total_bytes = 0
+        self.window_bytes = 0
+        self.lock = threading.Lock()
+        self.version = 0
+        # 窗口是否从文件开头开始（没有更早的内容）
+        self.from_start = False
+        self._cache: Optional[Tuple[int, int, RecordBatch, bool]] = None
+        self.stats = {"lines": 0, "records": 0, "bytes": 0, "bootstraps": 0}
+
+    def _append(self, lines: List[str], nbytes: int) -> None:
+        if not lines:
+            return
+        recs = records_from_lines(lines, self.log_format, self.nginx_format)
+        enrich_records(recs, self.geoip_db_path)
+        self.chunks.append((RecordBatch.from_records(recs), nbytes))
+        self.total_bytes += nbytes
+        while self.chunks and self.total_bytes - self.chunks[0][1] >= self.window_bytes:
+            self.total_bytes -= self.chunks.popleft()[1]
+            self.from_start = False
+        self.stats["lines"] += len(lines)
+        self.stats["records"] += len(recs)
+        self.stats["bytes"] += nbytes
+        self.version += 1
+
+    def refresh(self, want_bytes: int) -> bool:
+        want = min(max(65536, want_bytes), _max_window_bytes())
+        with self.lock:
+            if not self.tail.started or want > self.window_bytes:
+                # 首次或需要更大的窗口：从文件尾部重新建立
+                if not self.tail.start(want):
+                    return False
+                self.chunks.clear()
+                self.total_bytes = 0
+                self.window_bytes = want
+                self.from_start = self.tail.offset == 0
+                self.stats["bootstraps"] += 1
+                self.version += 1
+            try:
+                lines, nbytes = self.tail.read_new(self.window_bytes)
+                self._append(lines, nbytes)
+            except OSError as e:
+                logger.warning("file_follower %s: %s", self.path, e)
+                self.tail.close()
+                return False
+        return True
+
+    def batch(self, max_bytes: int) -> Tuple[RecordBatch, bool]:
+        """最后约 max_bytes 字节对应的记录（按块取，块内不再切分），以及它是否已包含文件开头。"""
+        with self.lock:
+            c = self._cache
+            if c is not None and c[0] == self.version and c[1] == max_bytes:
+                return c[2], c[3]
+            picked: List[RecordBatch] = []
+            acc = 0
+            for b, nbytes in reversed(self.chunks):
+                if acc >= max_bytes:
+                    break
+                picked.append(b)
+                acc += nbytes
+            out = RecordBatch.concat(picked[::-1])
+            whole = self.from_start and len(picked) == len(self.chunks)
+            self._cache = (self.version, max_bytes, out, whole)
+            return out, whole
+
+
+_followers: Dict[str, FollowedFile] = {}
+_registry_lock = threading.Lock()
+
+
+def followed_batch(
+    path: str,
+    log_format: str,
+    nginx_format: str,
+    geoip_db_path: str,
+    max_tail_bytes: int,
+    since: Optional[float] = None,
+) -> Optional[RecordBatch]:
+    """
+    文件模式的已 enrich 批次；文件不可读时返回 None（调用方回退到 read_log_tail）。
+    给定 since 时，窗口没有覆盖到该时间（且文件还有更早内容）也返回 None，由调用方按时间定位读取。
+    """
+    key = (path, log_format or "json", nginx_format or "", geoip_db_path or "")
+    with _registry_lock:
+        ff = _followers.get(path)
+        if ff is None or ff.key != key:
+            if ff is not None:
+                ff.tail.close()
+            ff = _followers[path] = FollowedFile(key, *key)
+    if not ff.refresh(max_tail_bytes):
+        return None
+    out, whole = ff.batch(max_tail_bytes)
+    if since is not None and not whole and not (len(out) and float(out.ts.min()) <= since):
+        return None
+    return out
+
+
+def follower_stats() -> Dict[str, Any]:
+    with _registry_lock:
+        items = list(_followers.values())
+    return {
+        ff.path: dict(
+            ff.stats,
+            offset=ff.tail.offset,
+            inode=ff.tail.inode,
+            window_bytes=ff.window_bytes,
+            retained_bytes=ff.total_bytes,
+            rotations=ff.tail.rotations,
+            truncations=ff.tail.truncations,
+        )
+        for ff in items
+    }
@@ -1,7 +1,18 @@
+import ipaddress
 import logging
 import os
 from functools import lru_cache
-from typing import Dict, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
+
+from .geoip_ranges import (
+    LABEL_EMPTY,
+    LABEL_LAN,
+    LAN_NETWORKS,
+    GeoRanges,
+    geoip_range_city_enabled,
+    geoip_range_enabled,
+    load_ranges,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -38,6 +49,16 @@ def _get_reader(path: str):
         return None
 
 
+def _is_lan(ip: str) -> bool:
+    try:
+        addr = ipaddress.ip_address(ip.split("%", 1)[0])
+    except ValueError:
+        return False
+    if addr.version == 6 and addr.ipv4_mapped:
+        addr = addr.ipv4_mapped
+    return any(addr in net for net in LAN_NETWORKS)
+
+
 def _lookup_ip_uncached(ip: str, resolved_mmdb_path: str) -> Dict[str, Optional[str]]:
     """Return country_code, country_name, subdivision, lat, lng hints."""
     result = {
@@ -50,20 +71,10 @@ def _lookup_ip_uncached(ip: str, resolved_mmdb_path: str) -> Dict[str, Optional[
     if not ip:
         result["country_code"] = "??"
         return result
-    if ip.startswith("127.") or ip.startswith("10.") or ip.startswith("192.168."):
+    if _is_lan(ip):
         result["country_code"] = "LAN"
         result["country_name"] = "Private"
         return result
-    parts = ip.split(".")
-    if len(parts) == 4 and parts[0] == "172":
-        try:
-            second = int(parts[1])
-            if 16 <= second <= 31:
-                result["country_code"] = "LAN"
-                result["country_name"] = "Private"
-                return result
-        except ValueError:
-            pass
     reader = _get_reader(resolved_mmdb_path)
     if reader is None:
         result["country_code"] = "??"
@@ -116,9 +127,47 @@ def lookup_ip(ip: str, geoip_db_path: str) -> Dict[str, Optional[str]]:
     }
 
 
+def _enrich_with_ranges(records, table: GeoRanges, geoip_db_path: str) -> None:
+    """range 模式：去重后整批 searchsorted，再按下标回填；经纬度默认取国家中心点。"""
+    from .geo_centroids import centroid_for_country
+
+    ids: Dict[str, int] = {}
+    inv = [ids.setdefault((rec.get("remote_addr") or "").strip(), len(ids)) for rec in records]
+    uniq = list(ids)
+    city = geoip_range_city_enabled()
+    geo: List[tuple] = []
+    for ip, c in zip(uniq, table.classify(uniq).tolist()):
+        lat = lng = None
+        if c >= 0:
+            cc, cn, sd = table.labels[c]
+            sd = sd or None
+            if city:
+                # 只在显式要求时按 IP 查 city（lru_cache）取精确经纬度
+                g = lookup_ip(ip, geoip_db_path)
+                lat, lng = g["lat"], g["lng"]
+        elif c == LABEL_LAN:
+            cc, cn, sd = "LAN", "Private", None
+        elif c == LABEL_EMPTY:
+            cc, cn, sd = "??", None, None
+        else:
+            cc, cn, sd = "??", "Unknown", None
+        if lat is None:
+            ct = centroid_for_country(cc)
+            lat, lng = (ct[0], ct[1]) if ct else (0.0, 0.0)
+        geo.append((cc, cn, sd, lat, lng))
+    for rec, j in zip(records, inv):
+        rec["country_code"], rec["country_name"], rec["subdivision"], rec["lat"], rec["lng"] = geo[j]
+
+
 def enrich_records(records, geoip_db_path: str):
     from .geo_centroids import centroid_for_country
 
+    if geoip_range_enabled() and records:
+        table = load_ranges(_geoip_path(geoip_db_path))
+        if table is not None:
+            _enrich_with_ranges(records, table, geoip_db_path)
+            return
+
     for rec in records:
         geo = lookup_ip(rec.get("remote_addr") or "", geoip_db_path)
         rec["country_code"] = geo["country_code"]
@@ -0,0 +1,331 @@
+"""
+Range-table GeoIP: country / subdivision as sorted NumPy interval arrays, resolved per batch with
+``searchsorted`` instead of one ``reader.city(ip)`` per cache miss.
+
+The table is built once from the MaxMind .mmdb (walking every network with ``maxminddb``) or from a range
+CSV (TRAFFIC_GEOIP_RANGE_CSV: ``start_ip,end_ip,country_code[,country_name[,subdivision]]``, e.g. the
+DB-IP country lite export), adjacent ranges with the same label merged, and cached as .npz under
+TRAFFIC_GEOIP_RANGE_CACHE_DIR keyed by source path + mtime + size. IPv4 is keyed by the 32-bit address;
+IPv6 by its upper 64 bits (country data has no allocations smaller than /64). Enable with
+TRAFFIC_GEOIP_MODE=range.
+"""
+from __future__ import annotations
+
+import csv
+import hashlib
+import ipaddress
+import logging
+import os
+import socket
+import tempfile
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 与 geoip_lookup 的私网判断一致：loopback、RFC 1918、IPv6 loopback / ULA / link-local
+LAN_NETWORKS = tuple(
+    ipaddress.ip_network(n)
+    for n in ("127.0.0.0/8", "10.0.0.0/8", "172.16.0.0/12", "192.168.0.0/16", "::1/128", "fc00::/7", "fe80::/10")
+)
+
+_V4_MAPPED = ipaddress.ip_network("::ffff:0:0/96")
+_V4_COMPAT = ipaddress.ip_network("::/96")
+
+# 分类结果：>= 0 为 labels 下标
+LABEL_EMPTY = -1
+LABEL_LAN = -2
+LABEL_UNKNOWN = -3
+
+
+def geoip_range_enabled() -> bool:
+    return os.environ.get("TRAFFIC_GEOIP_MODE", "").strip().lower() == "range"
+
+
+def geoip_range_city_enabled() -> bool:
+    """range 模式下是否仍按 IP 查 city 取经纬度（默认用国家中心点）。"""
+    return os.environ.get("TRAFFIC_GEOIP_RANGE_CITY", "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def _range_csv_path() -> str:
+    return os.environ.get("TRAFFIC_GEOIP_RANGE_CSV", "").strip()
+
+
+def _cache_dir() -> str:
+    return os.environ.get("TRAFFIC_GEOIP_RANGE_CACHE_DIR", "").strip() or tempfile.gettempdir()
+
+
+class RangeTable:
+    """一个地址族的区间表：[starts[i], ends[i]]（闭区间，按 starts 升序不重叠）→ labels[label_idx[i]]。"""
+
+    __slots__ = ("starts", "ends", "label_idx")
+
+    def __init__(self, starts: np.ndarray, ends: np.ndarray, label_idx: np.ndarray):
+        self.starts = starts
+        self.ends = ends
+        self.label_idx = label_idx
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def lookup(self, keys: np.ndarray) -> np.ndarray:
+        """每个 key 所在区间的 label 下标；不在任何区间内为 LABEL_UNKNOWN。"""
+        out = np.full(len(keys), LABEL_UNKNOWN, dtype=np.int32)
+        if not len(self.starts) or not len(keys):
+            return out
+        i = np.searchsorted(self.starts, keys, side="right") - 1
+        ok = i >= 0
+        ok[ok] = keys[ok] <= self.ends[i[ok]]
+        out[ok] = self.label_idx[i[ok]]
+        return out
+
+    @classmethod
+    def from_ranges(cls, ranges: List[Tuple[int, int, int]], dtype) -> "RangeTable":
+        ranges.sort()
+        starts: List[int] = []
+        ends: List[int] = []
+        labels: List[int] = []
+        for s, e, lab in ranges:
+            if starts and s <= ends[-1]:
+                # 重叠（数据源有嵌套网段）：保留先出现的
+                if e <= ends[-1]:
+                    continue
+                s = ends[-1] + 1
+            if starts and labels[-1] == lab and s == ends[-1] + 1:
+                ends[-1] = e
+                continue
+            starts.append(s)
+            ends.append(e)
+            labels.append(lab)
+        return cls(np.array(starts, dtype=dtype), np.array(ends, dtype=dtype), np.array(labels, dtype=np.int32))
+
+
+class GeoRanges:
+    def __init__(self, v4: RangeTable, v6: RangeTable, labels: List[Tuple[str, str, str]]):
+        self.v4 = v4
+        self.v6 = v6
+        # (country_code, country_name, subdivision)，subdivision 为空串表示没有
+        self.labels = labels
+
+    def classify(self, ips: Iterable[str]) -> np.ndarray:
+        """每个 IP 字符串的 label 下标，或 LABEL_EMPTY / LABEL_LAN / LABEL_UNKNOWN。"""
+        ips = list(ips)
+        n = len(ips)
+        out = np.full(n, LABEL_UNKNOWN, dtype=np.int32)
+        v4_pos: List[int] = []
+        v4_keys: List[int] = []
+        v6_pos: List[int] = []
+        v6_keys: List[int] = []
+        for i, ip in enumerate(ips):
+            ip = (ip or "").strip()
+            if not ip:
+                out[i] = LABEL_EMPTY
+                continue
+            try:
+                if ":" in ip:
+                    # 去掉 zone id（fe80::1%eth0）
+                    raw = socket.inet_pton(socket.AF_INET6, ip.split("%", 1)[0])
+                else:
+                    raw = socket.inet_pton(socket.AF_INET, ip)
+            except (OSError, ValueError):
+                continue
+            addr = int.from_bytes(raw, "big")
+            if len(raw) == 4:
+                v4_keys.append(addr)
+                v4_pos.append(i)
+            elif addr >> 32 == 0xFFFF:
+                # ::ffff:a.b.c.d 按 IPv4 查
+                v4_keys.append(addr & 0xFFFFFFFF)
+                v4_pos.append(i)
+            else:
+                v6_keys.append(addr)
+                v6_pos.append(i)
+        if v4_pos:
+            keys = np.array(v4_keys, dtype=np.uint32)
+            pos = np.array(v4_pos, dtype=np.int64)
+            out[pos] = self.v4.lookup(keys)
+            out[pos[_lan_mask_v4(keys)]] = LABEL_LAN
+        if v6_pos:
+            full = v6_keys
+            pos = np.array(v6_pos, dtype=np.int64)
+            out[pos] = self.v6.lookup(np.array([a >> 64 for a in full], dtype=np.uint64))
+            lan = np.array([_is_lan_v6(a) for a in full], dtype=bool)
+            out[pos[lan]] = LABEL_LAN
+        return out
+
+    def save(self, path: str) -> None:
+        cc, cn, sd = (np.array([lab[k] for lab in self.labels], dtype=str) for k in range(3))
+        tmp = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(
+            tmp,
+            v4_starts=self.v4.starts,
+            v4_ends=self.v4.ends,
+            v4_labels=self.v4.label_idx,
+            v6_starts=self.v6.starts,
+            v6_ends=self.v6.ends,
+            v6_labels=self.v6.label_idx,
+            country_code=cc,
+            country_name=cn,
+            subdivision=sd,
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "GeoRanges":
+        with np.load(path, allow_pickle=False) as z:
+            labels = list(zip(z["country_code"].tolist(), z["country_name"].tolist(), z["subdivision"].tolist()))
+            return cls(
+                RangeTable(z["v4_starts"], z["v4_ends"], z["v4_labels"]),
+                RangeTable(z["v6_starts"], z["v6_ends"], z["v6_labels"]),
+                labels,
+            )
+
+
+def _lan_mask_v4(keys: np.ndarray) -> np.ndarray:
+    mask = np.zeros(len(keys), dtype=bool)
+    for net in LAN_NETWORKS:
+        if net.version == 4:
+            lo = int(net.network_address)
+            mask |= (keys >= lo) & (keys <= lo + net.num_addresses - 1)
+    return mask
+
+
+def _is_lan_v6(addr: int) -> bool:
+    for net in LAN_NETWORKS:
+        if net.version == 6 and int(net.network_address) <= addr <= int(net.broadcast_address):
+            return True
+    return False
+
+
+class _Builder:
+    def __init__(self):
+        self.labels: List[Tuple[str, str, str]] = []
+        self._label_ids: Dict[Tuple[str, str, str], int] = {}
+        self.v4: List[Tuple[int, int, int]] = []
+        self.v6: List[Tuple[int, int, int]] = []
+
+    def add(self, first: ipaddress._BaseAddress, last: ipaddress._BaseAddress, cc: str, cn: str, sd: str) -> None:
+        if not cc:
+            return
+        lab = (cc, cn or cc, sd or "")
+        idx = self._label_ids.get(lab)
+        if idx is None:
+            idx = self._label_ids[lab] = len(self.labels)
+            self.labels.append(lab)
+        if first.version == 4:
+            self.v4.append((int(first), int(last), idx))
+        else:
+            self.v6.append((int(first) >> 64, int(last) >> 64, idx))
+
+    def build(self) -> GeoRanges:
+        return GeoRanges(
+            RangeTable.from_ranges(self.v4, np.uint32),
+            RangeTable.from_ranges(self.v6, np.uint64),
+            self.labels,
+        )
+
+
+def _name(obj: Optional[Dict[str, Any]]) -> str:
+    names = (obj or {}).get("names") or {}
+    return names.get("en") or ""
+
+
+def build_from_mmdb(path: str) -> GeoRanges:
+    """遍历 mmdb 的全部网段（需要 maxminddb >= 2.3，geoip2 的依赖）。"""
+    import maxminddb
+
+    b = _Builder()
+    with maxminddb.open_database(path) as reader:
+        for network, rec in reader:
+            if not isinstance(rec, dict):
+                continue
+            if network.version == 6 and (network.subnet_of(_V4_MAPPED) or network.subnet_of(_V4_COMPAT)):
+                # IPv4 在 IPv6 树中的别名；IPv4 网段会单独遍历到
+                continue
+            country = rec.get("country") or rec.get("registered_country") or {}
+            subs = rec.get("subdivisions") or [{}]
+            b.add(
+                network.network_address,
+                network.broadcast_address,
+                country.get("iso_code") or "",
+                _name(country),
+                _name(subs[0]),
+            )
+    return b.build()
+
+
+def build_from_csv(path: str) -> GeoRanges:
+    b = _Builder()
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            if len(row) < 3 or row[0].startswith("#"):
+                continue
+            try:
+                first, last = ipaddress.ip_address(row[0].strip()), ipaddress.ip_address(row[1].strip())
+            except ValueError:
+                # 表头或坏行
+                continue
+            if first.version != last.version:
+                continue
+            extra = [c.strip() for c in row[3:5]] + ["", ""]
+            b.add(first, last, row[2].strip().upper(), extra[0], extra[1])
+    return b.build()
+
+
+_tables: Dict[str, Tuple[tuple, Optional[GeoRanges]]] = {}
+_lock = threading.Lock()
+
+
+def _source(mmdb_path: str) -> Tuple[str, str]:
+    csv_path = _range_csv_path()
+    return ("csv", csv_path) if csv_path else ("mmdb", mmdb_path)
+
+
+def _cache_file(kind: str, path: str, st: os.stat_result) -> str:
+    digest = hashlib.sha1(f"{kind}:{os.path.abspath(path)}:{st.st_mtime_ns}:{st.st_size}".encode()).hexdigest()[:16]
+    return os.path.join(_cache_dir(), f"traffic-geoip-ranges-{digest}.npz")
+
+
+def load_ranges(mmdb_path: str, rebuild: bool = False) -> Optional[GeoRanges]:
+    """区间表（进程内缓存 + .npz 磁盘缓存，源文件变化后重建）；不可用时返回 None（调用方回退逐 IP 查询）。"""
+    kind, path = _source(mmdb_path)
+    if not path:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError as e:
+        logger.warning("GeoIP range source %s: %s", path, e)
+        return None
+    sig = (kind, path, st.st_mtime_ns, st.st_size)
+    with _lock:
+        cached = _tables.get(path)
+        if cached is not None and cached[0] == sig and not rebuild:
+            return cached[1]
+        table: Optional[GeoRanges] = None
+        npz = _cache_file(kind, path, st)
+        if not rebuild and os.path.exists(npz):
+            try:
+                table = GeoRanges.load(npz)
+            except Exception as e:
+                logger.warning("GeoIP range cache %s unreadable, rebuilding: %s", npz, e)
+        if table is None:
+            try:
+                table = build_from_csv(path) if kind == "csv" else build_from_mmdb(path)
+                logger.info(
+                    "GeoIP range table built from %s: %s IPv4 / %s IPv6 ranges, %s labels",
+                    path, len(table.v4), len(table.v6), len(table.labels),
+                )
+            except ImportError:
+                logger.warning("maxminddb not installed; TRAFFIC_GEOIP_MODE=range needs it (or TRAFFIC_GEOIP_RANGE_CSV)")
+            except Exception as e:
+                logger.warning("GeoIP range table build from %s failed: %s", path, e)
+            if table is not None:
+                try:
+                    table.save(npz)
+                except OSError as e:
+                    logger.warning("GeoIP range cache write %s: %s", npz, e)
+        # 失败也记住（None），源文件不变时不反复重建
+        _tables[path] = (sig, table)
+        return table
@@ -0,0 +1,271 @@
+"""
+Asynchronous traffic ingest on a Redis Stream.
+
+With TRAFFIC_INGEST_ASYNC=1, ``POST /api/traffic/ingest`` only XADDs the raw batch (one stream entry per
+request, approximate MAXLEN) and returns 202. ``python manage.py traffic_ingest_worker`` consumers read
+the stream through a consumer group, run the same work the synchronous path does (RPUSH/LTRIM buffer,
+parse, GeoIP enrich, rollup append) and XACK. Entries a dead worker left pending are reclaimed with
+XAUTOCLAIM; entries that keep failing are moved to a capped dead-letter list.
+
+``stream_stats()`` reports stream length, group lag / pending and the age of the oldest undelivered
+entry, for capacity planning (``GET /api/traffic/ingest/stats``).
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import socket
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from ..models import TrafficDashboardConfig
+from .columnar import RecordBatch
+from .compact_records import encode_batch
+from .geoip_lookup import enrich_records
+from .log_sources import redis_cap, redis_key_for_ingest
+from .nginx_log import records_from_lines
+from .redis_log_buffer import buffer_format, push_compact_blob, push_raw_lines, traffic_redis_client
+from .rollup_buffer import rollup_enabled, rollup_ingest_append
+
+logger = logging.getLogger(__name__)
+
+STREAM_KEY = "traffic:ingest:stream"
+GROUP = "traffic-ingest"
+DEAD_KEY = "traffic:ingest:dead"
+DEAD_MAX = 1000
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def ingest_async_enabled() -> bool:
+    return os.environ.get("TRAFFIC_INGEST_ASYNC", "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def stream_maxlen() -> int:
+    """保留的批次数上限（约数）；超过后最旧的批次被裁掉，防止 worker 全挂时 Redis 撑爆。"""
+    return max(100, _env_int("TRAFFIC_INGEST_STREAM_MAXLEN", 10_000))
+
+
+def max_deliveries() -> int:
+    return max(1, _env_int("TRAFFIC_INGEST_MAX_DELIVERIES", 5))
+
+
+def ingest_lines(cfg: TrafficDashboardConfig, lines: List[str], source_id: str) -> int:
+    """
+    同步 ingest 的全部工作：写入 Redis List（raw / compact，见 TRAFFIC_BUFFER_FORMAT），解析 + enrich 只做一次，
+    同时用于 compact blob 与分钟聚合。返回接收行数。
+    """
+    key = redis_key_for_ingest(cfg, source_id)
+    cap = redis_cap(cfg)
+    fmt = buffer_format()
+    rollup = rollup_enabled()
+    if fmt == "compact":
+        n = sum(1 for ln in lines if ln and str(ln).strip())
+    else:
+        n = push_raw_lines(lines, key, cap)
+    if n <= 0 or (fmt == "raw" and not rollup):
+        return n
+    recs = records_from_lines(lines, cfg.log_format, cfg.nginx_log_format)
+    enrich_records(recs, cfg.geoip_db_path)
+    if fmt != "raw" and recs:
+        ok = push_compact_blob(encode_batch(RecordBatch.from_records(recs)), len(recs), key, cap)
+        if not ok and fmt == "compact":
+            return 0
+    if rollup:
+        try:
+            rollup_ingest_append(recs, source_id or "")
+        except Exception as e:
+            logger.warning("ingest rollup append failed: %s", e)
+    return n
+
+
+def enqueue_batch(lines: List[str], source_id: str) -> Optional[str]:
+    """XADD 一个批次；返回 entry id，失败返回 None（调用方回退到同步处理）。"""
+    r = traffic_redis_client()
+    if not r:
+        return None
+    cleaned = [s[:65536] for s in (str(ln).strip() for ln in lines if ln) if s]
+    if not cleaned:
+        return None
+    try:
+        return r.xadd(
+            STREAM_KEY,
+            {"src": source_id or "", "n": len(cleaned), "lines": "\n".join(cleaned)},
+            maxlen=stream_maxlen(),
+            approximate=True,
+        )
+    except Exception as e:
+        logger.warning("ingest enqueue failed: %s", e)
+        return None
+
+
+def ensure_group(r) -> None:
+    try:
+        r.xgroup_create(STREAM_KEY, GROUP, id="0", mkstream=True)
+    except Exception as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def default_consumer_name() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _entry_age_ms(entry_id: str, now_ms: int) -> int:
+    try:
+        return max(0, now_ms - int(str(entry_id).split("-", 1)[0]))
+    except (TypeError, ValueError):
+        return 0
+
+
+class IngestWorker:
+    """一个 consumer：读取新批次 + 周期性回收其他 consumer 超时未 ack 的批次。"""
+
+    def __init__(
+        self,
+        r,
+        consumer: str,
+        *,
+        count: int = 10,
+        block_ms: int = 5000,
+        claim_idle_ms: int = 60_000,
+        cfg_ttl_sec: float = 10.0,
+    ):
+        self.r = r
+        self.consumer = consumer
+        self.count = max(1, count)
+        self.block_ms = max(0, block_ms)
+        self.claim_idle_ms = max(1000, claim_idle_ms)
+        self.cfg_ttl_sec = cfg_ttl_sec
+        self._cfg: Optional[TrafficDashboardConfig] = None
+        self._cfg_at = 0.0
+        self._claim_cursor = "0-0"
+        self._last_claim = 0.0
+        self.processed = 0
+        self.failed = 0
+
+    def _config(self) -> TrafficDashboardConfig:
+        now = time.monotonic()
+        if self._cfg is None or now - self._cfg_at >= self.cfg_ttl_sec:
+            self._cfg = TrafficDashboardConfig.load()
+            self._cfg_at = now
+        return self._cfg
+
+    def _handle(self, entry_id: str, fields: Dict[str, Any]) -> bool:
+        lines = [ln for ln in (fields.get("lines") or "").split("\n") if ln]
+        try:
+            if lines:
+                ingest_lines(self._config(), lines, fields.get("src") or "")
+        except Exception as e:
+            logger.warning("ingest worker %s: entry %s failed: %s", self.consumer, entry_id, e)
+            self.failed += 1
+            return False
+        self.r.xack(STREAM_KEY, GROUP, entry_id)
+        self.processed += 1
+        return True
+
+    def _dead_letter(self, entry_id: str, fields: Dict[str, Any], deliveries: int) -> None:
+        logger.warning("ingest worker: dropping entry %s after %s deliveries", entry_id, deliveries)
+        pipe = self.r.pipeline(transaction=False)
+        pipe.lpush(DEAD_KEY, json.dumps({"id": entry_id, "deliveries": deliveries, **fields}))
+        pipe.ltrim(DEAD_KEY, 0, DEAD_MAX - 1)
+        pipe.xack(STREAM_KEY, GROUP, entry_id)
+        pipe.execute()
+
+    def _reclaim(self) -> int:
+        """XAUTOCLAIM 空闲过久的 pending 批次；超过最大投递次数的转入死信。"""
+        res = self.r.xautoclaim(
+            STREAM_KEY, GROUP, self.consumer, self.claim_idle_ms, start_id=self._claim_cursor, count=self.count
+        )
+        self._claim_cursor = res[0] or "0-0"
+        entries = [(eid, f) for eid, f in (res[1] or []) if f is not None]
+        if not entries:
+            return 0
+        ids = [eid for eid, _ in entries]
+        deliveries: Dict[str, int] = {}
+        for p in self.r.xpending_range(STREAM_KEY, GROUP, min=ids[0], max=ids[-1], count=len(ids) * 4):
+            deliveries[p["message_id"]] = int(p.get("times_delivered") or 0)
+        limit = max_deliveries()
+        for eid, fields in entries:
+            if deliveries.get(eid, 0) > limit:
+                self._dead_letter(eid, fields, deliveries[eid])
+            else:
+                self._handle(eid, fields)
+        return len(entries)
+
+    def run_once(self) -> int:
+        n = 0
+        now = time.monotonic()
+        if now - self._last_claim >= self.claim_idle_ms / 1000.0:
+            self._last_claim = now
+            n += self._reclaim()
+        resp = self.r.xreadgroup(GROUP, self.consumer, {STREAM_KEY: ">"}, count=self.count, block=self.block_ms or None)
+        for _stream, entries in resp or []:
+            for eid, fields in entries:
+                self._handle(eid, fields or {})
+                n += 1
+        return n
+
+    def run(self, should_stop: Callable[[], bool] = lambda: False) -> None:
+        ensure_group(self.r)
+        while not should_stop():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.warning("ingest worker %s loop error: %s", self.consumer, e)
+                time.sleep(1.0)
+
+
+def stream_stats() -> Dict[str, Any]:
+    r = traffic_redis_client()
+    if not r:
+        return {"configured": False}
+    now_ms = int(time.time() * 1000)
+    out: Dict[str, Any] = {
+        "configured": True,
+        "async_enabled": ingest_async_enabled(),
+        "stream": STREAM_KEY,
+        "group": GROUP,
+        "length": 0,
+        "maxlen": stream_maxlen(),
+        "dead_letters": 0,
+        "groups": [],
+    }
+    try:
+        out["length"] = int(r.xlen(STREAM_KEY) or 0)
+        out["dead_letters"] = int(r.llen(DEAD_KEY) or 0)
+        if not out["length"] and not r.exists(STREAM_KEY):
+            return out
+        for g in r.xinfo_groups(STREAM_KEY):
+            last = g.get("last-delivered-id") or "0-0"
+            item: Dict[str, Any] = {
+                "name": g.get("name"),
+                "consumers": int(g.get("consumers") or 0),
+                "pending": int(g.get("pending") or 0),
+                "last_delivered_id": last,
+                # Redis 7+ 才有 lag；旧版本为 None
+                "lag": g.get("lag"),
+                "oldest_undelivered_age_ms": 0,
+                "oldest_pending_age_ms": 0,
+            }
+            nxt = r.xrange(STREAM_KEY, min=f"({last}", max="+", count=1)
+            if nxt:
+                item["oldest_undelivered_age_ms"] = _entry_age_ms(nxt[0][0], now_ms)
+            if item["pending"]:
+                summary = r.xpending(STREAM_KEY, g.get("name"))
+                item["oldest_pending_age_ms"] = _entry_age_ms(summary.get("min"), now_ms)
+            item["consumer_detail"] = [
+                {"name": c.get("name"), "pending": int(c.get("pending") or 0), "idle_ms": int(c.get("idle") or 0)}
+                for c in r.xinfo_consumers(STREAM_KEY, g.get("name"))
+            ]
+            out["groups"].append(item)
+    except Exception as e:
+        logger.warning("ingest stream_stats failed: %s", e)
+        out["error"] = str(e)
+    return out
@@ -0,0 +1,718 @@
+"""
+Long-lived, in-process rolling-window aggregator for the traffic dashboard.
+
+Instead of re-reading / re-parsing / re-enriching the log tail on every request, each source keeps a
+cursor (Redis list sequence or file offset) and folds only *new* lines into ring buffers of per-bucket
+aggregates at the same resolutions as ``aggregator.bucket_seconds``:
+
+  10s  × 361   (1h)     60s × 1441 (24h)     3600s × 169 (7d)     86400s × 32 (30d)
+
+Each bucket holds request / status-family counters, a latency histogram (``sketches.LatencyHistogram``),
+exact per-country / CN-subdivision counts and Space-Saving heavy-hitter summaries
+(``sketches.HeavyHitters``) for paths and client IPs. Dashboard queries are O(buckets):
+timeseries reads the ring of the range's bucket size; overview / geo / top compose the window from the
+coarsest buckets fully inside it plus finer buckets at the edges.
+
+Differences from the list-based aggregator (documented trade-offs):
+- percentiles come from the histogram (≈1% relative error);
+- window edges are bucket-aligned (the oldest partial bucket of a window is included whole);
+- top paths / IPs are heavy-hitter estimates: ``requests`` is an upper bound, ``requests_min`` a
+  guaranteed lower bound, and any key above the summary floor is listed whenever it first appeared.
+  Per-path 5xx / latency cover the time the path has been listed in the bucket.
+
+Redis mode needs the ``{key}:seq`` counter maintained by ``push_raw_lines``; lists written by other
+shippers without it are reported as unavailable and the caller falls back to the raw path.
+State is per process (each Gunicorn worker bootstraps from the buffer tail once).
+
+Env:
+  TRAFFIC_LIVE_AGG_ENABLED — 1 开启（默认关闭）
+  TRAFFIC_LIVE_AGG_REFRESH_SEC — 两次增量读取的最小间隔（默认 1）
+  TRAFFIC_LIVE_AGG_MAX_KEYS — 每个桶 path / IP heavy-hitter 摘要的容量（默认 256）
+  TRAFFIC_LIVE_AGG_MAX_READ_BYTES — 文件模式单次增量读取上限（默认 64MB）
+"""
+from __future__ import annotations
+
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from functools import wraps
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..models import TrafficDashboardConfig
+from .aggregator import _empty_ts, bucket_seconds, window_bounds
+from .geoip_lookup import enrich_records
+from .log_sources import _access_mode, legacy_redis_key, normalized_log_sources, redis_cap
+from .nginx_log import records_from_lines
+from .compact_records import decode_blobs
+from .file_follower import FileTail
+from .redis_log_buffer import (
+    buffer_format,
+    fetch_compact_tail,
+    rec_key,
+    rec_seq_key,
+    seq_key,
+    traffic_redis_binary_client,
+    traffic_redis_client,
+)
+from .sketches import HeavyHitters, LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+# (bucket seconds, slots)；slots-1 个桶即保留时长
+LEVELS: Tuple[Tuple[int, int], ...] = ((10, 361), (60, 1441), (3600, 169), (86400, 32))
+_PARSE_CHUNK = 20_000
+
+# KEYS[1]=list KEYS[2]=seq  ARGV[1]=cursor(-1 = 首次) ARGV[2]=max lines
+# 返回 {seq, llen, lines?}；seq=-1 表示该 list 没有序号（非 push_raw_lines 写入）
+_FETCH_NEW_LUA = """
+local s = redis.call('GET', KEYS[2])
+if not s then return {-1, 0} end
+s = tonumber(s)
+local len = redis.call('LLEN', KEYS[1])
+local c = tonumber(ARGV[1])
+local n
+if c < 0 or c > s then n = len else n = s - c end
+if n > len then n = len end
+local cap = tonumber(ARGV[2])
+if n > cap then n = cap end
+if n <= 0 then return {s, len} end
+return {s, len, redis.call('LRANGE', KEYS[1], -n, -1)}
+"""
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def live_agg_enabled() -> bool:
+    return os.environ.get("TRAFFIC_LIVE_AGG_ENABLED", "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def _refresh_sec() -> float:
+    try:
+        return max(0.0, float(os.environ.get("TRAFFIC_LIVE_AGG_REFRESH_SEC", "1")))
+    except ValueError:
+        return 1.0
+
+
+_MAX_KEYS = max(16, _env_int("TRAFFIC_LIVE_AGG_MAX_KEYS", 256))
+
+
+# -------------------------
+# buckets / rings
+# -------------------------
+class _Bucket:
+    __slots__ = (
+        "start", "n", "s2", "s4", "s5", "lat_sum", "lat_nz", "hist", "fams",
+        "paths_hh", "uri_stats", "geo", "subs", "ips_hh", "ip_country", "_new_uris", "_new_ips",
+    )
+
+    def __init__(self, start: int):
+        self.start = start
+        self.n = 0
+        self.s2 = 0
+        self.s4 = 0
+        self.s5 = 0
+        self.lat_sum = 0.0
+        self.lat_nz = 0
+        self.hist = LatencyHistogram()
+        self.fams: Dict[str, int] = {}
+        self.paths_hh = HeavyHitters()
+        # 摘要中列出的 uri -> [5xx, LatencyHistogram, max_ms]
+        self.uri_stats: Dict[str, list] = {}
+        # country_code -> [requests, name, lat, lng]（精确，国家数有限）
+        self.geo: Dict[str, list] = {}
+        # CN subdivision -> requests（精确）
+        self.subs: Dict[str, int] = {}
+        self.ips_hh = HeavyHitters()
+        # 摘要中列出的 ip -> country_name
+        self.ip_country: Dict[str, str] = {}
+        # 本批精确计数，compact() 时并入摘要
+        self._new_uris: Dict[str, int] = {}
+        self._new_ips: Dict[str, int] = {}
+
+    def add(self, r: Dict[str, Any]) -> None:
+        self.n += 1
+        status = r.get("status") or 0
+        if 200 <= status < 400:
+            self.s2 += 1
+        elif 400 <= status < 500:
+            self.s4 += 1
+        elif status >= 500:
+            self.s5 += 1
+        fam = f"{status // 100}xx" if status else "0xx"
+        self.fams[fam] = self.fams.get(fam, 0) + 1
+
+        lat = r.get("request_time_ms")
+        if lat is not None:
+            self.hist.add(lat)
+            if lat:
+                self.lat_sum += lat
+                self.lat_nz += 1
+        lat = lat or 0.0
+
+        uri = r.get("request_uri") or "/"
+        self._new_uris[uri] = self._new_uris.get(uri, 0) + 1
+        u = self.uri_stats.get(uri)
+        if u is None:
+            u = self.uri_stats[uri] = [0, LatencyHistogram(), 0.0]
+        if status >= 500:
+            u[0] += 1
+        u[1].add(lat)
+        if lat > u[2]:
+            u[2] = lat
+
+        code = r.get("country_code") or "??"
+        g = self.geo.get(code)
+        if g is None:
+            g = self.geo[code] = [0, r.get("country_name") or code, None, None]
+        g[0] += 1
+        if g[2] is None and r.get("lat") is not None:
+            g[2] = float(r["lat"])
+            g[3] = float(r.get("lng") or 0.0)
+        if code.upper() == "CN":
+            sub = r.get("subdivision") or "Unknown"
+            self.subs[sub] = self.subs.get(sub, 0) + 1
+
+        ip = r.get("remote_addr") or "-"
+        self._new_ips[ip] = self._new_ips.get(ip, 0) + 1
+        if ip not in self.ip_country:
+            self.ip_country[ip] = r.get("country_name") or ""
+
+    def compact(self) -> None:
+        """本批精确计数并入 Space-Saving 摘要并截断到 TRAFFIC_LIVE_AGG_MAX_KEYS；未列出的 key 丢弃附带统计。"""
+        if self._new_uris:
+            self.paths_hh.merge(HeavyHitters({k: [c, 0] for k, c in self._new_uris.items()}))
+            self.paths_hh.truncate(_MAX_KEYS)
+            self._new_uris = {}
+            if len(self.uri_stats) > len(self.paths_hh.items):
+                self.uri_stats = {k: v for k, v in self.uri_stats.items() if k in self.paths_hh.items}
+        if self._new_ips:
+            self.ips_hh.merge(HeavyHitters({k: [c, 0] for k, c in self._new_ips.items()}))
+            self.ips_hh.truncate(_MAX_KEYS)
+            self._new_ips = {}
+            if len(self.ip_country) > len(self.ips_hh.items):
+                self.ip_country = {k: v for k, v in self.ip_country.items() if k in self.ips_hh.items}
+
+
+class _Ring:
+    """固定槽位的环形桶数组：槽位 = (ts // bs) % slots，旧桶被新时间段覆盖即淘汰。"""
+
+    __slots__ = ("bs", "slots", "buf")
+
+    def __init__(self, bs: int, slots: int):
+        self.bs = bs
+        self.slots = slots
+        self.buf: List[Optional[_Bucket]] = [None] * slots
+
+    @property
+    def retention(self) -> int:
+        return self.bs * (self.slots - 1)
+
+    def bucket_for(self, ts: float) -> Optional[_Bucket]:
+        idx = int(ts // self.bs)
+        start = idx * self.bs
+        pos = idx % self.slots
+        b = self.buf[pos]
+        if b is not None and b.start == start:
+            return b
+        if b is not None and b.start > start:
+            # 迟到数据早于环的保留范围
+            return None
+        b = self.buf[pos] = _Bucket(start)
+        return b
+
+    def buckets(self, lo: float, hi: float) -> List[_Bucket]:
+        """起点落在 [lo, hi) 的桶。"""
+        out = []
+        first = int(math.ceil(lo / self.bs))
+        last = int(math.ceil(hi / self.bs))
+        if last - first > self.slots:
+            first = last - self.slots
+        for idx in range(first, last):
+            b = self.buf[idx % self.slots]
+            if b is not None and b.start == idx * self.bs:
+                out.append(b)
+        return out
+
+    def overlapping(self, lo: float, hi: float) -> List[_Bucket]:
+        """与 [lo, hi) 有交集的桶（包括左边界所在的部分桶）。"""
+        return self.buckets(math.floor(lo / self.bs) * self.bs, hi)
+
+
+# -------------------------
+# per-source state
+# -------------------------
+class LiveSource:
+    def __init__(self, cfg_key: tuple, mode: str, redis_key: str, file_path: str, log_format: str, geoip_db_path: str):
+        self.cfg_key = cfg_key
+        self.mode = mode
+        self.redis_key = redis_key
+        self.file_path = file_path
+        self.log_format = log_format
+        self.nginx_format = cfg_key[7]
+        self.geoip_db_path = geoip_db_path
+        self.rings = {bs: _Ring(bs, slots) for bs, slots in LEVELS}
+        # 可重入：LiveView 的查询方法互相调用时会再次获取
+        self.lock = threading.RLock()
+        self.available = True
+        self.cursor: Optional[int] = None
+        # Redis 模式读 compact blob（True）还是原始行（False）；首次 refresh 时决定，之后不切换（两者游标不同）
+        self.use_compact: Optional[bool] = None if mode == TrafficDashboardConfig.ACCESS_LOG_MODE_REDIS else False
+        self.inode: Optional[int] = None
+        self.file_tail = FileTail(file_path)
+        self.last_refresh = 0.0
+        self.stats = {"lines": 0, "records": 0, "skipped_lines": 0, "refreshed_at": 0.0}
+
+    # ---- ingest ----
+    def _add_records(self, recs: List[Dict[str, Any]]) -> None:
+        rings = list(self.rings.values())
+        touched: Dict[int, _Bucket] = {}
+        for r in recs:
+            ts = r.get("ts")
+            if ts is None:
+                continue
+            for ring in rings:
+                b = ring.bucket_for(ts)
+                if b is not None:
+                    b.add(r)
+                    touched[id(b)] = b
+        for b in touched.values():
+            b.compact()
+        self.stats["records"] += len(recs)
+
+    def _consume_lines(self, lines: List[str]) -> None:
+        for i in range(0, len(lines), _PARSE_CHUNK):
+            chunk = lines[i:i + _PARSE_CHUNK]
+            recs = records_from_lines(chunk, self.log_format, self.nginx_format)
+            enrich_records(recs, self.geoip_db_path)
+            self._add_records(recs)
+            self.stats["lines"] += len(chunk)
+
+    def _fetch_redis(self, bootstrap_cap: int) -> List[str]:
+        r = traffic_redis_client()
+        if r is None:
+            self.available = False
+            return []
+        cursor = -1 if self.cursor is None else self.cursor
+        res = r.eval(_FETCH_NEW_LUA, 2, self.redis_key, seq_key(self.redis_key), cursor, bootstrap_cap)
+        seq = int(res[0])
+        if seq < 0:
+            self.available = False
+            return []
+        self.available = True
+        lines = list(res[2]) if len(res) > 2 else []
+        if self.cursor is not None:
+            if seq < self.cursor:
+                # 序号被重置（key 被删后重建）：重新从 list 尾部开始
+                logger.info("live_aggregator: %s seq reset", self.redis_key)
+            elif seq - self.cursor > len(lines):
+                self.stats["skipped_lines"] += seq - self.cursor - len(lines)
+        self.cursor = seq
+        return lines
+
+    def _fetch_compact(self, bootstrap_cap: int) -> bool:
+        """compact blob（TRAFFIC_BUFFER_FORMAT=both/compact）：直接解码，跳过解析与 GeoIP。没有 blob 时返回 False。"""
+        if self.cursor is None:
+            seq, blobs = fetch_compact_tail(self.redis_key, bootstrap_cap)
+            if seq < 0:
+                return False
+            self.use_compact = True
+            self.stats["compact"] = True
+        else:
+            r = traffic_redis_binary_client()
+            if r is None:
+                return False
+            res = r.eval(_FETCH_NEW_LUA, 2, rec_key(self.redis_key), rec_seq_key(self.redis_key), self.cursor, 1_000_000)
+            seq = int(res[0])
+            if seq < 0:
+                self.cursor = None
+                return False
+            blobs = list(res[2]) if len(res) > 2 else []
+            if seq < self.cursor:
+                logger.info("live_aggregator: %s compact seq reset", self.redis_key)
+        self.available = True
+        self.cursor = seq
+        batch = decode_blobs(blobs)
+        if self.stats["records"] == 0 and len(batch) > bootstrap_cap:
+            batch = batch.tail(bootstrap_cap)
+        if len(batch):
+            self._add_records(list(batch.iter_records()))
+        return True
+
+    def _fetch_file(self, bootstrap_bytes: int) -> List[str]:
+        if not self.file_path:
+            self.available = False
+            return []
+        tail = self.file_tail
+        if not tail.started and not tail.start(bootstrap_bytes):
+            return []
+        self.available = True
+        max_read = max(1 << 20, _env_int("TRAFFIC_LIVE_AGG_MAX_READ_BYTES", 64 * 1024 * 1024))
+        lines, _ = tail.read_new(max_read, skip_backlog=False)
+        self.cursor, self.inode = tail.offset, tail.inode
+        return lines
+
+    def refresh(self, *, bootstrap_lines: int, bootstrap_bytes: int, force: bool = False) -> None:
+        now = time.time()
+        if not force and now - self.last_refresh < _refresh_sec():
+            return
+        with self.lock:
+            if not force and now - self.last_refresh < _refresh_sec():
+                return
+            try:
+                if self.mode == TrafficDashboardConfig.ACCESS_LOG_MODE_REDIS:
+                    lines = []
+                    fmt = self.cfg_key[6]
+                    if self.use_compact is None and fmt != "both":
+                        self.use_compact = fmt == "compact"
+                    if self.use_compact is not False and not self._fetch_compact(bootstrap_lines):
+                        if self.use_compact is None:
+                            # both 且还没有 compact blob：固定走原始行
+                            self.use_compact = False
+                        else:
+                            self.available = False
+                    if self.use_compact is False:
+                        lines = self._fetch_redis(bootstrap_lines)
+                else:
+                    lines = self._fetch_file(bootstrap_bytes)
+                if lines:
+                    self._consume_lines(lines)
+            except Exception as e:
+                logger.warning("live_aggregator refresh %s: %s", self.cfg_key[0], e)
+            self.last_refresh = time.time()
+            self.stats["refreshed_at"] = self.last_refresh
+
+
+# -------------------------
+# queries (same shapes as aggregator.*)
+# -------------------------
+def _cover(sources: List[LiveSource], lo: float, hi: float, now: float) -> List[_Bucket]:
+    """
+    用尽量粗的桶拼出 [lo, hi)：粗桶只取完全落在区间内的，两侧零头交给更细一级；
+    最细一级可用（保留时长覆盖）的层取部分重叠的桶。
+    """
+    levels = [bs for bs, _ in sorted(LEVELS, reverse=True)]
+
+    def usable(bs: int, a: float) -> bool:
+        ring = sources[0].rings[bs]
+        return a >= now - ring.retention
+
+    def walk(a: float, b: float, li: int) -> List[_Bucket]:
+        if a >= b:
+            return []
+        finer = [bs for bs in levels[li + 1:] if usable(bs, a)]
+        bs = levels[li]
+        if not finer:
+            out = []
+            for s in sources:
+                out.extend(s.rings[bs].overlapping(a, b))
+            return out
+        a2 = math.ceil(a / bs) * bs
+        b2 = math.floor(b / bs) * bs
+        if a2 >= b2:
+            return walk(a, b, li + 1)
+        out = walk(a, a2, li + 1)
+        for s in sources:
+            out.extend(s.rings[bs].buckets(a2, b2))
+        out.extend(walk(b2, b, li + 1))
+        return out
+
+    return walk(lo, hi, 0)
+
+
+def _now() -> float:
+    return datetime.now(timezone.utc).timestamp()
+
+
+def _locked(method):
+    """查询期间持有所有 source 的锁：refresh() 会在其他线程里修改桶内的 dict。"""
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with ExitStack() as stack:
+            # 固定顺序加锁，多个 source=all 查询并发时不会死锁
+            for s in sorted(self.sources, key=id):
+                stack.enter_context(s.lock)
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+class LiveView:
+    """一个或多个 source（source=all）的只读查询视图。"""
+
+    def __init__(self, sources: List[LiveSource]):
+        self.sources = sources
+
+    def _ts_buckets(self, range_key: str) -> Tuple[int, List[Tuple[int, _Bucket]]]:
+        start, end = window_bounds(range_key)
+        bs = bucket_seconds(range_key)
+        by_start: Dict[int, _Bucket] = {}
+        single = len(self.sources) == 1
+        for s in self.sources:
+            for b in s.rings[bs].overlapping(start, end + 1):
+                if not b.n:
+                    continue
+                if single:
+                    by_start[b.start] = b
+                    continue
+                acc = by_start.get(b.start)
+                if acc is None:
+                    acc = by_start[b.start] = _Bucket(b.start)
+                _merge_counts(acc, b)
+        return bs, sorted(by_start.items())
+
+    @_locked
+    def timeseries(self, range_key: str) -> Dict[str, Any]:
+        start, end = window_bounds(range_key)
+        bs, items = self._ts_buckets(range_key)
+        if not items:
+            return _empty_ts(start, end, bs)
+        qps, reqs, p50, p95, p99, s2, s4, s5 = [], [], [], [], [], [], [], []
+        dur = max(bs, 1)
+        for t, b in items:
+            ms = int(t * 1000)
+            qps.append([ms, round(b.n / dur, 4)])
+            reqs.append([ms, b.n])
+            p50.append([ms, b.hist.quantile(0.50)])
+            p95.append([ms, b.hist.quantile(0.95)])
+            p99.append([ms, b.hist.quantile(0.99)])
+            s2.append([ms, round(b.s2 / dur, 4)])
+            s4.append([ms, round(b.s4 / dur, 4)])
+            s5.append([ms, round(b.s5 / dur, 4)])
+        return {
+            "bucket_sec": bs,
+            "range": range_key,
+            "qps": qps,
+            "requests": reqs,
+            "latency": {"p50": p50, "p95": p95, "p99": p99},
+            "status_stack": {"2xx": s2, "4xx": s4, "5xx": s5},
+        }
+
+    def _window(self, range_key: str) -> List[_Bucket]:
+        start, end = window_bounds(range_key)
+        return _cover(self.sources, start, end + 1, end)
+
+    @_locked
+    def overview(self, range_key: str) -> Dict[str, Any]:
+        buckets = self._window(range_key)
+        now = _now()
+        total = sum(b.n for b in buckets)
+        err = sum(b.s4 + b.s5 for b in buckets)
+        lat_sum = sum(b.lat_sum for b in buckets)
+        lat_nz = sum(b.lat_nz for b in buckets)
+        # 最近 60s：含左侧部分桶，按实际覆盖时长折算
+        last60 = 0
+        for s in self.sources:
+            last60 += sum(b.n for b in s.rings[10].overlapping(now - 60, now + 1))
+        span60 = max(60.0, now - math.floor((now - 60) / 10) * 10)
+        err_rate = (err / total * 100) if total else 0.0
+
+        ts_data = self.timeseries(range_key)
+        spark_qps = ts_data["qps"][-40:]
+        _, items = self._ts_buckets(range_key)
+        err_spark = [
+            [int(t * 1000), round((b.s4 + b.s5) / b.n * 100, 3) if b.n else 0.0] for t, b in items[-40:]
+        ]
+        return {
+            "range": range_key,
+            "refreshed_at": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+            "total_requests": total,
+            "total_requests_delta_pct": 0.0,
+            "qps": round(last60 / span60, 4),
+            "latency_avg_ms": round(lat_sum / lat_nz, 2) if lat_nz else 0.0,
+            "error_rate_pct": round(err_rate, 3),
+            "availability_pct": round(100.0 - min(err_rate, 100.0), 3),
+            "series": {"qps": spark_qps, "error_rate": err_spark[-len(spark_qps):]},
+            "live_aggregate": True,
+        }
+
+    @_locked
+    def geo(self, range_key: str, granularity: str, country_filter: str) -> Dict[str, Any]:
+        from .geo_centroids import centroid_for_country
+
+        buckets = self._window(range_key)
+        if granularity == "province" and (country_filter or "").upper() == "CN":
+            counts: Dict[str, int] = {}
+            for b in buckets:
+                for name, n in b.subs.items():
+                    counts[name] = counts.get(name, 0) + n
+            items = [
+                {"code": name, "name": name, "lat": 35.0, "lng": 105.0, "requests": n}
+                for name, n in sorted(counts.items(), key=lambda x: -x[1])[:80]
+            ]
+            return {"range": range_key, "granularity": "province", "items": items}
+
+        acc: Dict[str, list] = {}
+        for b in buckets:
+            for code, g in b.geo.items():
+                a = acc.get(code)
+                if a is None:
+                    acc[code] = list(g)
+                    continue
+                a[0] += g[0]
+                if a[2] is None and g[2] is not None:
+                    a[2], a[3] = g[2], g[3]
+        items = []
+        for code, (n, name, lat, lng) in sorted(acc.items(), key=lambda x: -x[1][0])[:200]:
+            if lat is None:
+                lat_lng = centroid_for_country(code) if code not in ("LAN", "??") else None
+                lat, lng = (lat_lng[0], lat_lng[1]) if lat_lng else (0.0, 0.0)
+            items.append({"code": code, "name": name or code, "lat": lat, "lng": lng, "requests": n})
+        return {"range": range_key, "granularity": "country", "items": items}
+
+    @_locked
+    def top(self, range_key: str, top_type: str, limit: int) -> Dict[str, Any]:
+        buckets = self._window(range_key)
+        limit = max(1, min(limit, 100))
+
+        if top_type in ("paths", "slow"):
+            acc = _merge_hh(buckets, "paths_hh")
+            stats: Dict[str, list] = {}
+            for b in buckets:
+                for uri, u in b.uri_stats.items():
+                    if uri not in acc.items:
+                        continue
+                    a = stats.get(uri)
+                    if a is None:
+                        a = stats[uri] = [0, LatencyHistogram(), 0.0]
+                    a[0] += u[0]
+                    a[1].merge(u[1])
+                    if u[2] > a[2]:
+                        a[2] = u[2]
+            empty = [0, LatencyHistogram(), 0.0]
+            if top_type == "paths":
+                total = sum(b.n for b in buckets) or 1
+                rows = []
+                for uri, n, err in acc.top(limit):
+                    st = stats.get(uri, empty)
+                    rows.append(
+                        {
+                            "path": uri,
+                            "requests": n,
+                            "requests_min": n - err,
+                            "error": err,
+                            "p95_ms": round(st[1].quantile(0.95), 2),
+                            "errors_5xx": st[0],
+                            "share_pct": round(n / total * 100, 2),
+                        }
+                    )
+                return {"type": "paths", "range": range_key, "items": rows}
+            rows = [
+                {
+                    "path": uri,
+                    "requests": acc.items[uri][0],
+                    "p95_ms": round(st[1].quantile(0.95), 2),
+                    "p99_ms": round(st[1].quantile(0.99), 2),
+                    "max_ms": round(st[2], 2),
+                }
+                for uri, st in stats.items()
+            ]
+            rows.sort(key=lambda x: -x["p95_ms"])
+            return {"type": "slow", "range": range_key, "items": rows[:limit]}
+
+        if top_type == "status":
+            fams: Dict[str, int] = {}
+            for b in buckets:
+                for k, n in b.fams.items():
+                    fams[k] = fams.get(k, 0) + n
+            return {"type": "status", "range": range_key, "items": [{"name": k, "value": v} for k, v in sorted(fams.items())]}
+
+        if top_type == "ip":
+            acc = _merge_hh(buckets, "ips_hh")
+            rows = []
+            for ip, n, err in acc.top(limit):
+                country = next((b.ip_country[ip] for b in buckets if b.ip_country.get(ip)), "")
+                rows.append({"ip": ip, "requests": n, "requests_min": n - err, "error": err, "country": country})
+            return {"type": "ip", "range": range_key, "items": rows}
+
+        return {"type": top_type, "range": range_key, "items": []}
+
+
+def _merge_hh(buckets: List[_Bucket], field: str) -> HeavyHitters:
+    """合并各桶的 heavy-hitter 摘要；中途截断保持内存有界，上下界仍然成立。"""
+    acc = HeavyHitters()
+    for b in buckets:
+        acc.merge(getattr(b, field))
+        acc.truncate(_MAX_KEYS * 4)
+    return acc
+
+
+def _merge_counts(dst: _Bucket, src: _Bucket) -> None:
+    """时间序列用到的计数合并（多 source 同一时间桶）。"""
+    dst.n += src.n
+    dst.s2 += src.s2
+    dst.s4 += src.s4
+    dst.s5 += src.s5
+    dst.hist.merge(src.hist)
+
+
+# -------------------------
+# registry
+# -------------------------
+_sources: Dict[str, LiveSource] = {}
+_registry_lock = threading.Lock()
+
+
+def _source_key(cfg: TrafficDashboardConfig, src: Dict[str, Any]) -> tuple:
+    mode = _access_mode(cfg)
+    rk = ((src.get("redis_key") or "").strip() or legacy_redis_key(cfg)) if mode == "redis" else ""
+    fp = (src.get("file_path") or "").strip() if mode != "redis" else ""
+    return (src["id"], mode, rk, fp, cfg.log_format or "json", cfg.geoip_db_path or "", buffer_format(), cfg.nginx_log_format or "")
+
+
+def _get_source(cfg: TrafficDashboardConfig, src: Dict[str, Any]) -> LiveSource:
+    key = _source_key(cfg, src)
+    with _registry_lock:
+        ls = _sources.get(key[0])
+        if ls is None or ls.cfg_key != key:
+            # 新 source 或配置变化（路径 / key / 格式 / GeoIP）：重建
+            ls = LiveSource(key, key[1], key[2], key[3], key[4], key[5])
+            _sources[key[0]] = ls
+        return ls
+
+
+def live_view(
+    cfg: TrafficDashboardConfig,
+    source_id: str,
+    *,
+    bootstrap_lines: Optional[int] = None,
+    bootstrap_bytes: int = 4 * 1024 * 1024,
+) -> Optional[LiveView]:
+    """
+    返回已追上最新数据的查询视图；未开启、源不存在或不可增量读取（Redis list 无序号等）时返回 None，
+    调用方回退到原始读取。
+    """
+    if not live_agg_enabled() or not cfg.enabled:
+        return None
+    sources = normalized_log_sources(cfg)
+    sid = (source_id or "").strip()
+    if sid and sid != "all":
+        sources = [s for s in sources if s["id"] == sid]
+    if not sources:
+        return None
+    lines_cap = bootstrap_lines if bootstrap_lines is not None else redis_cap(cfg)
+    picked = []
+    for src in sources:
+        ls = _get_source(cfg, src)
+        ls.refresh(bootstrap_lines=lines_cap, bootstrap_bytes=bootstrap_bytes)
+        if not ls.available:
+            return None
+        picked.append(ls)
+    return LiveView(picked)
+
+
+def live_stats() -> Dict[str, Any]:
+    with _registry_lock:
+        items = list(_sources.values())
+    return {
+        ls.cfg_key[0]: dict(ls.stats, mode=ls.mode, cursor=ls.cursor, available=ls.available) for ls in items
+    }
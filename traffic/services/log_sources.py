@@ -5,11 +5,16 @@ from __future__ import annotations
 
 import json
 import os
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 from ..models import TrafficDashboardConfig
+from .columnar import RecordBatch
+from .compact_records import decode_blobs
+from .file_follower import file_follow_enabled, followed_batch
+from .geoip_lookup import enrich_records
 from .nginx_log import load_records, records_from_lines
-from .redis_log_buffer import fetch_tail_lines
+from .redis_log_buffer import buffer_format, fetch_compact_tail, fetch_tail_lines
+from .time_seek import read_time_range, time_seek_enabled
 
 
 def _env_file_path() -> str:
@@ -99,14 +104,94 @@ def load_records_for_source(
         if redis_line_cap is not None:
             cap = min(cap, max(1000, redis_line_cap))
         lines = fetch_tail_lines(key, cap)
-        return records_from_lines(lines, cfg.log_format)
+        return records_from_lines(lines, cfg.log_format, cfg.nginx_log_format)
     path = (src.get("file_path") or "").strip()
     if not path:
         return []
     mtb = cfg.max_tail_bytes
     if max_tail_bytes_override is not None:
         mtb = min(mtb, max(65536, max_tail_bytes_override))
-    return load_records(path, cfg.log_format, mtb)
+    return load_records(path, cfg.log_format, mtb, cfg.nginx_log_format)
+
+
+def load_batch_for_source(
+    cfg: TrafficDashboardConfig,
+    src: Dict[str, Any],
+    *,
+    redis_line_cap: Optional[int] = None,
+    max_tail_bytes_override: Optional[int] = None,
+    time_window: Optional[Tuple[float, float]] = None,
+) -> RecordBatch:
+    """
+    已 enrich 的列式批次；Redis 模式且写入了 compact blob 时直接解码，文件模式开启跟随时取常驻窗口，
+    都不再重复解析行、查 GeoIP。文件模式给定 time_window 且开启时间定位时，跟随窗口覆盖不到的区间
+    改为按时间二分定位、完整读取该区间。
+    """
+    if _access_mode(cfg) == TrafficDashboardConfig.ACCESS_LOG_MODE_REDIS and buffer_format() != "raw":
+        key = (src.get("redis_key") or "").strip() or legacy_redis_key(cfg)
+        cap = redis_cap(cfg)
+        if redis_line_cap is not None:
+            cap = min(cap, max(1000, redis_line_cap))
+        seq, blobs = fetch_compact_tail(key, cap)
+        if seq >= 0 or buffer_format() == "compact":
+            return decode_blobs(blobs).tail(cap)
+    elif _access_mode(cfg) != TrafficDashboardConfig.ACCESS_LOG_MODE_REDIS:
+        path = (src.get("file_path") or "").strip()
+        if not path:
+            return RecordBatch()
+        seek = time_window is not None and time_seek_enabled()
+        if file_follow_enabled():
+            mtb = cfg.max_tail_bytes
+            if max_tail_bytes_override is not None:
+                mtb = min(mtb, max(65536, max_tail_bytes_override))
+            followed = followed_batch(
+                path,
+                cfg.log_format,
+                cfg.nginx_log_format,
+                cfg.geoip_db_path,
+                mtb,
+                since=time_window[0] if seek else None,
+            )
+            if followed is not None:
+                return followed
+        if seek:
+            lines = read_time_range(path, time_window[0], time_window[1], cfg.log_format, cfg.nginx_log_format)
+            if lines is not None:
+                recs = records_from_lines(lines, cfg.log_format, cfg.nginx_log_format)
+                enrich_records(recs, cfg.geoip_db_path)
+                return RecordBatch.from_records(recs)
+    recs = load_records_for_source(
+        cfg, src, redis_line_cap=redis_line_cap, max_tail_bytes_override=max_tail_bytes_override
+    )
+    enrich_records(recs, cfg.geoip_db_path)
+    return RecordBatch.from_records(recs)
+
+
+def load_raw_batch(
+    cfg: TrafficDashboardConfig,
+    source_id: str,
+    *,
+    redis_line_cap: Optional[int] = None,
+    max_tail_bytes_override: Optional[int] = None,
+    time_window: Optional[Tuple[float, float]] = None,
+) -> RecordBatch:
+    """``load_raw_records`` 的列式版本（含 GeoIP enrich）。"""
+    sources = normalized_log_sources(cfg)
+    sid = (source_id or "").strip()
+    if sid and sid != "all":
+        sources = [s for s in sources if s["id"] == sid]
+    return RecordBatch.concat(
+        [
+            load_batch_for_source(
+                cfg,
+                s,
+                redis_line_cap=redis_line_cap,
+                max_tail_bytes_override=max_tail_bytes_override,
+                time_window=time_window,
+            )
+            for s in sources
+        ]
+    )
 
 
 def load_raw_records(
@@ -5,6 +5,8 @@ import re
 from datetime import datetime, timedelta, timezone
 from typing import Any, Dict, List, Optional
 
+from .nginx_format import compile_log_format, json_loads, normalize_json
+
 logger = logging.getLogger(__name__)
 _missing_time_logged = False
 
@@ -127,16 +129,20 @@ def _ts_from_iso8601(val: Any) -> Optional[float]:
         return None
 
 
-def parse_log_line(line: str, log_format: str) -> Optional[Dict[str, Any]]:
-    line = line.strip()
-    if not line:
-        return None
-    if log_format == "json":
-        try:
-            obj = json.loads(line)
-        except json.JSONDecodeError:
-            return None
-        return normalize_json_record(obj)
+def _now_fallback() -> float:
+    """行内没有可解析的请求时间：用当前时间（只告警一次）。"""
+    global _missing_time_logged
+    if not _missing_time_logged:
+        _missing_time_logged = True
+        logger.warning(
+            "traffic: log lines lack parseable request time (msec / time_local / time_iso8601); "
+            "charts use ingest time until log_format is fixed"
+        )
+    return datetime.now(timezone.utc).timestamp()
+
+
+def _parse_combined_regex(line: str) -> Optional[Dict[str, Any]]:
+    """旧的 combined 正则；编译格式切分失败（如缺 referer / UA）时兜底。"""
     m = _COMBINED_RE.match(line)
     if not m:
         return None
@@ -159,6 +165,37 @@ def parse_log_line(line: str, log_format: str) -> Optional[Dict[str, Any]]:
     }
 
 
+def _line_parser(log_format: str, nginx_format: str = ""):
+    """按配置返回单行解析函数（格式只编译一次，供批量解析复用）。"""
+    if log_format == "json":
+
+        def parse_json(line: str) -> Optional[Dict[str, Any]]:
+            return normalize_json(json_loads(line), _now_fallback)
+
+        return parse_json
+    try:
+        compiled = compile_log_format(nginx_format or "")
+    except ValueError as e:
+        logger.warning("traffic: unsupported nginx log_format (%s); using combined regex", e)
+        return _parse_combined_regex
+    if nginx_format:
+        return lambda line: compiled.parse(line, _now_fallback)
+    cparse = compiled.parse
+
+    def parse_combined(line: str) -> Optional[Dict[str, Any]]:
+        rec = cparse(line, _now_fallback)
+        return rec if rec is not None else _parse_combined_regex(line)
+
+    return parse_combined
+
+
+def parse_log_line(line: str, log_format: str, nginx_format: str = "") -> Optional[Dict[str, Any]]:
+    line = line.strip()
+    if not line:
+        return None
+    return _line_parser(log_format, nginx_format)(line)
+
+
 def normalize_json_record(obj: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """Map common Nginx JSON log keys to internal shape.
 
@@ -235,17 +272,22 @@ def normalize_json_record(obj: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     }
 
 
-def records_from_lines(lines: List[str], log_format: str) -> List[Dict[str, Any]]:
+def records_from_lines(lines: List[str], log_format: str, nginx_format: str = "") -> List[Dict[str, Any]]:
+    parse = _line_parser(log_format, nginx_format)
     out: List[Dict[str, Any]] = []
+    append = out.append
     for ln in lines:
-        rec = parse_log_line(ln, log_format)
+        ln = ln.strip()
+        if not ln:
+            continue
+        rec = parse(ln)
         if rec:
-            out.append(rec)
+            append(rec)
     return out
 
 
 def load_records(
-    access_path: str, log_format: str, max_tail_bytes: int
+    access_path: str, log_format: str, max_tail_bytes: int, nginx_format: str = ""
 ) -> List[Dict[str, Any]]:
     lines = read_log_tail(access_path, max_tail_bytes)
-    return records_from_lines(lines, log_format)
+    return records_from_lines(lines, log_format, nginx_format)
@@ -4,6 +4,10 @@ Redis list buffer for Nginx access lines shipped from remote hosts (K8s / separa
 Env:
   TRAFFIC_REDIS_URL — preferred (e.g. redis://redis.traffic.svc:6379/1)
   REDIS_URL — fallback if TRAFFIC_REDIS_URL unset
+  TRAFFIC_BUFFER_FORMAT — raw (default, lines only) / both (lines + compact blobs) / compact (blobs only)
+
+Compact blobs (``compact_records``) go to ``{key}:rec``, one per ingest batch, with a parallel
+``{key}:rec:n`` list of line counts so trimming keeps at least ``max_lines`` records.
 """
 import logging
 import os
@@ -37,6 +41,129 @@ def _client():
     return redis.from_url(redis_url(), decode_responses=True, socket_connect_timeout=2)
 
 
+def traffic_redis_binary_client():
+    """Same Redis as ``traffic_redis_client`` but returns raw bytes (compact record blobs)."""
+    if not is_configured():
+        return None
+    try:
+        import redis
+
+        return redis.from_url(redis_url(), decode_responses=False, socket_connect_timeout=2)
+    except Exception as e:
+        logger.warning("traffic_redis_binary_client: %s", e)
+        return None
+
+
+BUFFER_FORMATS = ("raw", "both", "compact")
+
+
+def buffer_format() -> str:
+    f = (os.environ.get("TRAFFIC_BUFFER_FORMAT", "raw") or "raw").strip().lower()
+    return f if f in BUFFER_FORMATS else "raw"
+
+
+def rec_key(key: str) -> str:
+    return f"{key}:rec"
+
+
+def rec_count_key(key: str) -> str:
+    return f"{key}:rec:n"
+
+
+def rec_seq_key(key: str) -> str:
+    """Monotonic count of blobs ever pushed to ``rec_key(key)``."""
+    return f"{key}:rec:seq"
+
+
+# KEYS: blobs, counts, total, seq  ARGV: blob, n, max_lines
+# 追加后从头部弹出整批，直到去掉下一批就会低于 max_lines
+_PUSH_COMPACT_LUA = """
+redis.call('RPUSH', KEYS[1], ARGV[1])
+redis.call('RPUSH', KEYS[2], ARGV[2])
+redis.call('INCR', KEYS[4])
+local total = redis.call('INCRBY', KEYS[3], ARGV[2])
+local cap = tonumber(ARGV[3])
+while true do
+  local first = redis.call('LINDEX', KEYS[2], 0)
+  if not first then break end
+  local c = tonumber(first)
+  if total - c < cap then break end
+  redis.call('LPOP', KEYS[1])
+  redis.call('LPOP', KEYS[2])
+  total = redis.call('DECRBY', KEYS[3], c)
+end
+return total
+"""
+
+# KEYS: blobs, counts, seq  ARGV: max_lines
+# 返回 {seq, blob...}：从尾部取足够覆盖 max_lines 行的批次
+_FETCH_COMPACT_TAIL_LUA = """
+local seq = tonumber(redis.call('GET', KEYS[3]) or '-1')
+local counts = redis.call('LRANGE', KEYS[2], 0, -1)
+local want = tonumber(ARGV[1])
+local got, k = 0, 0
+for j = #counts, 1, -1 do
+  if got >= want then break end
+  got = got + tonumber(counts[j])
+  k = k + 1
+end
+local out = {seq}
+if k > 0 then
+  local blobs = redis.call('LRANGE', KEYS[1], -k, -1)
+  for _, b in ipairs(blobs) do out[#out + 1] = b end
+end
+return out
+"""
+
+
+def _total_key(key: str) -> str:
+    return f"{key}:rec:total"
+
+
+def push_compact_blob(blob: bytes, n: int, key: str, max_lines: int) -> bool:
+    if not key or not blob or n <= 0 or max_lines <= 0:
+        return False
+    r = traffic_redis_binary_client()
+    if r is None:
+        return False
+    try:
+        r.eval(
+            _PUSH_COMPACT_LUA,
+            4,
+            rec_key(key),
+            rec_count_key(key),
+            _total_key(key),
+            rec_seq_key(key),
+            blob,
+            n,
+            max_lines,
+        )
+        return True
+    except Exception as e:
+        logger.warning("redis_log_buffer compact push failed: %s", e)
+        return False
+
+
+def fetch_compact_tail(key: str, max_lines: int):
+    """(seq, [blob, ...])：覆盖最后 max_lines 行的批次（按写入顺序）；seq=-1 表示没有 compact 数据。"""
+    if not key or max_lines <= 0:
+        return -1, []
+    r = traffic_redis_binary_client()
+    if r is None:
+        return -1, []
+    try:
+        res = r.eval(_FETCH_COMPACT_TAIL_LUA, 3, rec_key(key), rec_count_key(key), rec_seq_key(key), max_lines)
+        return int(res[0]), list(res[1:])
+    except Exception as e:
+        logger.warning("redis_log_buffer compact fetch failed: %s", e)
+        return -1, []
+
+
+def seq_key(key: str) -> str:
+    """Monotonic count of lines ever pushed to ``key``; lets readers consume only new lines after LTRIM."""
+    return f"{key}:seq"
+
+
 def fetch_tail_lines(key: str, max_lines: int) -> List[str]:
     if not key or max_lines <= 0 or not is_configured():
         return []
@@ -67,8 +194,11 @@ def push_raw_lines(lines: List[str], key: str, max_lines: int) -> int:
         return 0
     try:
         r = _client()
-        r.rpush(key, *cleaned)
-        r.ltrim(key, -max_lines, -1)
+        pipe = r.pipeline(transaction=True)
+        pipe.rpush(key, *cleaned)
+        pipe.ltrim(key, -max_lines, -1)
+        pipe.incrby(seq_key(key), len(cleaned))
+        pipe.execute()
         return len(cleaned)
     except Exception as e:
         logger.warning("redis_log_buffer push failed: %s", e)
@@ -1,6 +1,17 @@
 """
 Buffer per-minute traffic counters in Redis during ingest; flush to TrafficMinuteRollup via management command / cron.
 
+Latency is kept as a mergeable log-bucket histogram (``sketches.LatencyHistogram``) in a Redis hash per
+minute/source: ingest does one HINCRBY per touched bin per batch, flush merges it into the row's
+``latency_sketch`` so late lines and later range/source merges still give correct percentiles.
+
+Top paths and client IPs are Space-Saving summaries (Redis ZSET + per-key error hash, capacity
+TRAFFIC_ROLLUP_TOPK); flush persists the top TRAFFIC_ROLLUP_TOPK_STORE entries with error bounds.
+
+Ingest collapses each batch in Python first (counters, latency histogram, geo / path / IP Counters per
+minute) and applies every minute/source with a single registered Lua script (EVALSHA), all minutes in
+one pipeline round trip — O(distinct keys) Redis work instead of O(records) commands.
+
 Requires TRAFFIC_REDIS_URL. Enable ingest-side append with TRAFFIC_ROLLUP_ENABLED=1.
 """
 from __future__ import annotations
@@ -8,23 +19,152 @@ from __future__ import annotations
 import logging
 import os
 import time
-from collections import defaultdict
+import uuid
+from collections import Counter
 from datetime import datetime, timezone
 from typing import Any, Dict, List, Optional, Tuple
 
 from django.db import transaction
 
-from ..models import TrafficMinuteRollup
+from ..models import TrafficDayRollup, TrafficHourRollup, TrafficMinuteRollup
 from .redis_log_buffer import traffic_redis_client
+from .sketches import HeavyHitters, LatencyHistogram
 
 logger = logging.getLogger(__name__)
 
 ROLLUP_DIRTY = "traffic:rollup:dirty"
+# 已认领（缓冲已 RENAME 到 claim: 键）但尚未确认提交的成员；flush 失败后由下一轮重放
+ROLLUP_CLAIMED = "traffic:rollup:claimed"
 ROLLUP_PREFIX = "traffic:rollup:"
 # Flush only minutes strictly older than (now_floor - lag) so late-arriving lines land in the same Redis bucket.
 FLUSH_LAG_MINUTES = 2
-MAX_LAT_SAMPLES = 25_000
-MAX_PATH_KEYS = 4_000
+
+# 一个分钟/数据源的整批更新（ingest 在 Python 里先聚合好，一次 EVALSHA 落地）：
+# KEYS: dirty set, counters hash, latency sketch hash, geo hash, paths zset, paths error hash, ips zset, ips error hash
+# ARGV: dirty member, topk capacity, 然后 5 段 [pair 数, field, count, ...]：counters / sketch / geo / paths / ips
+# paths / ips 按 Space-Saving 合并：已在集合中 → 累加；未满 → 加入；已满 → 顶替最小项，新项 count = 最小值 + c，error = 最小值
+_ROLLUP_APPLY_LUA = """
+redis.call('SADD', KEYS[1], ARGV[1])
+local cap = tonumber(ARGV[2])
+local i = 3
+
+local function hincr(key)
+  local n = tonumber(ARGV[i])
+  i = i + 1
+  for _ = 1, n do
+    redis.call('HINCRBY', key, ARGV[i], ARGV[i + 1])
+    i = i + 2
+  end
+end
+
+local function space_saving(zkey, ekey)
+  local n = tonumber(ARGV[i])
+  i = i + 1
+  for _ = 1, n do
+    local m = ARGV[i]
+    local c = tonumber(ARGV[i + 1])
+    i = i + 2
+    if redis.call('ZSCORE', zkey, m) then
+      redis.call('ZINCRBY', zkey, c, m)
+    elseif redis.call('ZCARD', zkey) < cap then
+      redis.call('ZADD', zkey, c, m)
+    else
+      local low = redis.call('ZRANGE', zkey, 0, 0, 'WITHSCORES')
+      local floor = tonumber(low[2])
+      redis.call('ZREM', zkey, low[1])
+      redis.call('HDEL', ekey, low[1])
+      redis.call('ZADD', zkey, floor + c, m)
+      redis.call('HSET', ekey, m, floor)
+    end
+  end
+end
+
+hincr(KEYS[2])
+hincr(KEYS[3])
+hincr(KEYS[4])
+space_saving(KEYS[5], KEYS[6])
+space_saving(KEYS[7], KEYS[8])
+return 1
+"""
+
+
+class _MinuteBatch:
+    """一个分钟/数据源在本批内的预聚合结果。"""
+
+    __slots__ = ("n", "s2", "s4", "s5", "sum_lat", "n_lat", "hist", "geo", "paths", "ips")
+
+    def __init__(self):
+        self.n = self.s2 = self.s4 = self.s5 = self.n_lat = 0
+        self.sum_lat = 0.0
+        self.hist = LatencyHistogram()
+        self.geo: Counter = Counter()
+        self.paths: Counter = Counter()
+        self.ips: Counter = Counter()
+
+    def add(self, rec: Dict[str, Any]) -> None:
+        self.n += 1
+        try:
+            st = int(rec.get("status") or 0)
+        except (TypeError, ValueError):
+            st = 0
+        if 200 <= st < 400:
+            self.s2 += 1
+        elif 400 <= st < 500:
+            self.s4 += 1
+        elif st >= 500:
+            self.s5 += 1
+        lat = rec.get("request_time_ms")
+        if lat is not None:
+            try:
+                lf = float(lat)
+                self.hist.add(lf)
+                self.sum_lat += lf
+                self.n_lat += 1
+            except (TypeError, ValueError):
+                pass
+        self.paths[(rec.get("request_uri") or "/")[:512]] += 1
+        self.ips[(rec.get("remote_addr") or "-")[:64]] += 1
+        self.geo[(rec.get("country_code") or "??")[:8]] += 1
+
+    def script_args(self, dirty_member: str, cap: int) -> List[Any]:
+        args: List[Any] = [dirty_member, cap]
+
+        def section(pairs):
+            pairs = list(pairs)
+            args.append(len(pairs))
+            for k, v in pairs:
+                args.extend((k, v))
+
+        counters = {
+            "req": self.n,
+            "s2": self.s2,
+            "s4": self.s4,
+            "s5": self.s5,
+            "sum_lat": int(self.sum_lat),
+            "n_lat": self.n_lat,
+        }
+        section((k, v) for k, v in counters.items() if v)
+        section(self.hist.to_redis_fields().items())
+        section(self.geo.items())
+        # 大的先进，避免被同批的小项顶替
+        section(self.paths.most_common())
+        section(self.ips.most_common())
+        return args
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def topk_capacity() -> int:
+    return max(20, min(_env_int("TRAFFIC_ROLLUP_TOPK", 500), 10_000))
+
+
+def topk_store() -> int:
+    return max(10, min(_env_int("TRAFFIC_ROLLUP_TOPK_STORE", 50), topk_capacity()))
 
 
 def _norm_source(source_id: str) -> str:
@@ -41,13 +181,28 @@ def _hkey(epoch: int, src: str) -> str:
 
 
 def _latkey(epoch: int, src: str) -> str:
+    """旧版的耗时样本 list；只在 flush 时读取（升级前写入的缓冲），新数据写 _sketchkey。"""
     return f"{ROLLUP_PREFIX}lat:{epoch}:{_esc(src)}"
 
 
+def _sketchkey(epoch: int, src: str) -> str:
+    return f"{ROLLUP_PREFIX}sk:{epoch}:{_esc(src)}"
+
+
 def _urikey(epoch: int, src: str) -> str:
+    """旧版的 path 计数 hash；只在 flush 时读取（升级前写入的缓冲）。"""
     return f"{ROLLUP_PREFIX}uri:{epoch}:{_esc(src)}"
 
 
+def _topkey(dim: str, epoch: int, src: str) -> str:
+    # dim: tp = paths, ti = client IPs
+    return f"{ROLLUP_PREFIX}{dim}:{epoch}:{_esc(src)}"
+
+
+def _toperrkey(dim: str, epoch: int, src: str) -> str:
+    return f"{ROLLUP_PREFIX}{dim}e:{epoch}:{_esc(src)}"
+
+
 def _geokey(epoch: int, src: str) -> str:
     return f"{ROLLUP_PREFIX}geo:{epoch}:{_esc(src)}"
 
@@ -68,7 +223,7 @@ def rollup_ingest_append(records: List[Dict[str, Any]], source_id: str) -> None:
     if not r or not records:
         return
     src = _norm_source(source_id)
-    by_min: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+    by_min: Dict[int, _MinuteBatch] = {}
     for rec in records:
         try:
             ts = float(rec.get("ts") or 0)
@@ -77,46 +232,28 @@ def rollup_ingest_append(records: List[Dict[str, Any]], source_id: str) -> None:
         if ts <= 0:
             continue
         ep = int(ts // 60)
-        by_min[ep].append(rec)
+        agg = by_min.get(ep)
+        if agg is None:
+            agg = by_min[ep] = _MinuteBatch()
+        agg.add(rec)
 
     try:
-        for ep, group in by_min.items():
-            hk, lk, uk, gk = _hkey(ep, src), _latkey(ep, src), _urikey(ep, src), _geokey(ep, src)
-            s2 = s4 = s5 = 0
-            sl = 0.0
-            nl = 0
-            pipe = r.pipeline(transaction=False)
-            pipe.sadd(ROLLUP_DIRTY, _dirty_member(ep, src))
-            for rec in group:
-                st = int(rec.get("status") or 0)
-                if 200 <= st < 400:
-                    s2 += 1
-                elif 400 <= st < 500:
-                    s4 += 1
-                elif st >= 500:
-                    s5 += 1
-                lat = rec.get("request_time_ms")
-                if lat is not None:
-                    try:
-                        lf = float(lat)
-                        pipe.rpush(lk, str(lf))
-                        sl += lf
-                        nl += 1
-                    except (TypeError, ValueError):
-                        pass
-                uri = (rec.get("request_uri") or "/")[:512]
-                pipe.hincrby(uk, uri, 1)
-                cc = (rec.get("country_code") or "??")[:8]
-                pipe.hincrby(gk, cc, 1)
-            n = len(group)
-            pipe.hincrby(hk, "req", n)
-            pipe.hincrby(hk, "s2", s2)
-            pipe.hincrby(hk, "s4", s4)
-            pipe.hincrby(hk, "s5", s5)
-            pipe.hincrby(hk, "sum_lat", int(sl))
-            pipe.hincrby(hk, "n_lat", nl)
-            pipe.ltrim(lk, -MAX_LAT_SAMPLES, -1)
-            pipe.execute()
+        apply = r.register_script(_ROLLUP_APPLY_LUA)
+        cap = topk_capacity()
+        pipe = r.pipeline(transaction=False)
+        for ep, agg in by_min.items():
+            keys = [
+                ROLLUP_DIRTY,
+                _hkey(ep, src),
+                _sketchkey(ep, src),
+                _geokey(ep, src),
+                _topkey("tp", ep, src),
+                _toperrkey("tp", ep, src),
+                _topkey("ti", ep, src),
+                _toperrkey("ti", ep, src),
+            ]
+            apply(keys=keys, args=agg.script_args(_dirty_member(ep, src), cap), client=pipe)
+        pipe.execute()
     except Exception as e:
         logger.warning("rollup_ingest_append failed: %s", e)
 
@@ -129,134 +266,497 @@ def _parse_dirty(m: str) -> Optional[Tuple[int, str]]:
         return None
 
 
-def _flush_one_redis(r, epoch: int, src: str) -> bool:
-    hk, lk, uk, gk = _hkey(epoch, src), _latkey(epoch, src), _urikey(epoch, src), _geokey(epoch, src)
-    h = r.hgetall(hk)
-    if not h:
-        for k in (hk, lk, uk, gk):
-            r.delete(k)
-        return False
-    try:
-        req = int(h.get("req") or 0)
-        s2 = int(h.get("s2") or 0)
-        s4 = int(h.get("s4") or 0)
-        s5 = int(h.get("s5") or 0)
-        sum_lat = int(h.get("sum_lat") or 0)
-        n_lat = int(h.get("n_lat") or 0)
-    except (TypeError, ValueError):
-        req = s2 = s4 = s5 = sum_lat = n_lat = 0
-    raw_lats = r.lrange(lk, 0, -1)
-    lats: List[float] = []
-    for x in raw_lats:
-        try:
-            lats.append(float(x))
-        except (TypeError, ValueError):
-            pass
-    p50 = p95 = p99 = None
-    if lats:
-        try:
-            import numpy as np
-
-            arr = np.array(lats, dtype=float)
-            p50 = float(np.percentile(arr, 50))
-            p95 = float(np.percentile(arr, 95))
-            p99 = float(np.percentile(arr, 99))
-        except Exception:
-            pass
-
-    uri_h = r.hgetall(uk) or {}
-    path_counts = sorted(
-        ((k, int(v)) for k, v in uri_h.items() if v),
-        key=lambda x: -x[1],
-    )[:20]
-    top_paths = [{"path": p, "requests": n} for p, n in path_counts]
-
-    geo_h = r.hgetall(gk) or {}
-    geo_counts = {k: int(v) for k, v in geo_h.items() if v}
-
-    bt = datetime.fromtimestamp(epoch * 60, tz=timezone.utc)
-
-    with transaction.atomic():
-        obj, _created = TrafficMinuteRollup.objects.select_for_update().get_or_create(
-            bucket_start=bt,
-            source_id=src,
-            defaults={
-                "requests": 0,
-                "sum_latency_ms": 0,
-                "count_latency": 0,
-                "status_2xx": 0,
-                "status_4xx": 0,
-                "status_5xx": 0,
-                "p50_ms": None,
-                "p95_ms": None,
-                "p99_ms": None,
-                "geo_counts": {},
-                "top_paths": [],
-            },
-        )
-        obj.requests += req
-        obj.status_2xx += s2
-        obj.status_4xx += s4
-        obj.status_5xx += s5
-        obj.sum_latency_ms += max(0, sum_lat)
-        obj.count_latency += max(0, n_lat)
-        # Percentiles from one Redis flush only; later flushes for the same minute (late lines) update counts/paths/geo only.
-        if p50 is not None and obj.p50_ms is None:
-            obj.p50_ms = p50
-            obj.p95_ms = p95
-            obj.p99_ms = p99
+def _row_topk(rows, key_name: str, floor: Optional[int]) -> HeavyHitters:
+    """库中已有行的 top 列表；升级前的 top_paths 只保留了前 20，未收录 key 以第 20 名为上界。"""
+    if floor is None:
+        counts = [int(x.get("requests") or 0) for x in rows or [] if isinstance(x, dict)]
+        floor = min(counts) if len(counts) >= 20 else 0
+    return HeavyHitters.from_list(rows, key_name, floor)
+
+
+class RollupDelta:
+    """一个桶/数据源的增量（计数、延迟直方图、geo、top path / IP）；同一份增量合并进分钟、小时、天三张表。"""
+
+    __slots__ = ("req", "s2", "s4", "s5", "sum_lat", "n_lat", "sketch", "geo_counts", "paths_hh", "ips_hh")
+
+    def __init__(self):
+        self.req = self.s2 = self.s4 = self.s5 = self.sum_lat = self.n_lat = 0
+        self.sketch = LatencyHistogram()
+        self.geo_counts: Dict[str, int] = {}
+        self.paths_hh = HeavyHitters()
+        self.ips_hh = HeavyHitters()
+
+    @classmethod
+    def from_row(cls, row: Any) -> "RollupDelta":
+        """已落库的一行（分钟表或 ClickHouse）作为增量，用于从分钟表重建粗粒度表。"""
+        d = cls()
+        d.req = int(row.requests or 0)
+        d.s2 = int(row.status_2xx or 0)
+        d.s4 = int(row.status_4xx or 0)
+        d.s5 = int(row.status_5xx or 0)
+        d.sum_lat = int(row.sum_latency_ms or 0)
+        d.n_lat = int(row.count_latency or 0)
+        d.sketch = LatencyHistogram.from_dict(row.latency_sketch)
+        d.geo_counts = {k: int(v) for k, v in (row.geo_counts or {}).items() if v}
+        floors = row.topk_floor or {}
+        d.paths_hh = _row_topk(row.top_paths, "path", floors.get("paths"))
+        d.ips_hh = _row_topk(row.top_ips, "ip", floors.get("ips", 0))
+        return d
+
+    def add(self, other: "RollupDelta") -> None:
+        self.req += other.req
+        self.s2 += other.s2
+        self.s4 += other.s4
+        self.s5 += other.s5
+        self.sum_lat += other.sum_lat
+        self.n_lat += other.n_lat
+        self.sketch.merge(other.sketch)
+        for k, v in other.geo_counts.items():
+            self.geo_counts[k] = self.geo_counts.get(k, 0) + v
+        self.paths_hh.merge(other.paths_hh)
+        self.paths_hh.truncate(topk_capacity())
+        self.ips_hh.merge(other.ips_hh)
+        self.ips_hh.truncate(topk_capacity())
+
+    def apply_to(self, obj: Any) -> None:
+        obj.requests += self.req
+        obj.status_2xx += self.s2
+        obj.status_4xx += self.s4
+        obj.status_5xx += self.s5
+        obj.sum_latency_ms += max(0, self.sum_lat)
+        obj.count_latency += max(0, self.n_lat)
+        # 迟到行的再次 flush：sketch 直接合并，分位数按合并后的 sketch 重算
+        # （升级前只存了分位数、没有 sketch 的行无法还原样本，保留原值）
+        merged = LatencyHistogram.from_dict(obj.latency_sketch)
+        if self.sketch.count and (merged.count or obj.p50_ms is None):
+            merged.merge(self.sketch)
+            obj.latency_sketch = merged.to_dict()
+            obj.p50_ms = merged.quantile(0.50)
+            obj.p95_ms = merged.quantile(0.95)
+            obj.p99_ms = merged.quantile(0.99)
         gc = dict(obj.geo_counts or {})
-        for k, v in geo_counts.items():
+        for k, v in self.geo_counts.items():
             gc[k] = gc.get(k, 0) + v
         obj.geo_counts = gc
-        tp_m = {p["path"]: p["requests"] for p in (obj.top_paths or [])}
-        for p, n in path_counts:
-            tp_m[p] = tp_m.get(p, 0) + n
-        merged_paths = sorted(tp_m.items(), key=lambda x: -x[1])[:20]
-        obj.top_paths = [{"path": a, "requests": b} for a, b in merged_paths]
-        obj.save()
+        floors = dict(obj.topk_floor or {})
+        store = topk_store()
+        # 第一次 flush 时库中行为空，合并即等于本次 summary
+        mp = _row_topk(obj.top_paths, "path", floors.get("paths"))
+        mp.merge(self.paths_hh)
+        mp.truncate(store)
+        mi = _row_topk(obj.top_ips, "ip", floors.get("ips", 0))
+        mi.merge(self.ips_hh)
+        mi.truncate(store)
+        obj.top_paths = mp.to_list("path")
+        obj.top_ips = mi.to_list("ip")
+        obj.topk_floor = {"paths": mp.floor, "ips": mi.floor}
 
-    try:
-        from .clickhouse_rollups import insert_traffic_minute_rollup_from_model
 
-        insert_traffic_minute_rollup_from_model(obj)
+def downsample_enabled() -> bool:
+    """TRAFFIC_ROLLUP_DOWNSAMPLE_ENABLED=1：flush 同时维护小时 / 天表，长区间查询改读粗粒度表。"""
+    return os.environ.get("TRAFFIC_ROLLUP_DOWNSAMPLE_ENABLED", "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def rollup_models() -> List[Any]:
+    """flush 需要写入的表（分钟表在前）。"""
+    if downsample_enabled():
+        return [TrafficMinuteRollup, TrafficHourRollup, TrafficDayRollup]
+    return [TrafficMinuteRollup]
+
+
+def bucket_floor(dt: datetime, bucket_sec: int) -> datetime:
+    t = int(dt.timestamp())
+    return datetime.fromtimestamp(t - t % bucket_sec, tz=timezone.utc)
+
+
+def hot_hours() -> int:
+    """TRAFFIC_ROLLUP_HOT_HOURS > 0：最近 N 小时读 Postgres，更早读 ClickHouse（0 = 两边都查全区间）。"""
+    return max(0, _env_int("TRAFFIC_ROLLUP_HOT_HOURS", 0))
+
+
+def hot_boundary(bucket_sec: int = 60) -> Optional[datetime]:
+    """冷热分界（按桶宽向下对齐）；未启用分层或未配置 ClickHouse 时为 None。"""
+    from .clickhouse_rollups import clickhouse_configured
+
+    hot = hot_hours()
+    if not hot or not clickhouse_configured():
+        return None
+    t = int(time.time()) - hot * 3600
+    return datetime.fromtimestamp(t - t % bucket_sec, tz=timezone.utc)
+
+
+_ROW_FIELDS = (
+    "requests",
+    "sum_latency_ms",
+    "count_latency",
+    "status_2xx",
+    "status_4xx",
+    "status_5xx",
+    "p50_ms",
+    "p95_ms",
+    "p99_ms",
+    "latency_sketch",
+    "geo_counts",
+    "top_paths",
+    "top_ips",
+    "topk_floor",
+)
+
+
+def _fetch_pruned_seeds(keys: List[Tuple[datetime, str]]) -> Tuple[Dict[Tuple[datetime, str], Any], set]:
+    """
+    冷区间的分钟行可能已被 traffic_rollup_prune 删除、只剩 ClickHouse 版本：迟到行 flush 新建行时先从
+    ClickHouse 取回已有值再合并，否则写回的整行会覆盖掉 ClickHouse 中的完整版本。
+
+    在事务外为整批一次性取回（每个数据源一次查询）。返回 (seeds, existing)：seeds 覆盖查询时 Postgres 中
+    不存在的每个冷分钟（ClickHouse 行，两边都没有时为 None），existing 为 Postgres 中已有行的冷分钟。
+    ClickHouse 查询失败时抛出异常，整批放弃、Redis 缓冲保留待下一轮重试。
+    """
+    boundary = hot_boundary(60)
+    if boundary is None:
+        return {}, set()
+    cold = [k for k in keys if k[0] < boundary]
+    if not cold:
+        return {}, set()
+    existing = set(
+        TrafficMinuteRollup.objects.filter(
+            bucket_start__in={bt for bt, _ in cold}, source_id__in={src for _, src in cold}
+        ).values_list("bucket_start", "source_id")
+    )
+    missing = {k for k in cold if k not in existing}
+    if not missing:
+        return {}, existing
+    from .clickhouse_rollups import query_rollups_clickhouse
+
+    by_src: Dict[str, List[datetime]] = {}
+    for bt, src in missing:
+        by_src.setdefault(src, []).append(bt)
+    seeds: Dict[Tuple[datetime, str], Any] = dict.fromkeys(missing)
+    for src, bts in by_src.items():
+        end = datetime.fromtimestamp(max(bts).timestamp() + 60, tz=timezone.utc)
+        rows = query_rollups_clickhouse(min(bts), end, src, 60)
+        if rows is None:
+            # None = 未配置或查询出错，不能当作「没有行」：否则写回的新行会覆盖 ClickHouse 中的完整版本
+            raise RuntimeError(f"ClickHouse seed lookup failed for pruned minutes of source {src!r}")
+        for row in rows:
+            key = (row.bucket_start, row.source_id)
+            if key in missing:
+                seeds[key] = row
+    return seeds, existing
+
+
+def _mirror_to_clickhouse(objs: List[Any], deltas: Optional[List[Tuple[datetime, str, RollupDelta]]] = None) -> None:
+    """
+    整行写入 ClickHouse 同粒度表（每张表一次多行 insert）；deltas 另写入预聚合表（CLICKHOUSE_ROLLUP_AGG_ENABLED）。
+    镜像成功的分钟行标记 ch_synced。
+    """
+    try:
+        from .clickhouse_rollups import insert_rollup_deltas, insert_rollups_from_models
+
+        done = insert_rollups_from_models(objs)
+        synced = [o.pk for o in done if hasattr(o, "ch_synced") and o.pk]
+        if synced:
+            # 只改标记，不触发 updated_at
+            TrafficMinuteRollup.objects.filter(pk__in=synced).update(ch_synced=True)
+        if deltas:
+            insert_rollup_deltas(deltas, topk_store())
     except Exception as e:
         logger.warning("ClickHouse mirror after rollup flush skipped: %s", e)
 
+
+def flush_batch_size() -> int:
+    return max(1, min(_env_int("TRAFFIC_ROLLUP_FLUSH_BATCH", 200), 5000))
+
+
+def flush_lease_ms() -> int:
+    return max(10_000, _env_int("TRAFFIC_ROLLUP_FLUSH_LEASE_MS", 120_000))
+
+
+def _leasekey(member: str) -> str:
+    return f"{ROLLUP_PREFIX}lease:{member}"
+
+
+# 只释放自己持有的租约（过期后被别的 flusher 拿走的不动）
+_RELEASE_LEASES_LUA = """
+local n = 0
+for _, k in ipairs(KEYS) do
+  if redis.call('GET', k) == ARGV[1] then
+    redis.call('DEL', k)
+    n = n + 1
+  end
+end
+return n
+"""
+
+# 提交前确认租约仍全部由自己持有并续期；任一已过期（可能已被别的 flusher 拿走）返回 0
+_RENEW_LEASES_LUA = """
+for _, k in ipairs(KEYS) do
+  if redis.call('GET', k) ~= ARGV[1] then
+    return 0
+  end
+end
+for _, k in ipairs(KEYS) do
+  redis.call('PEXPIRE', k, ARGV[2])
+end
+return 1
+"""
+
+
+def _buffer_keys(epoch: int, src: str) -> List[str]:
+    return [
+        _hkey(epoch, src),
+        _latkey(epoch, src),
+        _sketchkey(epoch, src),
+        _urikey(epoch, src),
+        _geokey(epoch, src),
+        *[f(d, epoch, src) for d in ("tp", "ti") for f in (_topkey, _toperrkey)],
+    ]
+
+
+def _claimed_keys(epoch: int, src: str) -> List[str]:
+    """flush 认领后的缓冲键（与 _buffer_keys 一一对应）；ingest 不会写这些键。"""
+    return [f"{ROLLUP_PREFIX}claim:{k[len(ROLLUP_PREFIX):]}" for k in _buffer_keys(epoch, src)]
+
+
+# 认领一个分钟/数据源的缓冲（在持有租约时执行）：
+# KEYS: dirty set, claimed set, n 个缓冲键, n 个对应的 claim 键；ARGV: dirty member
+# 原子地把缓冲键 RENAME 到 claim 键并把成员从 dirty 移到 claimed；之后迟到的行写入全新的缓冲键并重新
+# SADD dirty，由下一轮 flush 处理，不会在清理时被删掉。claim 键仍在说明上一次认领未确认提交：
+# 先重放它，实时缓冲留给下一轮。
+_CLAIM_BUFFERS_LUA = """
+local n = (#KEYS - 2) / 2
+for i = 1, n do
+  if redis.call('EXISTS', KEYS[2 + n + i]) == 1 then
+    return 0
+  end
+end
+for i = 1, n do
+  if redis.call('EXISTS', KEYS[2 + i]) == 1 then
+    redis.call('RENAME', KEYS[2 + i], KEYS[2 + n + i])
+  end
+end
+redis.call('SADD', KEYS[2], ARGV[1])
+redis.call('SREM', KEYS[1], ARGV[1])
+return 1
+"""
+
+
+def _topk_from(rows, errs: Dict[str, Any]) -> HeavyHitters:
+    items: Dict[str, list] = {}
+    for member, score in rows or []:
+        try:
+            items[member] = [int(score), int((errs or {}).get(member) or 0)]
+        except (TypeError, ValueError):
+            continue
+    # 集合已满：未收录的 key 计数不超过当前最小值
+    floor = min(c for c, _ in items.values()) if items and len(items) >= topk_capacity() else 0
+    return HeavyHitters(items, floor)
+
+
+# 每个分钟/数据源在 pipeline 中的读取命令数
+_FETCH_CMDS = 9
+
+
+def _fetch_deltas(r, members: List[Tuple[int, str]]) -> List[Optional[RollupDelta]]:
+    """一次 pipeline 往返读取整批已认领的缓冲；缓冲已不存在的成员为 None。"""
+    pipe = r.pipeline(transaction=False)
+    for ep, src in members:
+        h, lat, sk, uri, geo, tp, tpe, ti, tie = _claimed_keys(ep, src)
+        pipe.hgetall(h)
+        pipe.hgetall(sk)
+        pipe.lrange(lat, 0, -1)
+        pipe.hgetall(uri)
+        pipe.hgetall(geo)
+        for zkey, ekey in ((tp, tpe), (ti, tie)):
+            pipe.zrange(zkey, 0, -1, withscores=True)
+            pipe.hgetall(ekey)
+    res = pipe.execute()
+    out: List[Optional[RollupDelta]] = []
+    for i in range(len(members)):
+        h, sk_h, lat, legacy_uri, geo_h, tp, tpe, ti, tie = res[i * _FETCH_CMDS:(i + 1) * _FETCH_CMDS]
+        if not h:
+            out.append(None)
+            continue
+        d = RollupDelta()
+        try:
+            d.req = int(h.get("req") or 0)
+            d.s2 = int(h.get("s2") or 0)
+            d.s4 = int(h.get("s4") or 0)
+            d.s5 = int(h.get("s5") or 0)
+            d.sum_lat = int(h.get("sum_lat") or 0)
+            d.n_lat = int(h.get("n_lat") or 0)
+        except (TypeError, ValueError):
+            d.req = d.s2 = d.s4 = d.s5 = d.sum_lat = d.n_lat = 0
+        d.sketch = LatencyHistogram.from_redis_hash(sk_h or {})
+        for x in lat or []:
+            try:
+                d.sketch.add(float(x))
+            except (TypeError, ValueError):
+                pass
+        d.paths_hh = _topk_from(tp, tpe)
+        if legacy_uri:
+            d.paths_hh.merge(HeavyHitters({k: [int(v), 0] for k, v in legacy_uri.items() if v}))
+        d.ips_hh = _topk_from(ti, tie)
+        d.geo_counts = {k: int(v) for k, v in (geo_h or {}).items() if v}
+        out.append(d)
+    return out
+
+
+def _bulk_merge(
+    model,
+    deltas: Dict[Tuple[datetime, str], RollupDelta],
+    seeds: Optional[Tuple[Dict[Tuple[datetime, str], Any], set]] = None,
+) -> List[Any]:
+    """
+    一张表的整批合并（需在事务内）：INSERT ... ON CONFLICT DO NOTHING 补齐缺失行 → 按键序 SELECT ... FOR UPDATE
+    锁住（多个 flusher 同时更新同一小时 / 天行时串行化，固定顺序避免死锁）→ 在 Python 中合并 →
+    一条 INSERT ... ON CONFLICT DO UPDATE 写回。返回合并后的行对象（带 pk）。
+    """
+    keys = sorted(deltas)
+    model.objects.bulk_create(
+        [model(bucket_start=bt, source_id=src) for bt, src in keys], ignore_conflicts=True
+    )
+    wanted = set(keys)
+    locked = (
+        model.objects.select_for_update()
+        .filter(bucket_start__in={bt for bt, _ in keys}, source_id__in={src for _, src in keys})
+        .order_by("bucket_start", "source_id")
+    )
+    rows = {(o.bucket_start, o.source_id): o for o in locked if (o.bucket_start, o.source_id) in wanted}
+    minute = model is TrafficMinuteRollup
+    fields = list(_ROW_FIELDS) + (["ch_synced"] if minute else [])
+    merged: List[Any] = []
+    for key in keys:
+        obj = rows.get(key)
+        if obj is None:
+            continue
+        if minute and seeds is not None and not obj.requests and not obj.latency_sketch:
+            seed_rows, existing = seeds
+            if seed_rows.get(key) is not None:
+                for f in _ROW_FIELDS:
+                    setattr(obj, f, getattr(seed_rows[key], f))
+            elif key in existing:
+                # 预取时行还在、之后被 prune 删掉：种子未取，放弃整批待重试
+                raise RuntimeError(f"minute rollup {key} pruned during flush")
+        deltas[key].apply_to(obj)
+        if minute:
+            # 行已变化：镜像成功前不能被 prune
+            obj.ch_synced = False
+        merged.append(obj)
+    model.objects.bulk_create(
+        [model(bucket_start=o.bucket_start, source_id=o.source_id, **{f: getattr(o, f) for f in fields}) for o in merged],
+        update_conflicts=True,
+        unique_fields=["bucket_start", "source_id"],
+        update_fields=fields + ["updated_at"],
+    )
+    return merged
+
+
+def _flush_batch(r, members: List[Tuple[int, str]], owner: str, lease_ms: int) -> int:
+    """
+    一批分钟/数据源：一次 pipeline 认领（RENAME）缓冲，一次 pipeline 读取，每张表一次 upsert，
+    提交后立即一次 pipeline 删除已认领的键，最后 ClickHouse 每张表一次多行 insert。
+    """
+    claim = r.register_script(_CLAIM_BUFFERS_LUA)
+    pipe = r.pipeline(transaction=False)
+    for ep, src in members:
+        claim(
+            keys=[ROLLUP_DIRTY, ROLLUP_CLAIMED, *_buffer_keys(ep, src), *_claimed_keys(ep, src)],
+            args=[_dirty_member(ep, src)],
+            client=pipe,
+        )
+    pipe.execute()
+    deltas = _fetch_deltas(r, members)
+    minute_deltas = [
+        (datetime.fromtimestamp(ep * 60, tz=timezone.utc), src, d) for (ep, src), d in zip(members, deltas) if d
+    ]
+    saved: List[Any] = []
+    if minute_deltas:
+        # ClickHouse 查询放在事务外，不在持有行锁时等待网络
+        seeds = _fetch_pruned_seeds([(bt, src) for bt, src, _ in minute_deltas])
+        with transaction.atomic():
+            # 同一份增量依次合并进分钟 / 小时 / 天行（小时、天行始终等于已 flush 分钟行之和）
+            for model in rollup_models():
+                by_key: Dict[Tuple[datetime, str], RollupDelta] = {}
+                for bt, src, d in minute_deltas:
+                    key = (bucket_floor(bt, model.BUCKET_SEC), src)
+                    if model is TrafficMinuteRollup:
+                        by_key[key] = d
+                    else:
+                        by_key.setdefault(key, RollupDelta()).add(d)
+                saved.extend(_bulk_merge(model, by_key, seeds if model is TrafficMinuteRollup else None))
+            # 租约过期后别的 flusher 会重放同一批 claim 键：提交前确认仍持有并续期，否则回滚
+            renew = r.register_script(_RENEW_LEASES_LUA)
+            if not renew(keys=[_leasekey(_dirty_member(ep, src)) for ep, src in members], args=[owner, lease_ms]):
+                raise RuntimeError("rollup flush lease expired before commit; rolled back")
+
+    # 提交后立即删除 claim 键（在 ClickHouse 镜像之前：镜像可能阻塞到租约过期）
     pipe = r.pipeline(transaction=False)
-    pipe.delete(hk, lk, uk, gk)
-    pipe.srem(ROLLUP_DIRTY, _dirty_member(epoch, src))
+    for ep, src in members:
+        pipe.delete(*_claimed_keys(ep, src))
+    pipe.srem(ROLLUP_CLAIMED, *[_dirty_member(ep, src) for ep, src in members])
     pipe.execute()
-    return True
+    if saved:
+        _mirror_to_clickhouse(saved, minute_deltas)
+    return len(minute_deltas)
 
 
-def flush_closed_rollups() -> int:
-    """Flush Redis buffers for completed minutes into Postgres. Safe to run every minute (cron/Celery)."""
+def _closed_members(r) -> List[Tuple[int, str]]:
+    cutoff = int(time.time()) // 60 - FLUSH_LAG_MINUTES
+    out = set()
+    bad: List[str] = []
+    for m in r.smembers(ROLLUP_DIRTY):
+        parsed = _parse_dirty(m)
+        if not parsed:
+            bad.append(m)
+        elif parsed[0] <= cutoff:
+            out.add(parsed)
+    if bad:
+        r.srem(ROLLUP_DIRTY, *bad)
+    # 认领后未确认提交的成员（flush 失败 / 进程退出）：租约过期后重放
+    out.update(p for p in map(_parse_dirty, r.smembers(ROLLUP_CLAIMED)) if p)
+    # 先 flush 最旧的分钟
+    return sorted(out)
+
+
+def flush_closed_rollups(batch_size: Optional[int] = None, owner: Optional[str] = None) -> int:
+    """
+    Flush Redis buffers for completed minutes into Postgres (and ClickHouse), ``batch_size`` members at a time.
+    Each member is claimed with a Redis lease (SET NX PX), so several flushers / replicas can run
+    concurrently without double-counting. Safe to run every minute (cron) or as ``--daemon``.
+    """
     r = traffic_redis_client()
     if not r:
         return 0
-    now_m = int(time.time()) // 60
-    cutoff = now_m - FLUSH_LAG_MINUTES
     try:
-        members = list(r.smembers(ROLLUP_DIRTY))
+        members = _closed_members(r)
     except Exception as e:
         logger.warning("flush_closed_rollups smembers: %s", e)
         return 0
+    size = batch_size or flush_batch_size()
+    owner = owner or uuid.uuid4().hex
+    lease_ms = flush_lease_ms()
+    release = r.register_script(_RELEASE_LEASES_LUA)
     flushed = 0
-    for m in members:
-        parsed = _parse_dirty(m)
-        if not parsed:
-            try:
-                r.srem(ROLLUP_DIRTY, m)
-            except Exception:
-                pass
+    for i in range(0, len(members), size):
+        chunk = members[i:i + size]
+        try:
+            pipe = r.pipeline(transaction=False)
+            for ep, src in chunk:
+                pipe.set(_leasekey(_dirty_member(ep, src)), owner, nx=True, px=lease_ms)
+            mine = [m for m, ok in zip(chunk, pipe.execute()) if ok]
+        except Exception as e:
+            logger.warning("flush rollup lease: %s", e)
             continue
-        ep, src = parsed
-        if ep > cutoff:
+        if not mine:
             continue
         try:
-            if _flush_one_redis(r, ep, src):
-                flushed += 1
+            flushed += _flush_batch(r, mine, owner, lease_ms)
         except Exception as e:
-            logger.warning("flush rollup ep=%s src=%s: %s", ep, src, e)
+            logger.warning("flush rollup batch of %s (from ep=%s): %s", len(mine), mine[0][0], e)
+        finally:
+            try:
+                release(keys=[_leasekey(_dirty_member(ep, src)) for ep, src in mine], args=[owner])
+            except Exception as e:
+                logger.warning("flush rollup lease release: %s", e)
     return flushed
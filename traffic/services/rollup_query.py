@@ -1,19 +1,60 @@
 """
-Build Traffic Dashboard snapshot JSON from persisted TrafficMinuteRollup rows (custom time range).
+Build Traffic Dashboard snapshot JSON from persisted rollup rows (custom time range).
+
+With TRAFFIC_ROLLUP_DOWNSAMPLE_ENABLED=1 the coarsest table (day → hour → minute) that still yields at least
+TRAFFIC_ROLLUP_MIN_POINTS buckets for the requested span is read; the window start is aligned down to the
+bucket.
 """
 from __future__ import annotations
 
 from collections import defaultdict
 from datetime import datetime, timedelta, timezone
+import os
 from typing import Any, Dict, List, Optional, Tuple
 
 from django.utils import timezone as dj_timezone
 
-from ..models import TrafficDashboardConfig, TrafficMinuteRollup
+from ..models import TrafficDashboardConfig, TrafficDayRollup, TrafficHourRollup, TrafficMinuteRollup
 from .blackbox import fetch_blackbox_summary
+from .clickhouse_rollups import query_rollup_agg, rollup_agg_enabled
 from .geo_centroids import centroid_for_country
 from .log_sources import log_source_configured
 from .redis_log_buffer import is_configured as redis_buffer_configured
+from .rollup_buffer import _row_topk, bucket_floor, downsample_enabled, hot_boundary
+from .sketches import HeavyHitters, LatencyHistogram
+
+# 跨分钟合并 top 列表时保留的候选数（超出部分并入 floor，上下界仍然成立）
+_TOPK_MERGE_CAP = 1000
+
+_ROLLUP_MODELS = {m.BUCKET_SEC: m for m in (TrafficMinuteRollup, TrafficHourRollup, TrafficDayRollup)}
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _coarsest_step(start: datetime, end: datetime, steps: Tuple[int, ...]) -> int:
+    span = (end - start).total_seconds()
+    min_points = max(1, _env_int("TRAFFIC_ROLLUP_MIN_POINTS", 120))
+    for bs in steps:
+        if span / bs >= min_points:
+            return bs
+    return 60
+
+
+def pick_resolution(start: datetime, end: datetime) -> int:
+    """满足最少点数（TRAFFIC_ROLLUP_MIN_POINTS，默认 120）的最粗桶宽：天 → 小时 → 分钟。"""
+    if not downsample_enabled():
+        return 60
+    return _coarsest_step(start, end, (86400, 3600))
+
+
+def agg_step(start: datetime, end: datetime) -> int:
+    """ClickHouse 服务端聚合的步长：不受表粒度限制，可取中间档。"""
+    return _coarsest_step(start, end, (86400, 21600, 3600, 900, 300))
 
 
 def _utc(dt: datetime) -> datetime:
@@ -36,14 +77,29 @@ def _rollup_row_key(r: Any) -> Tuple[datetime, str]:
     return (bt, sid)
 
 
-def fetch_rollups_for_range(start: datetime, end: datetime, source_id: str) -> List[Any]:
+def fetch_rollups_for_range(start: datetime, end: datetime, source_id: str, bucket_sec: int = 60) -> List[Any]:
     """
-    Postgres：近期与回退；ClickHouse：长期。合并时同一 (bucket_start, source_id) 以 CH 为准。
+    Postgres：近期与回退；ClickHouse：长期。bucket_sec 选择分钟 / 小时 / 天表；start 按桶宽向下对齐。
+    开启 TRAFFIC_ROLLUP_HOT_HOURS 时按分界只查一边（跨分界时各查一段后拼接）；
+    否则两边都查全区间，同一 (bucket_start, source_id) 以 CH 为准。
     """
-    from .clickhouse_rollups import query_minute_rollups_clickhouse
+    from .clickhouse_rollups import query_rollups_clickhouse
 
-    pg_rows = query_rollups(start, end, source_id)
-    ch_rows = query_minute_rollups_clickhouse(start, end, source_id)
+    start = bucket_floor(_utc(start), bucket_sec)
+    end = _utc(end)
+    boundary = hot_boundary(bucket_sec)
+    if boundary is not None:
+        if start >= boundary:
+            return query_rollups(start, end, source_id, bucket_sec)
+        ch_rows = query_rollups_clickhouse(start, min(end, boundary), source_id, bucket_sec)
+        if ch_rows is None:
+            # ClickHouse 不可用：冷区间也读 Postgres（尚未 prune 的行仍在）
+            return query_rollups(start, end, source_id, bucket_sec)
+        if end <= boundary:
+            return ch_rows
+        return ch_rows + query_rollups(boundary, end, source_id, bucket_sec)
+    pg_rows = query_rollups(start, end, source_id, bucket_sec)
+    ch_rows = query_rollups_clickhouse(start, end, source_id, bucket_sec)
     if ch_rows is None:
         return pg_rows
     merged: Dict[Tuple[datetime, str], Any] = {}
@@ -54,12 +110,13 @@ def fetch_rollups_for_range(start: datetime, end: datetime, source_id: str) -> L
     return sorted(merged.values(), key=_rollup_row_key)
 
 
-def query_rollups(start: datetime, end: datetime, source_id: str) -> List[TrafficMinuteRollup]:
+def query_rollups(start: datetime, end: datetime, source_id: str, bucket_sec: int = 60) -> List[Any]:
     start = _utc(start)
     end = _utc(end)
     if end <= start:
         return []
-    qs = TrafficMinuteRollup.objects.filter(bucket_start__gte=start, bucket_start__lt=end).order_by(
+    model = _ROLLUP_MODELS.get(bucket_sec, TrafficMinuteRollup)
+    qs = model.objects.filter(bucket_start__gte=start, bucket_start__lt=end).order_by(
         "bucket_start", "source_id"
     )
     sid = (source_id or "").strip()
@@ -86,8 +143,10 @@ def _merge_by_minute(rows: List[Any]) -> List[Dict[str, Any]]:
                 "p50_w": [],
                 "p95_w": [],
                 "p99_w": [],
+                "sketch": LatencyHistogram(),
                 "geo_counts": defaultdict(int),
-                "top_paths": defaultdict(int),
+                "paths_hh": HeavyHitters(),
+                "ips_hh": HeavyHitters(),
             }
         b = by[k]
         b["requests"] += int(getattr(r, "requests", 0) or 0)
@@ -97,7 +156,11 @@ def _merge_by_minute(rows: List[Any]) -> List[Dict[str, Any]]:
         b["status_4xx"] += int(getattr(r, "status_4xx", 0) or 0)
         b["status_5xx"] += int(getattr(r, "status_5xx", 0) or 0)
         n = int(getattr(r, "requests", 0) or 0)
-        if n > 0:
+        sk = LatencyHistogram.from_dict(getattr(r, "latency_sketch", None))
+        if sk.count:
+            b["sketch"].merge(sk)
+        elif n > 0:
+            # 升级前的行只有分位数：按请求数加权近似
             p50 = getattr(r, "p50_ms", None)
             p95 = getattr(r, "p95_ms", None)
             p99 = getattr(r, "p99_ms", None)
@@ -109,9 +172,9 @@ def _merge_by_minute(rows: List[Any]) -> List[Dict[str, Any]]:
                 b["p99_w"].append((float(p99), n))
         for cc, nv in (getattr(r, "geo_counts", None) or {}).items():
             b["geo_counts"][cc] += int(nv)
-        for item in getattr(r, "top_paths", None) or []:
-            p = item.get("path") or ""
-            b["top_paths"][p] += int(item.get("requests") or 0)
+        floors = getattr(r, "topk_floor", None) or {}
+        b["paths_hh"].merge(_row_topk(getattr(r, "top_paths", None), "path", floors.get("paths")))
+        b["ips_hh"].merge(_row_topk(getattr(r, "top_ips", None), "ip", floors.get("ips", 0)))
 
     def wavg(pairs: List[Tuple[float, int]]) -> float:
         tot = sum(n for _, n in pairs)
@@ -123,6 +186,12 @@ def _merge_by_minute(rows: List[Any]) -> List[Dict[str, Any]]:
     for k in sorted(by.keys()):
         b = by[k]
         pairs50, pairs95, pairs99 = b["p50_w"], b["p95_w"], b["p99_w"]
+        sk = b["sketch"]
+        if sk.count:
+            # 有 sketch 的部分按合并后的直方图求分位数，再与旧行（若有）加权
+            pairs50 = pairs50 + [(sk.quantile(0.50), sk.count)]
+            pairs95 = pairs95 + [(sk.quantile(0.95), sk.count)]
+            pairs99 = pairs99 + [(sk.quantile(0.99), sk.count)]
         out.append(
             {
                 "bucket_start": k,
@@ -135,15 +204,16 @@ def _merge_by_minute(rows: List[Any]) -> List[Dict[str, Any]]:
                 "p50_ms": wavg(pairs50) if pairs50 else 0.0,
                 "p95_ms": wavg(pairs95) if pairs95 else 0.0,
                 "p99_ms": wavg(pairs99) if pairs99 else 0.0,
+                "latency_sketch": sk,
                 "geo_counts": dict(b["geo_counts"]),
-                "top_paths": dict(b["top_paths"]),
+                "paths_hh": b["paths_hh"],
+                "ips_hh": b["ips_hh"],
             }
         )
     return out
 
 
-def _timeseries_from_merged(merged: List[Dict[str, Any]], range_label: str) -> Dict[str, Any]:
-    bs = 60
+def _timeseries_from_merged(merged: List[Dict[str, Any]], range_label: str, bs: int = 60) -> Dict[str, Any]:
     qps, reqs, p50, p95, p99 = [], [], [], [], []
     s2, s4, s5 = [], [], []
     for b in merged:
@@ -170,7 +240,7 @@ def _timeseries_from_merged(merged: List[Dict[str, Any]], range_label: str) -> D
 
 
 def _overview_from_merged(
-    merged: List[Dict[str, Any]], range_label: str, ts: Dict[str, Any]
+    merged: List[Dict[str, Any]], range_label: str, ts: Dict[str, Any], bs: int = 60
 ) -> Dict[str, Any]:
     total = sum(b["requests"] for b in merged)
     s2 = sum(b["status_2xx"] for b in merged)
@@ -187,7 +257,7 @@ def _overview_from_merged(
     for row in ts["requests"]:
         t_ms, n = row[0], row[1]
         t = t_ms // 1000
-        bk = int(t // 60) * 60
+        bk = int(t // bs) * bs
         b = recs_by_bucket.get(bk)
         if not b or not n:
             spark_err.append([t_ms, 0.0])
@@ -196,7 +266,12 @@ def _overview_from_merged(
             spark_err.append([t_ms, round(e / n * 100, 3) if n else 0.0])
     qps_now = 0.0
     if merged:
-        qps_now = round(float(merged[-1]["requests"]) / 60.0, 4)
+        # 最后一个小时 / 天桶通常尚未结束：按已经过的时长折算（至少一分钟）
+        elapsed = dj_timezone.now().timestamp() - merged[-1]["bucket_start"].timestamp()
+        qps_now = round(float(merged[-1]["requests"]) / min(float(bs), max(60.0, elapsed)), 4)
+    window_sketch = LatencyHistogram()
+    for b in merged:
+        window_sketch.merge(b["latency_sketch"])
     return {
         "range": range_label,
         "refreshed_at": dj_timezone.now().isoformat().replace("+00:00", "Z"),
@@ -204,17 +279,25 @@ def _overview_from_merged(
         "total_requests_delta_pct": 0.0,
         "qps": qps_now,
         "latency_avg_ms": round(avg_lat, 2),
+        # 整个区间（跨分钟、跨数据源）由 sketch 合并得到的分位数；只有旧行时为 None
+        "latency_p50_ms": round(window_sketch.quantile(0.50), 2) if window_sketch.count else None,
+        "latency_p95_ms": round(window_sketch.quantile(0.95), 2) if window_sketch.count else None,
+        "latency_p99_ms": round(window_sketch.quantile(0.99), 2) if window_sketch.count else None,
         "error_rate_pct": round(err_rate, 3),
         "availability_pct": round(100.0 - min(err_rate, 100.0), 3),
         "series": {"qps": spark_qps, "error_rate": spark_err[-len(spark_qps) :]},
     }
 
 
-def _geo_from_merged(merged: List[Dict[str, Any]], range_label: str) -> Dict[str, Any]:
+def _geo_counts_from_merged(merged: List[Dict[str, Any]]) -> Dict[str, int]:
     counts: Dict[str, int] = defaultdict(int)
     for b in merged:
         for code, n in (b.get("geo_counts") or {}).items():
             counts[code or "??"] += int(n)
+    return counts
+
+
+def _geo_payload(counts: Dict[str, int], range_label: str) -> Dict[str, Any]:
     items = []
     for code, n in sorted(counts.items(), key=lambda x: -x[1])[:200]:
         lat_lng = centroid_for_country(code) if code not in ("LAN", "??") else None
@@ -231,18 +314,25 @@ def _geo_from_merged(merged: List[Dict[str, Any]], range_label: str) -> Dict[str
     return {"range": range_label, "granularity": "country", "items": items}
 
 
-def _top_paths_from_merged(merged: List[Dict[str, Any]], range_label: str, limit: int) -> Dict[str, Any]:
-    acc: Dict[str, int] = defaultdict(int)
+def _merge_topk(merged: List[Dict[str, Any]], field: str) -> HeavyHitters:
+    acc = HeavyHitters()
     for b in merged:
-        for p, n in (b.get("top_paths") or {}).items():
-            acc[p] += int(n)
-    total = sum(acc.values()) or 1
+        acc.merge(b[field])
+        acc.truncate(_TOPK_MERGE_CAP)
+    return acc
+
+
+def _top_paths_payload(acc: HeavyHitters, total: int, range_label: str, limit: int) -> Dict[str, Any]:
+    """requests 为上界估计，requests_min 为保证下界，error = 两者之差。"""
+    total = total or 1
     rows = []
-    for path, n in sorted(acc.items(), key=lambda x: -x[1])[:limit]:
+    for path, n, err in acc.top(limit):
         rows.append(
             {
                 "path": path,
                 "requests": n,
+                "requests_min": n - err,
+                "error": err,
                 "p95_ms": 0.0,
                 "errors_5xx": 0,
                 "share_pct": round(n / total * 100, 2),
@@ -251,6 +341,23 @@ def _top_paths_from_merged(merged: List[Dict[str, Any]], range_label: str, limit
     return {"type": "paths", "range": range_label, "items": rows}
 
 
+def _top_ip_payload(acc: HeavyHitters, range_label: str, limit: int, geoip_db_path: str) -> Dict[str, Any]:
+    from .geoip_lookup import lookup_ip
+
+    rows = []
+    for ip, n, err in acc.top(limit):
+        rows.append(
+            {
+                "ip": ip,
+                "requests": n,
+                "requests_min": n - err,
+                "error": err,
+                "country": lookup_ip(ip, geoip_db_path).get("country_name") or "",
+            }
+        )
+    return {"type": "ip", "range": range_label, "items": rows}
+
+
 def _top_status_from_merged(merged: List[Dict[str, Any]], range_label: str) -> Dict[str, Any]:
     s2 = sum(b["status_2xx"] for b in merged)
     s4 = sum(b["status_4xx"] for b in merged)
@@ -274,12 +381,29 @@ def build_rollups_snapshot(
 ) -> Dict[str, Any]:
     from .aggregator import _empty_ts
 
-    rows = fetch_rollups_for_range(start, end, source_id)
-    merged = _merge_by_minute(rows)
+    agg = None
+    if rollup_agg_enabled():
+        # ClickHouse 服务端按步长聚合：只传回序列与 top-N；预聚合表尚无该区间数据时回退逐行读取
+        bs = agg_step(start, end)
+        agg = query_rollup_agg(bucket_floor(_utc(start), bs), end, source_id, bs, _TOPK_MERGE_CAP)
+        if agg is not None and not agg["rows"]:
+            agg = None
+    if agg is not None:
+        merged = agg["series"]
+        n_rows = agg["rows"]
+        geo_counts, paths_hh, ips_hh = agg["geo"], agg["paths"], agg["ips"]
+    else:
+        bs = pick_resolution(start, end)
+        rows = fetch_rollups_for_range(start, end, source_id, bs)
+        merged = _merge_by_minute(rows)
+        n_rows = len(rows)
+        geo_counts = _geo_counts_from_merged(merged)
+        paths_hh = _merge_topk(merged, "paths_hh")
+        ips_hh = _merge_topk(merged, "ips_hh")
     span = end - start if end > start else timedelta(0)
     range_label = (preset_range or "").strip() or f"custom:{int(span.total_seconds())}s"
     if not merged:
-        ts = _empty_ts(start.timestamp(), end.timestamp(), 60)
+        ts = _empty_ts(start.timestamp(), end.timestamp(), bs)
         ts["range"] = range_label
         ov = {
             "range": range_label,
@@ -293,8 +417,8 @@ def build_rollups_snapshot(
             "series": {"qps": [], "error_rate": []},
         }
     else:
-        ts = _timeseries_from_merged(merged, range_label)
-        ov = _overview_from_merged(merged, range_label, ts)
+        ts = _timeseries_from_merged(merged, range_label, bs)
+        ov = _overview_from_merged(merged, range_label, ts, bs)
     bb = fetch_blackbox_summary(cfg, inspection)
     ov["blackbox"] = bb
     if bb.get("availability_pct") is not None:
@@ -302,13 +426,15 @@ def build_rollups_snapshot(
     ov["log_configured"] = log_source_configured(cfg, redis_buffer_configured())
     ov["access_log_mode"] = (cfg.access_log_mode or "file").strip()
     ov["rollup"] = True
-    ov["rollup_rows"] = len(rows)
+    ov["rollup_rows"] = n_rows
+    ov["rollup_bucket_sec"] = bs
+    ov["rollup_clickhouse_agg"] = agg is not None
     return {
         "overview": ov,
         "timeseries": ts,
-        "geo": _geo_from_merged(merged, range_label),
-        "top_paths": _top_paths_from_merged(merged, range_label, 10),
+        "geo": _geo_payload(geo_counts, range_label),
+        "top_paths": _top_paths_payload(paths_hh, sum(b["requests"] for b in merged), range_label, 10),
         "top_slow": {"type": "slow", "range": range_label, "items": []},
-        "top_ip": {"type": "ip", "range": range_label, "items": []},
+        "top_ip": _top_ip_payload(ips_hh, range_label, 10, cfg.geoip_db_path),
         "top_status": _top_status_from_merged(merged, range_label),
     }
@@ -0,0 +1,184 @@
+"""
+Mergeable latency histogram with log-spaced bins (relative-error quantiles).
+
+Bin i covers (GAMMA^(i-1), GAMMA^i] ms; quantiles return the bin midpoint, so the relative error is
+bounded by (GAMMA-1)/(GAMMA+1) ≈ 1% regardless of distribution. Histograms add/merge in O(bins) and
+serialize to a small dict, so per-bucket latency can be kept without raw samples.
+"""
+from __future__ import annotations
+
+import math
+from typing import Dict, Iterable, Optional
+
+GAMMA = 1.02
+_LOG_GAMMA = math.log(GAMMA)
+# <= 1µs 计入零桶（包括 0 / 缺失耗时）
+MIN_VALUE_MS = 0.001
+
+
+def bin_index(value_ms: float) -> Optional[int]:
+    """None 表示零桶。"""
+    if value_ms is None or value_ms <= MIN_VALUE_MS:
+        return None
+    return int(math.ceil(math.log(value_ms) / _LOG_GAMMA))
+
+
+def bin_value(idx: int) -> float:
+    return 2.0 * GAMMA ** idx / (GAMMA + 1.0)
+
+
+class LatencyHistogram:
+    __slots__ = ("bins", "zero", "count")
+
+    def __init__(self):
+        self.bins: Dict[int, int] = {}
+        self.zero = 0
+        self.count = 0
+
+    def add(self, value_ms: float, n: int = 1) -> None:
+        idx = bin_index(value_ms)
+        if idx is None:
+            self.zero += n
+        else:
+            self.bins[idx] = self.bins.get(idx, 0) + n
+        self.count += n
+
+    def add_many(self, values: Iterable[float]) -> None:
+        for v in values:
+            self.add(v)
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        if not other.count:
+            return
+        bins = self.bins
+        for k, n in other.bins.items():
+            bins[k] = bins.get(k, 0) + n
+        self.zero += other.zero
+        self.count += other.count
+
+    def quantile(self, q: float) -> float:
+        if self.count <= 0:
+            return 0.0
+        # 与 numpy.percentile(linear) 一致：在相邻两个秩之间线性插值
+        rank = max(0.0, min(1.0, q)) * (self.count - 1)
+        lo = int(math.floor(rank))
+        hi = min(lo + 1, self.count - 1)
+        v_lo = self._value_at(lo)
+        if hi == lo or rank == lo:
+            return v_lo
+        return v_lo + (self._value_at(hi) - v_lo) * (rank - lo)
+
+    def _value_at(self, rank: int) -> float:
+        if rank < self.zero:
+            return 0.0
+        seen = self.zero
+        for k in sorted(self.bins):
+            seen += self.bins[k]
+            if seen > rank:
+                return bin_value(k)
+        return bin_value(max(self.bins)) if self.bins else 0.0
+
+    def to_redis_fields(self) -> Dict[str, int]:
+        """Redis hash 形式：field = 桶号（零桶为 "z"），值为计数；HINCRBY 即可合并。"""
+        out = {str(k): n for k, n in self.bins.items()}
+        if self.zero:
+            out["z"] = self.zero
+        return out
+
+    @classmethod
+    def from_redis_hash(cls, data: Dict[str, object]) -> "LatencyHistogram":
+        h = cls()
+        for k, n in (data or {}).items():
+            try:
+                n = int(n)
+                if k == "z":
+                    h.zero += n
+                else:
+                    h.bins[int(k)] = h.bins.get(int(k), 0) + n
+            except (TypeError, ValueError):
+                continue
+        h.count = h.zero + sum(h.bins.values())
+        return h
+
+    def to_dict(self) -> Dict[str, object]:
+        return {"z": self.zero, "b": {str(k): n for k, n in self.bins.items()}}
+
+    @classmethod
+    def from_dict(cls, data) -> "LatencyHistogram":
+        h = cls()
+        if not isinstance(data, dict):
+            return h
+        try:
+            h.zero = int(data.get("z") or 0)
+        except (TypeError, ValueError):
+            h.zero = 0
+        for k, n in (data.get("b") or {}).items():
+            try:
+                h.bins[int(k)] = int(n)
+            except (TypeError, ValueError):
+                continue
+        h.count = h.zero + sum(h.bins.values())
+        return h
+
+
+class HeavyHitters:
+    """
+    Mergeable heavy-hitter summary (Space-Saving style): ``items`` = {key: [count, error]} where count is
+    an over-estimate and count-error a guaranteed lower bound; ``floor`` bounds the count of any key that
+    is not listed (0 = the summary is exhaustive). Merging sums counts/errors, filling missing keys with
+    the other side's floor, so bounds stay valid across minutes and sources.
+    """
+
+    __slots__ = ("items", "floor")
+
+    def __init__(self, items: Optional[Dict[str, list]] = None, floor: int = 0):
+        self.items: Dict[str, list] = items or {}
+        self.floor = int(floor or 0)
+
+    def merge(self, other: "HeavyHitters") -> None:
+        fa, fb = self.floor, other.floor
+        out: Dict[str, list] = {}
+        for k, (c, e) in self.items.items():
+            oc = other.items.get(k)
+            if oc is None:
+                out[k] = [c + fb, e + fb]
+            else:
+                out[k] = [c + oc[0], e + oc[1]]
+        for k, (c, e) in other.items.items():
+            if k not in out:
+                out[k] = [c + fa, e + fa]
+        self.items = out
+        self.floor = fa + fb
+
+    def truncate(self, capacity: int) -> None:
+        if len(self.items) <= capacity:
+            return
+        ranked = sorted(self.items.items(), key=lambda x: -x[1][0])
+        dropped = ranked[capacity][1][0]
+        self.items = dict(ranked[:capacity])
+        self.floor = max(self.floor, dropped)
+
+    def top(self, n: int):
+        """[(key, count, error)]，按 count 降序。"""
+        return [(k, v[0], v[1]) for k, v in sorted(self.items.items(), key=lambda x: -x[1][0])[:n]]
+
+    def to_list(self, key_name: str, n: Optional[int] = None):
+        return [{key_name: k, "requests": c, "error": e} for k, c, e in self.top(n or len(self.items))]
+
+    @classmethod
+    def from_list(cls, rows, key_name: str, floor: int = 0) -> "HeavyHitters":
+        items: Dict[str, list] = {}
+        for row in rows or []:
+            if not isinstance(row, dict):
+                continue
+            k = row.get(key_name)
+            if k is None:
+                continue
+            try:
+                c = int(row.get("requests") or 0)
+                e = int(row.get("error") or 0)
+            except (TypeError, ValueError):
+                continue
+            prev = items.get(k)
+            items[k] = [c, e] if prev is None else [prev[0] + c, prev[1] + e]
+        return cls(items, floor)
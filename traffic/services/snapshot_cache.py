@@ -0,0 +1,176 @@
+"""
+In-process cache for ``traffic_snapshot`` responses.
+
+Key = (source, preset range + full_data) or (source, custom start/end rounded to a bucket). TTL follows the
+bucket size (half a bucket, clamped to TRAFFIC_SNAPSHOT_CACHE_MIN_TTL_SEC..MAX_TTL_SEC): a 1h view with 10s
+buckets is refreshed far more often than a 30d view with daily buckets. Concurrent identical requests
+coalesce onto one computation (single-flight). After the TTL an entry stays servable for another TTL
+(stale-while-revalidate): the first request after expiry gets the stale payload and starts one background
+refresh. Enable with TRAFFIC_SNAPSHOT_CACHE_ENABLED=1; ``cache_stats()`` reports hits / misses.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def snapshot_cache_enabled() -> bool:
+    return os.environ.get("TRAFFIC_SNAPSHOT_CACHE_ENABLED", "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def _max_entries() -> int:
+    return max(8, _env_int("TRAFFIC_SNAPSHOT_CACHE_MAX_ENTRIES", 256))
+
+
+def ttl_for_bucket(bucket_sec: int) -> float:
+    lo = max(1, _env_int("TRAFFIC_SNAPSHOT_CACHE_MIN_TTL_SEC", 5))
+    hi = max(lo, _env_int("TRAFFIC_SNAPSHOT_CACHE_MAX_TTL_SEC", 300))
+    return float(min(hi, max(lo, bucket_sec // 2)))
+
+
+def custom_bucket_seconds(span_sec: float) -> int:
+    """自定义区间的取整粒度：区间越长越粗（与分钟聚合对齐，最小 60s）。"""
+    if span_sec <= 86400:
+        return 60
+    if span_sec <= 7 * 86400:
+        return 300
+    return 3600
+
+
+def round_custom_bounds(start: datetime, end: datetime) -> Tuple[datetime, datetime, int]:
+    """start 向下、end 向上取整到粒度，使相近的请求落到同一个 key（并按取整后的区间计算）。"""
+    bucket = custom_bucket_seconds((end - start).total_seconds())
+    s = int(start.timestamp()) // bucket * bucket
+    e = -(-int(end.timestamp()) // bucket) * bucket
+    return (
+        datetime.fromtimestamp(s, tz=timezone.utc),
+        datetime.fromtimestamp(max(e, s + bucket), tz=timezone.utc),
+        bucket,
+    )
+
+
+class _Entry:
+    __slots__ = ("value", "fresh_until", "stale_until")
+
+    def __init__(self, value: Any, ttl: float):
+        now = time.monotonic()
+        self.value = value
+        self.fresh_until = now + ttl
+        self.stale_until = now + 2 * ttl
+
+
+class _Flight:
+    __slots__ = ("event", "value", "ok", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value: Any = None
+        self.ok = False
+        self.error: Optional[BaseException] = None
+
+
+_entries: "OrderedDict[tuple, _Entry]" = OrderedDict()
+_flights: Dict[tuple, _Flight] = {}
+_lock = threading.Lock()
+_stats = {"hits": 0, "stale_hits": 0, "misses": 0, "coalesced": 0, "refreshes": 0, "errors": 0}
+
+
+def _store(key: tuple, value: Any, ttl: float) -> None:
+    with _lock:
+        _entries[key] = _Entry(value, ttl)
+        _entries.move_to_end(key)
+        limit = _max_entries()
+        while len(_entries) > limit:
+            _entries.popitem(last=False)
+
+
+def _run(key: tuple, flight: _Flight, compute: Callable[[], Any], ttl: float) -> None:
+    try:
+        flight.value = compute()
+        flight.ok = True
+        _store(key, flight.value, ttl)
+    except Exception as e:
+        flight.error = e
+        with _lock:
+            _stats["errors"] += 1
+        logger.warning("snapshot cache compute %s failed: %s", key, e)
+    finally:
+        with _lock:
+            _flights.pop(key, None)
+        flight.event.set()
+
+
+def _refresh_in_background(key: tuple, flight: _Flight, compute: Callable[[], Any], ttl: float) -> None:
+    def runner():
+        try:
+            _run(key, flight, compute, ttl)
+        finally:
+            close_old_connections()
+
+    threading.Thread(target=runner, name="traffic-snapshot-refresh", daemon=True).start()
+
+
+def get_or_compute(key: tuple, ttl: float, compute: Callable[[], Any], wait_timeout: float = 60.0) -> Tuple[Any, str]:
+    """
+    返回 (payload, 状态)；状态为 hit / stale / coalesced / miss。
+    缓存的 payload 会被多个请求共享，调用方不要再修改它。
+    """
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and now < entry.fresh_until:
+            _entries.move_to_end(key)
+            _stats["hits"] += 1
+            return entry.value, "hit"
+        if entry is not None and now < entry.stale_until:
+            _stats["stale_hits"] += 1
+            if key not in _flights:
+                flight = _flights[key] = _Flight()
+                _stats["refreshes"] += 1
+                _refresh_in_background(key, flight, compute, ttl)
+            return entry.value, "stale"
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+            _stats["misses"] += 1
+        else:
+            _stats["coalesced"] += 1
+    if leader:
+        _run(key, flight, compute, ttl)
+        if not flight.ok:
+            raise flight.error
+        return flight.value, "miss"
+    if flight.event.wait(wait_timeout) and flight.ok:
+        return flight.value, "coalesced"
+    # 合并的计算失败或等待超时：自己算一次（异常照常抛给调用方）
+    return compute(), "miss"
+
+
+def cache_stats() -> Dict[str, Any]:
+    with _lock:
+        out: Dict[str, Any] = dict(_stats)
+        out["entries"] = len(_entries)
+        out["inflight"] = len(_flights)
+    served = out["hits"] + out["stale_hits"] + out["coalesced"]
+    total = served + out["misses"]
+    out["enabled"] = snapshot_cache_enabled()
+    out["max_entries"] = _max_entries()
+    out["hit_ratio"] = round(served / total, 4) if total else 0.0
+    return out
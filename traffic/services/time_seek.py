@@ -0,0 +1,161 @@
+"""
+Time-seeking access-log reader: mmap the file and binary-search byte offsets by the timestamp of the line
+at each probe, then read exactly the bytes covering [start, end].
+
+Nginx appends lines in (roughly) time order; a slack (TRAFFIC_TIME_SEEK_SLACK_SEC, default 60s) widens
+the search so slightly out-of-order lines are kept — callers filter to the exact window anyway. Probes skip
+lines whose time cannot be parsed. When the covering range exceeds TRAFFIC_TIME_SEEK_MAX_BYTES, the newest
+bytes are kept. Enable for file sources with TRAFFIC_FILE_TIME_SEEK_ENABLED=1.
+"""
+from __future__ import annotations
+
+import logging
+import mmap
+import os
+from typing import Callable, List, Optional, Tuple
+
+from .nginx_log import _line_parser
+
+logger = logging.getLogger(__name__)
+
+# 剩余区间小于此值时改为逐行扫描
+_SCAN_BYTES = 64 * 1024
+# 探测点之后最多尝试解析的行数
+_PROBE_LINES = 16
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def time_seek_enabled() -> bool:
+    return os.environ.get("TRAFFIC_FILE_TIME_SEEK_ENABLED", "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def _max_bytes() -> int:
+    return max(1 << 20, _env_int("TRAFFIC_TIME_SEEK_MAX_BYTES", 256 * 1024 * 1024))
+
+
+def _slack_sec() -> int:
+    return max(0, _env_int("TRAFFIC_TIME_SEEK_SLACK_SEC", 60))
+
+
+class _Probe:
+    def __init__(self, mm: mmap.mmap, ts_of: Callable[[str], Optional[float]]):
+        self.mm = mm
+        self.size = len(mm)
+        self.ts_of = ts_of
+
+    def line_start_after(self, off: int) -> int:
+        """off 处或之后的第一个行首（off 本身是行首时返回 off）。"""
+        if off <= 0:
+            return 0
+        if self.mm[off - 1:off] == b"\n":
+            return off
+        j = self.mm.find(b"\n", off)
+        return self.size if j < 0 else j + 1
+
+    def next_line(self, start: int) -> Tuple[bytes, int]:
+        j = self.mm.find(b"\n", start)
+        end = self.size if j < 0 else j + 1
+        return self.mm[start:end], end
+
+    def ts_at(self, off: int) -> Tuple[Optional[float], int]:
+        """off 之后第一条能解析出时间的行：(ts, 该行行首)；找不到为 (None, size)。"""
+        pos = self.line_start_after(off)
+        for _ in range(_PROBE_LINES):
+            if pos >= self.size:
+                break
+            raw, nxt = self.next_line(pos)
+            ts = self.ts_of(raw.decode("utf-8", errors="replace"))
+            if ts is not None:
+                return ts, pos
+            pos = nxt
+        return None, self.size
+
+    def first_at_or_after(self, target: float) -> int:
+        """第一条 ts >= target 的行首偏移（时间单调时）；全部更早返回 size。"""
+        lo, hi = 0, self.size
+        while hi - lo > _SCAN_BYTES:
+            mid = (lo + hi) // 2
+            ts, pos = self.ts_at(mid)
+            if ts is None or ts >= target:
+                hi = mid
+            else:
+                lo = pos
+        pos = self.line_start_after(lo)
+        while pos < self.size:
+            raw, nxt = self.next_line(pos)
+            ts = self.ts_of(raw.decode("utf-8", errors="replace"))
+            if ts is not None and ts >= target:
+                return pos
+            pos = nxt
+        return self.size
+
+
+def _ts_parser(log_format: str, nginx_format: str) -> Callable[[str], Optional[float]]:
+    parse = _line_parser(log_format, nginx_format)
+
+    def ts_of(line: str) -> Optional[float]:
+        line = line.strip()
+        if not line:
+            return None
+        rec = parse(line)
+        return rec["ts"] if rec else None
+
+    return ts_of
+
+
+def byte_range_for_window(
+    path: str, start_ts: float, end_ts: float, log_format: str, nginx_format: str = ""
+) -> Optional[Tuple[int, int]]:
+    """[start_ts, end_ts]（含 slack）对应的 [lo, hi) 字节区间；文件不可读返回 None。"""
+    try:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return 0, 0
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                probe = _Probe(mm, _ts_parser(log_format, nginx_format))
+                slack = _slack_sec()
+                lo = probe.first_at_or_after(start_ts - slack)
+                hi = probe.first_at_or_after(end_ts + slack) if lo < probe.size else lo
+                return lo, hi
+    except (OSError, ValueError) as e:
+        logger.warning("time_seek %s: %s", path, e)
+        return None
+
+
+def read_time_range(
+    path: str,
+    start_ts: float,
+    end_ts: float,
+    log_format: str,
+    nginx_format: str = "",
+    max_bytes: Optional[int] = None,
+) -> Optional[List[str]]:
+    """窗口内（含 slack）的完整行；超过 max_bytes 时保留最新部分。文件不可读返回 None。"""
+    rng = byte_range_for_window(path, start_ts, end_ts, log_format, nginx_format)
+    if rng is None:
+        return None
+    lo, hi = rng
+    if hi <= lo:
+        return []
+    cap = max_bytes or _max_bytes()
+    cut = hi - lo > cap
+    if cut:
+        lo = hi - cap
+    try:
+        with open(path, "rb") as f:
+            f.seek(lo)
+            data = f.read(hi - lo)
+    except OSError as e:
+        logger.warning("time_seek read %s: %s", path, e)
+        return None
+    text = data.decode("utf-8", errors="replace")
+    if cut:
+        # 从行中间开始：丢弃半行
+        text = text.split("\n", 1)[-1]
+    return [ln for ln in text.splitlines() if ln.strip()]
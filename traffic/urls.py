@@ -5,6 +5,7 @@ from . import views
 urlpatterns = [
     path("traffic/sources", views.traffic_sources, name="traffic_sources"),
     path("traffic/snapshot", views.traffic_snapshot, name="traffic_snapshot"),
+    path("traffic/snapshot/cache/stats", views.traffic_snapshot_cache_stats, name="traffic_snapshot_cache_stats"),
     path("traffic/overview", views.traffic_overview, name="traffic_overview"),
     path("traffic/timeseries", views.traffic_timeseries, name="traffic_timeseries"),
     path("traffic/geo", views.traffic_geo, name="traffic_geo"),
@@ -17,4 +18,5 @@ urlpatterns = [
     ),
     path("traffic/config", views.traffic_dashboard_config, name="traffic_dashboard_config"),
     path("traffic/ingest", views.traffic_ingest, name="traffic_ingest"),
+    path("traffic/ingest/stats", views.traffic_ingest_stats, name="traffic_ingest_stats"),
 ]
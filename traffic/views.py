@@ -11,25 +11,39 @@ from rest_framework.response import Response
 from inspection.models import InspectionConfig
 
 from .models import TrafficDashboardConfig
-from .services.aggregator import (
-    aggregate_timeseries,
-    geo_aggregate,
-    overview_kpis,
-    top_lists,
-    window_bounds,
-)
+from .services.aggregator import bucket_seconds, window_bounds
 from .services.blackbox import fetch_blackbox_summary
-from .services.geoip_lookup import enrich_records
+from .services.columnar import (
+    RecordBatch,
+    batch_geo,
+    batch_overview,
+    batch_timeseries,
+    batch_top,
+    snapshot_panels,
+)
+from .services.ingest_stream import (
+    enqueue_batch,
+    ingest_async_enabled,
+    ingest_lines,
+    stream_stats,
+)
+from .services.live_aggregator import live_view
 from .services.log_sources import (
-    load_raw_records,
+    load_raw_batch,
     log_source_configured,
-    redis_key_for_ingest,
+    redis_cap as _redis_cap,
     sources_for_api,
 )
-from .services.nginx_log import records_from_lines
-from .services.redis_log_buffer import is_configured as redis_buffer_configured, push_raw_lines
-from .services.rollup_buffer import rollup_enabled, rollup_ingest_append
+from .services.redis_log_buffer import is_configured as redis_buffer_configured
+from .services.rollup_buffer import rollup_enabled
 from .services.rollup_query import build_rollups_snapshot
+from .services.snapshot_cache import (
+    cache_stats,
+    get_or_compute,
+    round_custom_bounds,
+    snapshot_cache_enabled,
+    ttl_for_bucket,
+)
 
 
 def _access_log_mode(cfg: TrafficDashboardConfig) -> str:
@@ -37,14 +51,6 @@ def _access_log_mode(cfg: TrafficDashboardConfig) -> str:
     return m if m in ("file", "redis") else "file"
 
 
-def _redis_cap(cfg: TrafficDashboardConfig) -> int:
-    try:
-        n = int(cfg.redis_max_lines or 200_000)
-    except (TypeError, ValueError):
-        n = 200_000
-    return max(1_000, min(n, 2_000_000))
-
-
 def _dashboard_fetch_limits(cfg: TrafficDashboardConfig) -> Tuple[int, int]:
     """UI 拉取上限：行数来自后台配置；文件尾部字节可选环境变量覆盖。"""
     try:
@@ -71,19 +77,38 @@ def _full_data_fetch_limits(cfg: TrafficDashboardConfig) -> Tuple[int, int]:
     return rl, tb
 
 
-def _load_enriched(source_id: str = "", *, full_data: bool = False):
+def _load_batch(source_id: str = "", *, full_data: bool = False, range_key: Optional[str] = None):
+    """
+    已 enrich 的列式批次（compact buffer 直接解码；否则解析行 + GeoIP）。
+    传入 range_key 时文件源可按时间定位读取整个窗口（TRAFFIC_FILE_TIME_SEEK_ENABLED）。
+    """
     cfg = TrafficDashboardConfig.load()
     if not cfg.enabled:
-        return cfg, []
+        return cfg, RecordBatch()
     if full_data:
         rl, tb = _full_data_fetch_limits(cfg)
     else:
         rl, tb = _dashboard_fetch_limits(cfg)
-    recs = load_raw_records(
-        cfg, source_id, redis_line_cap=rl, max_tail_bytes_override=tb
+    batch = load_raw_batch(
+        cfg,
+        source_id,
+        redis_line_cap=rl,
+        max_tail_bytes_override=tb,
+        time_window=window_bounds(range_key) if range_key else None,
     )
-    enrich_records(recs, cfg.geoip_db_path)
-    return cfg, recs
+    return cfg, batch
+
+
+def _live_view(cfg: TrafficDashboardConfig, source_id: str, *, full_data: bool = False):
+    """TRAFFIC_LIVE_AGG_ENABLED 时返回常驻增量聚合视图（首次按同样的拉取上限从尾部启动）；否则 None。"""
+    if full_data:
+        rl, tb = _full_data_fetch_limits(cfg)
+    else:
+        rl, tb = _dashboard_fetch_limits(cfg)
+    try:
+        return live_view(cfg, source_id, bootstrap_lines=rl, bootstrap_bytes=tb)
+    except Exception:
+        return None
 
 
 def _rollup_snapshot_has_rows(data: dict) -> bool:
@@ -101,15 +126,21 @@ def _attach_traffic_rollup_meta(overview: dict) -> None:
 
 def _snapshot_payload_from_raw_records(
     cfg: TrafficDashboardConfig,
-    recs: list,
+    batch: Optional[RecordBatch],
     range_key: str,
     inspection,
     *,
     full_data: bool,
     rollup_fallback: bool = False,
+    live=None,
 ) -> dict:
-    """从已加载的原始记录构建与 traffic_snapshot 一致的结构。"""
-    ov = overview_kpis(recs, range_key)
+    """从已加载的原始记录批次（或常驻增量聚合视图 live）构建与 traffic_snapshot 一致的结构。"""
+    panels = None
+    if live is not None:
+        ov = live.overview(range_key)
+    else:
+        panels = snapshot_panels(batch, range_key)
+        ov = panels["overview"]
     bb = fetch_blackbox_summary(cfg, inspection)
     ov["blackbox"] = bb
     if bb.get("availability_pct") is not None:
@@ -121,15 +152,17 @@ def _snapshot_payload_from_raw_records(
     if rollup_fallback:
         ov["rollup_fallback"] = True
     _attach_traffic_rollup_meta(ov)
-    return {
-        "overview": ov,
-        "timeseries": aggregate_timeseries(recs, range_key),
-        "geo": geo_aggregate(recs, range_key, "country", ""),
-        "top_paths": top_lists(recs, range_key, "paths", 10),
-        "top_slow": top_lists(recs, range_key, "slow", 10),
-        "top_status": top_lists(recs, range_key, "status", 20),
-        "top_ip": top_lists(recs, range_key, "ip", 10),
-    }
+    if live is not None:
+        return {
+            "overview": ov,
+            "timeseries": live.timeseries(range_key),
+            "geo": live.geo(range_key, "country", ""),
+            "top_paths": live.top(range_key, "paths", 10),
+            "top_slow": live.top(range_key, "slow", 10),
+            "top_status": live.top(range_key, "status", 20),
+            "top_ip": live.top(range_key, "ip", 10),
+        }
+    return panels
 
 
 def _parse_full_data(request) -> bool:
@@ -181,9 +214,14 @@ def _parse_custom_time_bounds(request) -> Tuple[Optional[datetime], Optional[dat
 @permission_classes([IsAuthenticated])
 def traffic_overview(request):
     range_key = request.GET.get("range", "24h")
-    cfg, recs = _load_enriched(_query_source(request), full_data=_parse_full_data(request))
+    cfg = TrafficDashboardConfig.load()
+    live = _live_view(cfg, _query_source(request), full_data=_parse_full_data(request))
+    if live is not None:
+        data = live.overview(range_key)
+    else:
+        cfg, batch = _load_batch(_query_source(request), full_data=_parse_full_data(request), range_key=range_key)
+        data = batch_overview(batch, range_key)
     inspection = InspectionConfig.load()
-    data = overview_kpis(recs, range_key)
     bb = fetch_blackbox_summary(cfg, inspection)
     data["blackbox"] = bb
     if bb.get("availability_pct") is not None:
@@ -197,8 +235,11 @@ def traffic_overview(request):
 @permission_classes([IsAuthenticated])
 def traffic_timeseries(request):
     range_key = request.GET.get("range", "24h")
-    _, recs = _load_enriched(_query_source(request), full_data=_parse_full_data(request))
-    return Response(aggregate_timeseries(recs, range_key))
+    live = _live_view(TrafficDashboardConfig.load(), _query_source(request), full_data=_parse_full_data(request))
+    if live is not None:
+        return Response(live.timeseries(range_key))
+    _, batch = _load_batch(_query_source(request), full_data=_parse_full_data(request), range_key=range_key)
+    return Response(batch_timeseries(batch, range_key))
 
 
 @api_view(["GET"])
@@ -207,8 +248,11 @@ def traffic_geo(request):
     range_key = request.GET.get("range", "24h")
     granularity = request.GET.get("granularity", "country")
     country = request.GET.get("country", "")
-    _, recs = _load_enriched(_query_source(request), full_data=_parse_full_data(request))
-    return Response(geo_aggregate(recs, range_key, granularity, country))
+    live = _live_view(TrafficDashboardConfig.load(), _query_source(request), full_data=_parse_full_data(request))
+    if live is not None:
+        return Response(live.geo(range_key, granularity, country))
+    _, batch = _load_batch(_query_source(request), full_data=_parse_full_data(request), range_key=range_key)
+    return Response(batch_geo(batch, range_key, granularity, country))
 
 
 @api_view(["GET"])
@@ -217,19 +261,21 @@ def traffic_top(request):
     range_key = request.GET.get("range", "24h")
     top_type = request.GET.get("type", "paths")
     limit = int(request.GET.get("limit", "10"))
-    _, recs = _load_enriched(_query_source(request), full_data=_parse_full_data(request))
-    return Response(top_lists(recs, range_key, top_type, limit))
+    live = _live_view(TrafficDashboardConfig.load(), _query_source(request), full_data=_parse_full_data(request))
+    if live is not None:
+        return Response(live.top(range_key, top_type, limit))
+    _, batch = _load_batch(_query_source(request), full_data=_parse_full_data(request), range_key=range_key)
+    return Response(batch_top(batch, range_key, top_type, limit))
 
 
-@api_view(["GET"])
-@permission_classes([IsAuthenticated])
-def traffic_snapshot(request):
-    """
-    一次返回大盘所需数据，只解析 / GeoIP 一遍，避免 7 路并行把 Redis 与 CPU 打满导致 503/超时。
-    可选 ?start=&end= ISO8601：从持久化分钟聚合表读取任意区间（需开启 TRAFFIC_ROLLUP_ENABLED 并完成 ingest + traffic_rollup_flush）。
-    """
-    source = _query_source(request)
-    start, end = _parse_custom_time_bounds(request)
+def _build_snapshot(
+    source: str,
+    range_key: str,
+    full_data: bool,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> dict:
+    """traffic_snapshot 的 payload；start/end 都给出时读自定义区间的分钟聚合。"""
     if start is not None and end is not None:
         cfg = TrafficDashboardConfig.load()
         inspection = InspectionConfig.load()
@@ -250,10 +296,8 @@ def traffic_snapshot(request):
                     "请在写入 rollup 缓冲的 ingest 进程同样开启，并执行 traffic_rollup_flush。"
                 )
         _attach_traffic_rollup_meta(data["overview"])
-        return Response(data)
+        return data
 
-    range_key = request.GET.get("range", "24h")
-    full_data = _parse_full_data(request)
     cfg = TrafficDashboardConfig.load()
     inspection = InspectionConfig.load()
 
@@ -265,23 +309,57 @@ def traffic_snapshot(request):
         )
         data.setdefault("overview", {})
         if not _rollup_snapshot_has_rows(data):
-            _, recs = _load_enriched(source, full_data=False)
-            return Response(
-                _snapshot_payload_from_raw_records(
-                    cfg, recs, range_key, inspection, full_data=False, rollup_fallback=True
-                )
+            live = _live_view(cfg, source, full_data=False)
+            batch = None if live is not None else _load_batch(source, full_data=False, range_key=range_key)[1]
+            return _snapshot_payload_from_raw_records(
+                cfg, batch, range_key, inspection, full_data=False, rollup_fallback=True, live=live
             )
         data["overview"]["full_data"] = False
         data["overview"]["minute_rollup"] = True
         _attach_traffic_rollup_meta(data["overview"])
-        return Response(data)
+        return data
 
-    cfg, recs = _load_enriched(source, full_data=True)
-    return Response(
-        _snapshot_payload_from_raw_records(
-            cfg, recs, range_key, inspection, full_data=True, rollup_fallback=False
-        )
+    live = _live_view(cfg, source, full_data=True)
+    batch = None if live is not None else _load_batch(source, full_data=True, range_key=range_key)[1]
+    return _snapshot_payload_from_raw_records(
+        cfg, batch, range_key, inspection, full_data=True, rollup_fallback=False, live=live
+    )
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def traffic_snapshot(request):
+    """
+    一次返回大盘所需数据，只解析 / GeoIP 一遍，避免 7 路并行把 Redis 与 CPU 打满导致 503/超时。
+    可选 ?start=&end= ISO8601：从持久化分钟聚合表读取任意区间（需开启 TRAFFIC_ROLLUP_ENABLED 并完成 ingest + traffic_rollup_flush）。
+    TRAFFIC_SNAPSHOT_CACHE_ENABLED=1 时相同请求共享缓存结果（响应头 X-Traffic-Cache）。
+    """
+    source = _query_source(request)
+    start, end = _parse_custom_time_bounds(request)
+    range_key = request.GET.get("range", "24h")
+    full_data = _parse_full_data(request)
+    if not snapshot_cache_enabled():
+        return Response(_build_snapshot(source, range_key, full_data, start, end))
+    if start is not None and end is not None:
+        start, end, bucket = round_custom_bounds(start, end)
+        key = (source, "custom", int(start.timestamp()), int(end.timestamp()))
+    else:
+        start = end = None
+        bucket = bucket_seconds(range_key)
+        key = (source, range_key, full_data)
+    data, state = get_or_compute(
+        key, ttl_for_bucket(bucket), lambda: _build_snapshot(source, range_key, full_data, start, end)
     )
+    resp = Response(data)
+    resp["X-Traffic-Cache"] = state
+    return resp
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def traffic_snapshot_cache_stats(request):
+    """大盘 snapshot 响应缓存：命中 / 过期命中 / 合并 / 未命中次数与命中率。"""
+    return Response(cache_stats())
 
 
 @api_view(["GET"])
@@ -348,6 +426,7 @@ def traffic_dashboard_config(request):
                 "access_log_path": cfg.access_log_path,
                 "error_log_path": cfg.error_log_path,
                 "log_format": cfg.log_format,
+                "nginx_log_format": cfg.nginx_log_format,
                 "max_tail_bytes": cfg.max_tail_bytes,
                 "redis_log_key": cfg.redis_log_key or "traffic:access:lines",
                 "redis_max_lines": cfg.redis_max_lines,
@@ -368,6 +447,7 @@ def traffic_dashboard_config(request):
     cfg.access_log_path = data.get("access_log_path", cfg.access_log_path) or ""
     cfg.error_log_path = data.get("error_log_path", cfg.error_log_path) or ""
     cfg.log_format = data.get("log_format", cfg.log_format) or "json"
+    cfg.nginx_log_format = (data.get("nginx_log_format", cfg.nginx_log_format) or "").strip()
     cfg.max_tail_bytes = int(data.get("max_tail_bytes", cfg.max_tail_bytes))
     cfg.redis_log_key = (data.get("redis_log_key", cfg.redis_log_key) or "traffic:access:lines").strip()[
         :256
@@ -445,18 +525,22 @@ def traffic_ingest(request):
     if not redis_buffer_configured():
         return Response({"error": "TRAFFIC_REDIS_URL not configured"}, status=503)
 
-    cfg = TrafficDashboardConfig.load()
     ingest_source = (
         (request.GET.get("source") or "").strip()
         or (request.headers.get("X-Traffic-Source") or "").strip()
     )
-    key = redis_key_for_ingest(cfg, ingest_source)
-    n = push_raw_lines(lines, key, _redis_cap(cfg))
-    if rollup_enabled() and n > 0:
-        try:
-            recs = records_from_lines(lines, cfg.log_format)
-            enrich_records(recs, cfg.geoip_db_path)
-            rollup_ingest_append(recs, ingest_source or "")
-        except Exception:
-            pass
+    if ingest_async_enabled():
+        entry_id = enqueue_batch(lines, ingest_source)
+        if entry_id:
+            return Response({"accepted": len(lines), "truncated": truncated, "queued": entry_id}, status=202)
+    # 同步处理（或异步入队失败时回退）
+    cfg = TrafficDashboardConfig.load()
+    n = ingest_lines(cfg, lines, ingest_source)
     return Response({"accepted": n, "truncated": truncated})
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def traffic_ingest_stats(request):
+    """异步 ingest 队列：stream 长度、consumer group 积压 / 滞后、最旧未投递批次的等待时间。"""
+    return Response(stream_stats())